@@ -1,52 +1,218 @@
+import argparse
+import os
+import sys
+from functools import partial
 from sys import exit
 from time import sleep
+from typing import Optional
 from src.interfaces.logger import ILogger
 from src.interfaces.repository import IDataAccessRepository
-from src.interfaces.web_scrapper import IWebScrapper
-from src.accessdata.jsonl_repository import JsonlRepository
-from src.accessdata.sql_repository import SqlRepository
-from src.accessdata.xlsx_repository import ExcelRepository
+from src.interfaces.web_scrapper import IStagedWebScrapper, IWebScrapper
+from src.accessdata.repository_registry import repositories, uri_path
 from src.business_logic.app_settings import AppSettings
-from src.business_logic.ikea_scrapper import IkeaScrapper
-from src.services.log_service import Logger
+from src.services.checkpoint import Checkpointer, JsonCheckpointStore
+from src.services.converter import convert
+from src.services.crawl_scheduler import CrawlScheduler, namespaced_path
+from src.services.fingerprint_store import FingerprintStore
+from src.services.http_cache import HttpCache
+from src.services.log_service import Logger, shared_log_writer
+from src.services.page_archive import PageArchive
+from src.services.metrics import MetricsReporter, metrics
+from src.services.parse_pool import ParsePool
+from src.services.pipeline import PipelineRunner
+from src.services.rate_limiter import AdaptiveRateLimiter, SharedAdaptiveRateLimiter, SharedTokenBucket, \
+    TokenBucket
 
 
 def main():
     settings = AppSettings("config.json")
     scrapper: IWebScrapper
-    logger: ILogger = Logger("main_app", settings.log_level)
-    repository: IDataAccessRepository
-    ext = settings.db_path.split(".")[-1].lower()
-    if ext == "jsonl":
-        repository = JsonlRepository(settings.db_path, Logger("JsonlRepository", settings.log_level))
-    elif ext == "xlsx":
-        repository = ExcelRepository(settings.db_path, Logger("ExcelRepository", settings.log_level))
-    elif ext == "db":
-        repository = SqlRepository(settings.db_path, Logger("SqlRepository", settings.log_level))
+    logger: ILogger = create_logger(settings, "main_app")
+    repository: IDataAccessRepository = create_repository(settings, settings.db_path, logger)
+
+    urls = settings.scrape_urls
+    if len(urls) > 1:
+        # The workers keep the progress of their categories, this one only tells them which items are stored
+        checkpointer = Checkpointer(JsonCheckpointStore(scrapper_state_file(settings)))
+        scrapper = CrawlScheduler(urls, partial(create_scrapper, settings), create_logger(settings, "CrawlScheduler"),
+                                  processes=settings.scrape_processes,
+                                  state_file=scrapper_state_file(settings),
+                                  # One budget for all worker processes
+                                  rate_limiter=create_rate_limiter(settings, shared=True),
+                                  queue_size=settings.queue_size,
+                                  checkpointer=checkpointer,
+                                  checkpoint_every=settings.checkpoint_every,
+                                  checkpoint_interval=settings.checkpoint_interval)
     else:
-        msg = f"Unsupported database file: .{ext}"
-        logger.log_error(msg)
-        raise ValueError(msg)
-
-    scrapper = IkeaScrapper(settings.scrape_url, Logger("IkeaScrapper", settings.log_level))
-
-    while not scrapper.is_completed:
-        try:
-            for i in scrapper.page_items():
-                if repository.get_first_or_default(i):
-                    repository.update(i, {"id": i["id"]})
-                else:
-                    repository.insert(i)
-            logger.log_info(f"The page {settings.scrape_url} successfully scrapped into {settings.db_path}")
-            scrapper.clear_state()
-        except KeyboardInterrupt:
-            logger.log_error(f"Interrupted by user!")
-            exit()
-        except Exception as e:
-            logger.log_error(f"Unexpected error: {e}")
-            logger.log_info(f"Waiting 10 seconds")
-            sleep(10)
+        url = urls[0] if urls else settings.scrape_url
+        if settings.db_store_progress and hasattr(repository, "checkpoint_store"):
+            # Progress is committed in the same transaction as the items it covers
+            checkpoint_store = repository.checkpoint_store(f"{'replay' if settings.replay else 'scrape'}:{url}")
+        else:
+            checkpoint_store = JsonCheckpointStore(scrapper_state_file(settings))
+        # With a work queue the queue keeps the progress, the checkpointer only acks the leases of stored items
+        checkpointer = Checkpointer(checkpoint_store,
+                                    every=settings.checkpoint_every,
+                                    interval=settings.checkpoint_interval)
+        scrapper = create_scrapper(settings, url, scrapper_state_file(settings), checkpointer=checkpointer)
+
+    reporter = MetricsReporter(metrics, settings.metrics_stats_path, settings.metrics_interval,
+                               settings.metrics_prometheus_port)
+    with repository, reporter:
+        pipeline = PipelineRunner(scrapper, repository, create_logger(settings, "PipelineRunner"),
+                                  queue_size=settings.queue_size,
+                                  batch_size=settings.db_batch_size,
+                                  checkpointer=checkpointer)
+        runs = 0
+        while not scrapper.is_completed:
+            try:
+                pipeline.run()
+                metrics.inc("scrape_runs_total", result="completed")
+                logger.log_info(f"The pages {', '.join(urls)} successfully scrapped into {settings.db_path}")
+                scrapper.clear_state()
+                runs += 1
+                if settings.scrape_runs and runs >= settings.scrape_runs:
+                    break
+            except KeyboardInterrupt:
+                logger.log_error(f"Interrupted by user!")
+                exit()
+            except Exception as e:
+                metrics.inc("scrape_runs_total", result="failed")
+                logger.log_error(f"Unexpected error: {e}")
+                logger.log_info(f"Waiting 10 seconds")
+                sleep(10)
+
+
+def convert_command(argv: list[str]):
+    parser = argparse.ArgumentParser(prog="app.py convert",
+                                     description="Copies all products from one database file into another.")
+    parser.add_argument("source", help="database to read, .jsonl, .db, .xlsx or a URI such as sqlite:///products.db")
+    parser.add_argument("target", help="database to write, created when missing")
+    parser.add_argument("--batch-size", type=int, default=1000, help="items held in memory at a time")
+    args = parser.parse_args(argv)
+    if os.path.abspath(uri_path(args.source)) == os.path.abspath(uri_path(args.target)):
+        parser.error("source and target are the same file")
+    if "://" not in args.source and not os.path.exists(args.source):
+        parser.error(f"{args.source} does not exist")
+
+    settings = AppSettings("config.json")
+    logger = create_logger(settings, "convert")
+    with create_repository(settings, args.source, logger) as source, \
+            create_repository(settings, args.target, logger) as target:
+        count = convert(source, target, logger, batch_size=args.batch_size)
+    print(f"{count} items copied from {args.source} to {args.target}")
+
+
+def create_repository(settings: AppSettings, db_path: str, logger: ILogger) -> IDataAccessRepository:
+    """
+    Opens the database ``db_path``, a file whose type is chosen by its extension or a URI
+    like ``sqlite:///products.db``. Only the modules of the chosen backend are imported.
+    """
+    try:
+        return repositories.create(db_path, partial(create_logger, settings), repository_options(settings))
+    except ValueError as e:
+        logger.log_error(str(e))
+        raise
+
+
+def repository_options(settings: AppSettings) -> dict[str, dict]:
+    """The ``DataBase`` settings of each storage backend, by backend name."""
+    return {
+        "jsonl": {"segment_size": settings.db_segment_size * 1024 * 1024,
+                  "compression": settings.db_compression or None},
+        "sql": {"measure_index": settings.db_measure_index},
+        "xlsx": {"flush_every": settings.db_flush_every,
+                 "flush_interval": settings.db_flush_interval},
+    }
+
+
+def create_logger(settings: AppSettings, module_name: str) -> Logger:
+    # Buffered loggers of a process share one background writer and one open log file
+    return Logger(module_name, settings.log_level, shared_log_writer() if settings.log_buffered else None)
+
+
+def scrapper_state_file(settings: AppSettings) -> str:
+    if settings.replay:
+        # Replay keeps its own resume state, so it never disturbs an interrupted live crawl
+        return os.path.join(settings.archive_path, "replay_state.json")
+    return ".\\src\\business_logic\\ikea_scraper_state.json"
+
+
+def create_rate_limiter(settings: AppSettings, shared: bool = False) -> TokenBucket:
+    """
+    The request budget: ``RequestsPerSecond``, or else one request per ``Interval``. With
+    ``Adaptive`` it starts there and moves towards what the site answers well. A ``shared``
+    limiter lives in shared memory, one budget and one rate for all worker processes.
+    """
+    interval_rate = 1 / settings.scrape_interval if settings.scrape_interval > 0 else 0
+    if settings.scrape_adaptive:
+        limiter_class = SharedAdaptiveRateLimiter if shared else AdaptiveRateLimiter
+        return limiter_class(settings.scrape_requests_per_second or interval_rate
+                             or settings.scrape_max_requests_per_second,
+                             max_rate=settings.scrape_max_requests_per_second,
+                             capacity=settings.scrape_workers,
+                             latency_target=settings.scrape_latency_target)
+    bucket_class = SharedTokenBucket if shared else TokenBucket
+    if settings.scrape_requests_per_second > 0:
+        return bucket_class(settings.scrape_requests_per_second, capacity=settings.scrape_workers)
+    # Requests spaced by the interval, without bursts
+    return bucket_class(interval_rate)
+
+
+def create_scrapper(settings: AppSettings, url: str, state_file: str,
+                    rate_limiter: Optional[TokenBucket] = None,
+                    checkpointer: Optional[Checkpointer] = None) -> IStagedWebScrapper:
+    """Builds the scrapper of one category; also runs inside the CrawlScheduler worker processes."""
+    # Imported here, so commands that do not scrape do not load requests and BeautifulSoup
+    from src.business_logic.ikea_scrapper import IkeaScrapper
+    from src.services.work_queue import SqliteWorkQueue
+
+    # Files written while scraping are kept per category when several categories run at once
+    per_category = namespaced_path if len(settings.scrape_urls) > 1 else lambda path, _: path
+    if rate_limiter is None:
+        rate_limiter = create_rate_limiter(settings)
+
+    http_cache = HttpCache(per_category(settings.http_cache_path, url)) if settings.http_cache_path else None
+    archive = PageArchive(settings.archive_path) if settings.archive_path else None
+    parse_pool = None
+    if settings.parse_processes > 0:
+        # Lives as long as the process; workers also preload the parsing code itself
+        parse_pool = ParsePool(settings.parse_processes,
+                               preload=("bs4", "soupsieve", "lxml", "src.business_logic.ikea_scrapper"))
+    fingerprints = None
+    if settings.incremental:
+        fingerprints = FingerprintStore(per_category(settings.db_path + ".fingerprints.json", url))
+    work_queue = None
+    if settings.work_queue_path:
+        work_queue = SqliteWorkQueue(per_category(settings.work_queue_path, url),
+                                     create_logger(settings, "SqliteWorkQueue"),
+                                     lease_seconds=settings.lease_seconds,
+                                     max_attempts=settings.max_attempts,
+                                     journal_mode=settings.work_queue_journal_mode)
+
+    return IkeaScrapper(url, create_logger(settings, "IkeaScrapper"),
+                        time_delay=settings.scrape_interval,
+                        max_workers=settings.scrape_workers,
+                        rate_limiter=rate_limiter,
+                        http_cache=http_cache,
+                        pool_size=settings.scrape_pool_size,
+                        archive=archive,
+                        replay=settings.replay,
+                        parser=settings.scrape_parser or None,
+                        fingerprints=fingerprints,
+                        full_refresh_every=settings.full_refresh_every,
+                        parse_pool=parse_pool,
+                        checkpointer=checkpointer,
+                        timeout=settings.scrape_timeout,
+                        max_retries=settings.scrape_max_retries,
+                        max_retry_after=settings.scrape_max_retry_after,
+                        prefetch_pages=settings.scrape_prefetch_pages,
+                        work_queue=work_queue,
+                        state_file=state_file)
 
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["convert"]:
+        convert_command(sys.argv[2:])
+    else:
+        main()
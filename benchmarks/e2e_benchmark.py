@@ -0,0 +1,185 @@
+"""
+End-to-end scrape throughput without the network: the full ``app.main`` flow runs
+against a local synthetic IKEA category (see synthetic_site.py) once per storage
+backend, each in a fresh process and working directory.
+
+Reports items per second, p50/p99 request latency, the peak RSS and the time the
+process spent importing modules (``-X importtime``) of every run,
+appends them to a history file and compares them with the previous run of the same
+workload, so regressions show up as negative changes.
+
+Run from the repository root:
+
+    python -m benchmarks.e2e_benchmark --pages 10 --latency-ms 20 --error-rate 0.01
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Iterable, Optional
+
+from benchmarks.synthetic_site import SyntheticSite
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+HISTORY_FILE = os.path.join(ROOT_DIR, "benchmarks", "results", "e2e_history.jsonl")
+BACKENDS = ("jsonl", "db", "xlsx")
+
+
+def _config(url: str, backend: str, args: argparse.Namespace) -> dict:
+    return {
+        "Logging": {"LogLevel": "ERROR"},
+        "DataBase": {"FilePath": f"products.{backend}"},
+        "Scrapping": {"Url": url, "Runs": 1, "Workers": args.workers,
+                      "RequestsPerSecond": args.requests_per_second, "PrefetchPages": args.prefetch_pages},
+        "Metrics": {"StatsPath": "metrics.json", "Interval": 3600},
+    }
+
+
+def run_backend(url: str, backend: str, args: argparse.Namespace) -> dict:
+    """Runs ``app.main`` in a new process against ``url``, storing into ``backend``."""
+    with tempfile.TemporaryDirectory(prefix=f"e2e-{backend}-") as work_dir:
+        with open(os.path.join(work_dir, "config.json"), "w", encoding="utf-8") as f:
+            json.dump(_config(url, backend, args), f)
+        env = {**os.environ, "PYTHONPATH": ROOT_DIR, "PYTHONPROFILEIMPORTTIME": "1"}
+        stderr_path = os.path.join(work_dir, "stderr.txt")
+        started = time.perf_counter()
+        with open(stderr_path, "w", encoding="utf-8") as stderr:
+            process = subprocess.Popen([sys.executable, "-c", "import app; app.main()"], cwd=work_dir, env=env,
+                                       stderr=stderr)
+            # app.main retries failed runs forever, so a stuck run is killed
+            watchdog = threading.Timer(args.timeout, process.kill)
+            watchdog.start()
+            try:
+                status, peak_rss = _wait(process)
+            finally:
+                watchdog.cancel()
+        seconds = time.perf_counter() - started
+        with open(stderr_path, encoding="utf-8") as f:
+            import_seconds = _import_seconds(f)
+        if status != 0:
+            raise RuntimeError(f"The {backend} run exited with status {status}")
+        with open(os.path.join(work_dir, "metrics.json"), encoding="utf-8") as f:
+            stats = json.load(f)
+
+    items = sum(v for k, v in stats["counters"].items() if k.startswith("items_stored_total"))
+    latency = stats["histograms"].get("http_request_seconds", {})
+    return {
+        "backend": backend,
+        "items": items,
+        "seconds": round(seconds, 3),
+        "items_per_second": round(items / seconds, 2) if seconds > 0 else 0.0,
+        "p50_ms": round(latency.get("p50", 0.0) * 1000, 2),
+        "p99_ms": round(latency.get("p99", 0.0) * 1000, 2),
+        "peak_rss_mb": round(peak_rss / 1024, 1) if peak_rss is not None else None,
+        "import_ms": round(import_seconds * 1000, 1),
+    }
+
+
+def _import_seconds(stderr: Iterable[str]) -> float:
+    """
+    Sums the ``-X importtime`` report of a process: the cumulative time of every top-level
+    import, including backends imported lazily later on. Other lines are passed through.
+    """
+    total_us = 0
+    for line in stderr:
+        if not line.startswith("import time:"):
+            sys.stderr.write(line)
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented below the module that imported them
+        if cumulative.strip().isdigit() and not name[1:].startswith(" "):
+            total_us += int(cumulative)
+    return total_us / 1_000_000
+
+
+def _wait(process: subprocess.Popen) -> tuple[int, Optional[int]]:
+    """Waits for ``process``, returns its exit status and peak RSS in KiB (None where unknown)."""
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return process.returncode, usage.ru_maxrss
+    return process.wait(), None
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _previous(history_file: str, workload: dict) -> dict[str, dict]:
+    """Results per backend of the last recorded run of the same workload."""
+    previous: dict[str, dict] = {}
+    if not os.path.exists(history_file):
+        return previous
+    with open(history_file, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get("workload") == workload:
+                previous = {result["backend"]: result for result in record["results"]}
+    return previous
+
+
+def _save(history_file: str, record: dict):
+    directory = os.path.dirname(history_file)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(history_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def _change(current: float, previous: Optional[dict], key: str) -> str:
+    if not previous or not previous.get(key):
+        return ""
+    return f"{(current - previous[key]) / previous[key] * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=5, help="listing pages of the category")
+    parser.add_argument("--per-page", type=int, default=24, help="products per listing page")
+    parser.add_argument("--latency-ms", type=float, default=10.0, help="average server latency per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--workers", type=int, default=4, help="Scrapping.Workers of the runs")
+    parser.add_argument("--requests-per-second", type=float, default=1000.0,
+                        help="Scrapping.RequestsPerSecond of the runs")
+    parser.add_argument("--prefetch-pages", type=int, default=1, help="Scrapping.PrefetchPages of the runs")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds before a run is killed")
+    parser.add_argument("--history", default=HISTORY_FILE, help="file the results are appended to")
+    args = parser.parse_args()
+
+    workload = {"pages": args.pages, "per_page": args.per_page, "latency_ms": args.latency_ms,
+                "error_rate": args.error_rate, "workers": args.workers,
+                "requests_per_second": args.requests_per_second, "prefetch_pages": args.prefetch_pages}
+    previous = _previous(args.history, workload)
+    results = []
+    print(f"{'backend':<8} {'items':>6} {'seconds':>8} {'items/s':>8} {'change':>8} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'peak MB':>8} {'import ms':>9}")
+    with SyntheticSite(args.pages, args.per_page, args.latency_ms / 1000, args.error_rate) as site:
+        for backend in args.backends:
+            result = run_backend(site.url, backend, args)
+            results.append(result)
+            rss = result["peak_rss_mb"] if result["peak_rss_mb"] is not None else "n/a"
+            print(f"{backend:<8} {result['items']:>6.0f} {result['seconds']:>8.2f} "
+                  f"{result['items_per_second']:>8.1f} "
+                  f"{_change(result['items_per_second'], previous.get(backend), 'items_per_second'):>8} "
+                  f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} {rss:>8} {result['import_ms']:>9.1f}")
+            if result["items"] < site.total_items:
+                print(f"  warning: {backend} stored {result['items']:.0f} of {site.total_items} items")
+        print(f"{site.requests} requests served, {site.errors} answered with 503")
+
+    _save(args.history, {"timestamp": dt.datetime.now().isoformat(timespec="seconds"), "commit": _git_commit(),
+                         "workload": workload, "results": results})
+    print(f"results appended to {os.path.relpath(args.history)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Generators of IKEA listing and detail pages, shared by the synthetic site and the tests."""
+BASE_URL = "https://www.ikea.lt"
+CATEGORY_PATH = "/lt/products/virtuve/virtuves-sistema-metod"
+
+
+def listing_url(page: int) -> str:
+    return f"{BASE_URL}{CATEGORY_PATH}?&product-room=product&page={page}&order=RECOMMENDED"
+
+
+def detail_path(item_id: str) -> str:
+    return f"/lt/products/virtuve/item-{item_id.replace('.', '')}"
+
+
+def item_id(page: int, index: int) -> str:
+    return f"{page:03d}.{index:03d}.00"
+
+
+def listing_page(page: int, per_page: int, total: int) -> str:
+    first = (page - 1) * per_page
+    cards = []
+    for index in range(first, min(first + per_page, total)):
+        cards.append(f"""
+            <div>
+              <div class="card-body">
+                <div class="itemInfo v2-b">
+                  <a href="{detail_path(item_id(page, index))}">METOD {index}</a>
+                  <h4>spintelė, balta, {index} cm</h4>
+                </div>
+              </div>
+              <div class="itemPrice-wrapper"><p class="itemNormalPrice"><span data-price="{index + 10}">{index + 10} €</span></p></div>
+            </div>""")
+    shown = min(first + per_page, total)
+    return f"""<html><body>
+        <div id="productFilterList"><div><div class="container p-0"><div><div>{''.join(cards)}
+        </div></div></div></div></div>
+        <span class="showing_current_max">Rodoma {shown} iš {total}</span>
+    </body></html>"""
+
+
+def detail_page(item_code: str) -> str:
+    return f"""<html><body>
+        <div id="modal-product-size">
+          <span class="item-code">{item_code}</span>
+          <table><tbody>
+            <tr><td>Plotis:</td><td>60,0 cm</td></tr>
+            <tr><td>Gylis:</td><td>37,0 cm</td></tr>
+          </tbody></table>
+        </div>
+    </body></html>"""
+
+
+def site(pages: int, per_page: int) -> dict[str, str]:
+    """Returns url -> html of a category with ``pages`` full listing pages."""
+    total = pages * per_page
+    result: dict[str, str] = {}
+    for page in range(1, pages + 1):
+        result[listing_url(page)] = listing_page(page, per_page, total)
+        first = (page - 1) * per_page
+        for index in range(first, first + per_page):
+            code = item_id(page, index)
+            result[BASE_URL + detail_path(code)] = detail_page(code)
+    return result
+
+
+def with_site_chrome(page: str, menu_items: int = 300) -> str:
+    """Surrounds the page body with the navigation, scripts and footer a real product page carries."""
+    menu = "".join(
+        f'<li class="nav-item"><a class="nav-link" href="/lt/products/category-{i}" data-id="{i}">'
+        f'<img src="/img/{i}.png" alt=""><span>Kategorija {i}</span></a></li>'
+        for i in range(menu_items)
+    )
+    script = "<script>window.dataLayer=[" + ",".join(f'{{"k{i}":"v{i}"}}' for i in range(menu_items)) + "];</script>"
+    footer = "".join(f'<div class="footer-col"><p>Informacija {i}</p><a href="/lt/info/{i}">Daugiau</a></div>'
+                     for i in range(menu_items // 3))
+    header = f'<header><nav><ul class="navbar-nav">{menu}</ul></nav></header>{script}'
+    return page.replace("<body>", f"<body>{header}", 1).replace("</body>", f"<footer>{footer}</footer></body>", 1)
@@ -0,0 +1,91 @@
+"""
+Parsing CPU per page over the saved fixture pages in tests/fixtures, for every
+installed BeautifulSoup backend, with full and with scoped parsing, and the
+detail page throughput of a ParsePool compared to parsing in one process.
+
+Run from the repository root:
+
+    python -m benchmarks.parse_benchmark
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
+
+from src.business_logic.ikea_scrapper import IkeaScrapper, _LISTING_SCOPE, _DETAIL_SCOPE, parse_detail_page, \
+    resolve_parser
+from src.services.parse_pool import ParsePool
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures")
+
+
+def _load(name: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
+
+
+def _listing(content: bytes, parser: str, scope: Optional[SoupStrainer]):
+    soup = BeautifulSoup(content, parser, parse_only=scope)
+    cards = [IkeaScrapper._get_card(tag) for tag in IkeaScrapper._get_card_tags(soup)]
+    return cards, IkeaScrapper._has_next_page(soup)
+
+
+def _detail(content: bytes, parser: str, scope: Optional[SoupStrainer]):
+    soup = BeautifulSoup(content, parser, parse_only=scope)
+    return IkeaScrapper._get_item_details(soup), IkeaScrapper._get_item_id(soup)
+
+
+def _measure(func: Callable[[], object], min_time: float = 1.0) -> float:
+    """Returns the average seconds per call, repeating the call for at least ``min_time`` seconds."""
+    func()  # Warm up
+    runs = 0
+    started = time.perf_counter()
+    while (elapsed := time.perf_counter() - started) < min_time:
+        func()
+        runs += 1
+    return elapsed / runs
+
+
+def main():
+    pages = {"listing": (_load("listing_page.html"), _listing, _LISTING_SCOPE),
+             "detail": (_load("detail_page.html"), _detail, _DETAIL_SCOPE)}
+    parsers = [p for p in ("html.parser", "lxml", "html5lib") if builder_registry.lookup(p)]
+
+    print(f"{'page':<8} {'parser':<12} {'full ms':>9} {'scoped ms':>10} {'speedup':>8}")
+    baseline: dict[str, float] = {}
+    for page, (content, parse, scope) in pages.items():
+        for parser in parsers:
+            full = _measure(lambda: parse(content, parser, None))
+            scoped = _measure(lambda: parse(content, parser, scope))
+            assert parse(content, parser, None) == parse(content, parser, scope)
+            baseline.setdefault(page, full)
+            print(f"{page:<8} {parser:<12} {full * 1000:>9.2f} {scoped * 1000:>10.2f} "
+                  f"{baseline[page] / scoped:>7.1f}x")
+    print("speedup is relative to full parsing with html.parser")
+    print()
+    _pool_throughput(pages["detail"][0])
+
+
+def _pool_throughput(content: bytes, count: int = 400):
+    """Detail pages per second when parsed by as many threads in one process or through a ParsePool."""
+    parser = resolve_parser()
+    processes = os.cpu_count() or 1
+    print(f"{'detail pages':<14} {'processes':>9} {'pages/s':>9}")
+    with ThreadPoolExecutor(processes) as threads:
+        started = time.perf_counter()
+        list(threads.map(lambda _: parse_detail_page(content, parser), range(count)))
+        print(f"{'threads':<14} {1:>9} {count / (time.perf_counter() - started):>9.0f}")
+
+        with ParsePool(processes) as pool:
+            # Starts the workers, so their startup is not measured
+            list(threads.map(lambda _: pool.run(parse_detail_page, content, parser), range(processes * 4)))
+            started = time.perf_counter()
+            list(threads.map(lambda _: pool.run(parse_detail_page, content, parser), range(count)))
+            print(f"{'ParsePool':<14} {processes:>9} {count / (time.perf_counter() - started):>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+A local HTTP server with a synthetic IKEA category: listing pages paginated by
+``span.showing_current_max`` and detail pages with a ``#modal-product-size`` table,
+built from the page generators in benchmarks/ikea_pages.py.
+"""
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Self
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.ikea_pages import CATEGORY_PATH, detail_page, item_id, listing_page, with_site_chrome
+
+_DETAIL_PREFIX = "/lt/products/virtuve/item-"
+
+
+class SyntheticSite:
+    def __init__(self, pages: int = 5, per_page: int = 24, latency: float = 0.0, error_rate: float = 0.0,
+                 site_chrome: bool = True, seed: int = 0):
+        """
+        Serves a category of ``pages`` full listing pages on ``http://127.0.0.1:<port>``.
+
+        Every response waits ``latency`` seconds on average (uniformly between half and
+        one and a half of it), and a share ``error_rate`` of the requests is answered
+        with 503. With ``site_chrome`` the pages carry the navigation and footer of a
+        real page, so they are as large to download and parse.
+        """
+        self.pages = pages
+        self.per_page = per_page
+        self.latency = latency
+        self.error_rate = error_rate
+        self.__site_chrome = site_chrome
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__server: Optional[ThreadingHTTPServer] = None
+        self.__cache: dict[str, bytes] = {}
+        self.requests = 0
+        self.errors = 0
+
+
+    @property
+    def total_items(self) -> int:
+        return self.pages * self.per_page
+
+
+    @property
+    def url(self) -> str:
+        """The category url to scrape."""
+        if self.__server is None:
+            raise RuntimeError("The site is not started")
+        return f"http://127.0.0.1:{self.__server.server_address[1]}{CATEGORY_PATH}"
+
+
+    def start(self) -> Self:
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__server.serve_forever, name="synthetic-site", daemon=True).start()
+        return self
+
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+    def page(self, path: str, query: str) -> Optional[bytes]:
+        """Returns the html of ``path``, or None when the site has no such page."""
+        if path == CATEGORY_PATH:
+            page = int(parse_qs(query).get("page", ["1"])[0])
+            key = f"listing:{page}"
+            render = lambda: listing_page(page, self.per_page, self.total_items)
+        elif path.startswith(_DETAIL_PREFIX):
+            code = path[len(_DETAIL_PREFIX):]
+            if not self._is_item(code):
+                return None
+            key = f"detail:{code}"
+            render = lambda: detail_page(code)
+        else:
+            return None
+        content = self.__cache.get(key)
+        if content is None:
+            html = render()
+            content = (with_site_chrome(html) if self.__site_chrome else html).encode("utf-8")
+            self.__cache[key] = content
+        return content
+
+
+    def _is_item(self, code: str) -> bool:
+        # Detail links are item ids without the dots, see benchmarks/ikea_pages.py
+        try:
+            page = int(code[:3])
+        except ValueError:
+            return False
+        first = (page - 1) * self.per_page
+        return 1 <= page <= self.pages and any(item_id(page, index).replace(".", "") == code
+                                               for index in range(first, first + self.per_page))
+
+
+    def _delay_and_fail(self) -> bool:
+        with self.__lock:
+            self.requests += 1
+            delay = self.latency * self.__random.uniform(0.5, 1.5) if self.latency > 0 else 0.0
+            failed = self.__random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+        return failed
+
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        site = self
+
+        class SiteHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+
+            def do_GET(self):
+                failed = site._delay_and_fail()
+                url = urlparse(self.path)
+                content = site.page(url.path, url.query)
+                if failed or content is None:
+                    self.send_response(503 if failed else 404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+
+            def log_message(self, format, *args):
+                pass  # One line per request would cost more than serving it
+
+        return SiteHandler
@@ -1,84 +1,324 @@
 import json
-from typing import Optional
+from typing import Callable, Optional, BinaryIO, Generator, Iterable, Iterator
 from src.services.log_service import ILogger
 from src.interfaces import repository as repo
+from src.services.content_hash import content_hash
+from src.services.metrics import metrics
 import os
 
 class JsonlRepository(repo.IDataAccessRepository):
-    def __init__(self, db_path: str, logger: ILogger):
+    def __init__(self, db_path: str, logger: ILogger, compact_ratio: float = 0.5, compact_min_stale: int = 1000):
+        """
+        Append-only JSONL storage with an id -> byte offset index.
+
+        Updates are appended to the end of the file and supersede older records
+        with the same id. The index is persisted next to the database in a
+        ``.idx`` sidecar file, so reopening only has to scan records appended
+        after the index was last saved. Superseded records are dropped by
+        ``compact()``, which also runs automatically once there are at least
+        ``compact_min_stale`` stale records and they exceed ``compact_ratio``
+        of the live ones.
+
+        The index also keeps the ``content_hash`` of every item, so writing an item
+        equal to the stored one appends nothing.
+        """
         directory = os.path.dirname(db_path)
-        if not os.path.exists(directory):
+        if directory and not os.path.exists(directory):
             os.makedirs(directory)
         self.__db_path = db_path
+        self.__index_path = db_path + ".idx"
         self.__logger = logger
+        self.__compact_ratio = compact_ratio
+        self.__compact_min_stale = compact_min_stale
+        self.__offsets: dict[str, int] = {}
+        self.__hashes: dict[str, str] = {}
+        self.__stale = 0
+        self.__size = 0
+        self.__reader: Optional[BinaryIO] = None
+        self._load_index()
         self.__logger.log_debug(f"Repository init successfully")
 
 
+    @metrics.timed("repository_op_seconds", backend="jsonl", op="insert")
     def insert(self,  item: dict) -> dict:
-        with open(self.__db_path, 'a', encoding='utf-8') as f:
-            new_line = json.dumps(item, ensure_ascii=False) + '\n'
-            f.write(new_line)
-            self.__logger.log_debug(f"def:insert - New item added into {self.__db_path}")
+        self._append(item)
+        self.__logger.log_debug(f"def:insert - New item added into {self.__db_path}")
+        self._compact_if_needed()
         return item
 
 
+    @metrics.timed("repository_op_seconds", backend="jsonl", op="get_first_or_default")
     def get_first_or_default(self, id_keys: dict[str, str | int]) -> Optional[dict]:
+        if "id" not in id_keys:
+            for _, item in self._iter_live():
+                if self._is_equals(item, id_keys):
+                    return item
+            return None
+
+        offset = self.__offsets.get(self._key(id_keys["id"]))
+        if offset is None:
+            return None
+
+        item = self._read_at(offset)
+        if item is None or item.get("id") != id_keys["id"]:
+            # The sidecar index no longer matches the file (edited or replaced externally)
+            self.__logger.log_warning(f"def:get_first_or_default - index out of date, rebuilding {self.__index_path}")
+            self._rebuild_index()
+            offset = self.__offsets.get(self._key(id_keys["id"]))
+            item = self._read_at(offset) if offset is not None else None
+
+        if item is not None and self._is_equals(item, id_keys):
+            return item
+        return None
+
+
+    @metrics.timed("repository_op_seconds", backend="jsonl", op="update")
+    def update(self, new_item: dict, id_keys: dict[str, str | int]) -> dict:
+        old_item = self.get_first_or_default(id_keys)
+        if not old_item:
+            raise ValueError('Unable to update item.')
+
+        # The appended record supersedes the old one through the index
+        self._append(new_item)
+
+        if new_item.get("id") != old_item.get("id"):
+            # The old record is no longer reachable by the new id, so drop it right away,
+            # otherwise it would come back the next time the index is rebuilt from the file
+            self.__offsets.pop(self._key(old_item.get("id")), None)
+            self.__hashes.pop(self._key(old_item.get("id")), None)
+            self.__stale += 1
+            self.compact()
+        else:
+            self._compact_if_needed()
+
+        self.__logger.log_debug(f"def:update - Item {id_keys} update successfully")
+        return new_item
+
+
+    @metrics.timed("repository_op_seconds", backend="jsonl", op="upsert")
+    def upsert(self, item: dict) -> dict:
+        # Appending is enough, the index makes the new record supersede any older one
+        self._append(item)
+        self.__logger.log_debug(f"def:upsert - Item {item.get('id')} written into {self.__db_path}")
+        self._compact_if_needed()
+        return item
+
+
+    @metrics.timed("repository_op_seconds", backend="jsonl", op="upsert_many")
+    def upsert_many(self, items: Iterable[dict]) -> int:
+        count = self._append_many(items)
+        self.__logger.log_debug(f"def:upsert_many - {count} items written into {self.__db_path}")
+        self._compact_if_needed()
+        return count
+
+
+    def iter_items(self) -> Iterator[dict]:
+        """Streams the latest record of every item in file order."""
+        for _, item in self._iter_live():
+            yield item
+
+
+    @metrics.timed("repository_op_seconds", backend="jsonl", op="compact")
+    def compact(self):
+        """Rewrites the database keeping only the latest record of every item."""
+        self._close_reader()
         if not os.path.exists(self.__db_path):
+            return
+
+        temp_file = self.__db_path + ".tmp"
+        offsets: dict[str, int] = {}
+        with open(temp_file, 'wb') as w:
+            for _, item, line in self._iter_records(live_only=True):
+                key = self._key(item.get("id"))
+                if key is not None:
+                    offsets[key] = w.tell()
+                w.write(line if line.endswith(b'\n') else line + b'\n')
+            size = w.tell()
+
+        # Replace the old file with the compacted one atomically
+        os.replace(temp_file, self.__db_path)
+        removed = self.__stale
+        self.__offsets = offsets
+        self.__stale = 0
+        self.__size = size
+        self._save_index()
+        self.__logger.log_debug(f"def:compact - {removed} superseded records removed from {self.__db_path}")
+
+
+    def close(self):
+        self._close_reader()
+        self._save_index()
+
+
+    def _append(self, item: dict):
+        self._append_many([item])
+
+
+    def _append_many(self, items: Iterable[dict]) -> int:
+        lines: list[bytes] = []
+        records: list[tuple[dict, int, str]] = []
+        # Hashes of this batch, for items repeated in it
+        written: dict[str, str] = {}
+        count = 0
+        with open(self.__db_path, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            for item in items:
+                count += 1
+                key = self._key(item.get("id"))
+                item_hash = content_hash(item)
+                if key is not None and written.get(key, self.__hashes.get(key)) == item_hash:
+                    continue
+                if key is not None:
+                    written[key] = item_hash
+                new_line = (json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8')
+                records.append((item, offset, item_hash))
+                lines.append(new_line)
+                offset += len(new_line)
+            # All lines are written with a single call
+            if lines:
+                f.write(b''.join(lines))
+            self.__size = offset
+
+        for item, item_offset, item_hash in records:
+            self._index_record(item, item_offset, item_hash)
+        if count > len(records):
+            metrics.inc("items_unchanged_total", count - len(records), backend="jsonl")
+        return len(records)
+
+
+    def _index_record(self, item: dict, offset: int, item_hash: Optional[str] = None):
+        key = self._key(item.get("id"))
+        if key is None:
+            return
+        if key in self.__offsets:
+            self.__stale += 1
+        self.__offsets[key] = offset
+        self.__hashes[key] = item_hash or content_hash(item)
+
+
+    def _compact_if_needed(self):
+        if self.__stale >= self.__compact_min_stale and self.__stale > self.__compact_ratio * len(self.__offsets):
+            self.compact()
+
+
+    def _read_at(self, offset: int) -> Optional[dict]:
+        if self.__reader is None:
+            if not os.path.exists(self.__db_path):
+                return None
+            self.__reader = open(self.__db_path, 'rb')
+        self.__reader.seek(offset)
+        try:
+            return json.loads(self.__reader.readline())
+        except json.JSONDecodeError:
             return None
 
-        with open(self.__db_path, 'r', encoding='utf-8') as file:
+
+    def _close_reader(self):
+        if self.__reader is not None:
+            self.__reader.close()
+            self.__reader = None
+
+
+    def _iter_records(self, start: int = 0, live_only: bool = False) -> Generator[tuple[int, dict, bytes], None, None]:
+        if not os.path.exists(self.__db_path):
+            return
+
+        with open(self.__db_path, 'rb') as file:
+            file.seek(start)
+            offset = start
             for line in file:
-                line = line.strip()
-                if not line:
+                line_offset = offset
+                offset += len(line)
+                if not line.strip():
                     continue
 
                 try:
                     item = json.loads(line)
                 except json.JSONDecodeError:
                     self.__logger.log_error(
-                        f"Invalid JSON in file {self.__db_path}: {line}"
+                        f"Invalid JSON in file {self.__db_path}: {line.decode('utf-8', 'replace').strip()}"
                     )
                     continue
 
-                if self._is_equals(item, id_keys):
-                    return item
-        return None
+                if live_only:
+                    key = self._key(item.get("id"))
+                    if key is not None and self.__offsets.get(key) != line_offset:
+                        continue
+                yield line_offset, item, line
 
 
-    def update(self, new_item: dict, id_keys: dict[str, str | int]) -> dict:
-        # Prepare a path for the temporary file
-        temp_file = self.__db_path + ".tmp"
+    def _iter_live(self) -> Generator[tuple[int, dict], None, None]:
+        for offset, item, _ in self._iter_records(live_only=True):
+            yield offset, item
 
-        # Open the original database file for reading, and a temporary file for writing
-        with open(self.__db_path, 'r', encoding='utf-8') as r, open(temp_file, 'w', encoding='utf-8') as w:
-            while line := r.readline():
-                obj = json.loads(line)
 
-                # If the current line does not match the ID keys, write it as is
-                if not self._is_equals(obj, id_keys):
-                    w.write(line)
-                    continue
+    def _load_index(self):
+        db_size = os.path.getsize(self.__db_path) if os.path.exists(self.__db_path) else 0
+        indexed_size = 0
+        if os.path.exists(self.__index_path):
+            try:
+                with open(self.__index_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                indexed_size = data["size"]
+                if indexed_size <= db_size:
+                    self.__offsets = data["offsets"]
+                    # Missing in indexes saved before hashes were kept, those items are written again once
+                    self.__hashes = data.get("hashes", {})
+                    self.__stale = data.get("stale", 0)
+                else:
+                    indexed_size = 0
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                self.__logger.log_warning(f"def:load_index - invalid index {self.__index_path}: {e}")
+                indexed_size = 0
 
-                # If a match is found, write the new item instead of the original
-                new_line = json.dumps(new_item, ensure_ascii=False) + '\n'
-                w.write(new_line)
+        if indexed_size == 0:
+            self.__offsets = {}
+            self.__hashes = {}
+            self.__stale = 0
 
-                # After updating the matching line, copy the rest of the file as is
-                for line in r:
-                    w.write(line)
-                break
+        # Only records appended after the index was saved have to be scanned
+        for offset, item, _ in self._iter_records(start=indexed_size):
+            self._index_record(item, offset)
+        self.__size = db_size
+        self.__logger.log_debug(f"def:load_index - {len(self.__offsets)} items indexed")
 
-        # Replace the old file with the new updated file atomically
-        os.replace(temp_file, self.__db_path)
 
-        # Return the updated item for verification
-        updated_item = self.get_first_or_default(id_keys)
-        if not updated_item:
-            raise ValueError('Unable to update item.')
-        self.__logger.log_debug(f"def:update - Item {id_keys} update successfully")
-        return updated_item
+    def _rebuild_index(self):
+        self._close_reader()
+        self.__offsets = {}
+        self.__hashes = {}
+        self.__stale = 0
+        for offset, item, _ in self._iter_records():
+            self._index_record(item, offset)
+        self.__size = os.path.getsize(self.__db_path) if os.path.exists(self.__db_path) else 0
+
+
+    def _save_index(self):
+        if not os.path.exists(self.__db_path):
+            return
+        temp_file = self.__index_path + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump({"size": self.__size, "stale": self.__stale, "offsets": self.__offsets, "hashes": self.__hashes},
+                      f, ensure_ascii=False)
+        os.replace(temp_file, self.__index_path)
+
+
+    @staticmethod
+    def _key(value: Optional[str | int]) -> Optional[str]:
+        return None if value is None else str(value)
 
 
     @staticmethod
     def _is_equals(item: dict, id_keys: dict[str, str | int]) -> bool:
-        return all([item[k] == v for k, v in id_keys.items()])
\ No newline at end of file
+        return all([item.get(k) == v for k, v in id_keys.items()])
+
+
+def create_repository(path: str, create_logger: Callable[[str], ILogger], segment_size: int = 0,
+                      compression: Optional[str] = "gzip") -> repo.IDataAccessRepository:
+    """Registry factory of .jsonl files, split into segments of ``segment_size`` bytes when it is set."""
+    if segment_size > 0:
+        from src.accessdata.segmented_jsonl_repository import SegmentedJsonlRepository
+
+        return SegmentedJsonlRepository(path, create_logger("SegmentedJsonlRepository"),
+                                        segment_size=segment_size, compression=compression)
+    return JsonlRepository(path, create_logger("JsonlRepository"))
@@ -0,0 +1,140 @@
+import importlib
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+from src.interfaces.logger import ILogger
+from src.interfaces.repository import IDataAccessRepository
+from src.services.metrics import metrics
+
+# Entry point group third-party backends are registered through
+ENTRY_POINT_GROUP = "scrapper.repositories"
+
+# Called with the database path, a function creating a logger by module name and the options of its backend
+RepositoryFactory = Callable[..., IDataAccessRepository]
+
+
+def uri_path(target: str) -> str:
+    """
+    The file path of ``target``, which is a path or a URI like ``sqlite:///products.db``.
+    As in SQLAlchemy URLs, three slashes start a relative path and four an absolute one.
+    """
+    scheme, separator, rest = target.partition("://")
+    if not separator:
+        return target
+    return rest[1:] if rest.startswith("/") else rest
+
+
+class RepositoryRegistry:
+    def __init__(self, entry_point_group: Optional[str] = ENTRY_POINT_GROUP):
+        """
+        Maps file extensions and URI schemes to repository factories.
+
+        A factory is a callable or a ``"package.module:function"`` string. A string is
+        imported only when its backend is selected, so a run pays only for the imports
+        of the database it opens; the import time is recorded as ``backend_import_seconds``.
+
+        Backends of other packages are found through the ``entry_point_group`` entry
+        points, which are loaded only for an extension or scheme that no registered
+        backend handles. Each entry point is a function that receives this registry
+        and calls ``register``; with a string factory the backend itself is still
+        imported lazily.
+        """
+        self.__entry_point_group = entry_point_group
+        self.__lock = threading.Lock()
+        self.__factories: dict[str, RepositoryFactory | str] = {}
+        self.__extensions: dict[str, str] = {}
+        self.__schemes: dict[str, str] = {}
+        self.__entry_points_loaded = entry_point_group is None
+
+
+    def register(self, name: str, factory: RepositoryFactory | str, extensions: Iterable[str] = (),
+                 schemes: Iterable[str] = ()):
+        """
+        Registers the backend ``name`` for files ending with one of ``extensions``
+        (without the dot) and URIs of one of ``schemes``. Registering a name again replaces it.
+        """
+        with self.__lock:
+            self.__factories[name] = factory
+            for extension in extensions:
+                self.__extensions[extension.lower()] = name
+            for scheme in schemes:
+                self.__schemes[scheme.lower()] = name
+
+
+    @property
+    def names(self) -> list[str]:
+        return sorted(self.__factories)
+
+
+    def backend_for(self, target: str) -> str:
+        """
+        Returns the name of the backend that opens ``target``.
+
+        :raises ValueError: When no backend handles its extension or scheme.
+        """
+        name = self._lookup(target)
+        if name is None and not self.__entry_points_loaded:
+            self._load_entry_points()
+            name = self._lookup(target)
+        if name is None:
+            scheme, separator, _ = target.partition("://")
+            if separator:
+                raise ValueError(f"Unsupported database URI: {scheme}://")
+            raise ValueError(f"Unsupported database file: .{target.split('.')[-1].lower()}")
+        return name
+
+
+    def create(self, target: str, create_logger: Callable[[str], ILogger],
+               options: Optional[dict[str, dict[str, Any]]] = None) -> IDataAccessRepository:
+        """
+        Opens the database ``target`` with the backend registered for it.
+
+        The factory of the backend receives the path of ``target`` (see ``uri_path``),
+        ``create_logger`` and the entry of its backend name in ``options`` as keyword arguments.
+
+        :raises ValueError: When no backend handles ``target``.
+        """
+        name = self.backend_for(target)
+        return self._factory(name)(uri_path(target), create_logger, **(options or {}).get(name, {}))
+
+
+    def _lookup(self, target: str) -> Optional[str]:
+        with self.__lock:
+            scheme, separator, _ = target.partition("://")
+            if separator:
+                return self.__schemes.get(scheme.lower())
+            return self.__extensions.get(target.split(".")[-1].lower())
+
+
+    def _factory(self, name: str) -> RepositoryFactory:
+        with self.__lock:
+            factory = self.__factories[name]
+        if not isinstance(factory, str):
+            return factory
+        module_name, _, attribute = factory.partition(":")
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        metrics.observe("backend_import_seconds", time.perf_counter() - started, backend=name)
+        factory = getattr(module, attribute)
+        with self.__lock:
+            self.__factories[name] = factory
+        return factory
+
+
+    def _load_entry_points(self):
+        # importlib.metadata scans every installed distribution, so it is only paid for unknown targets
+        from importlib.metadata import entry_points
+
+        for entry_point in entry_points(group=self.__entry_point_group):
+            entry_point.load()(self)
+        self.__entry_points_loaded = True
+
+
+repositories = RepositoryRegistry()
+repositories.register("jsonl", "src.accessdata.jsonl_repository:create_repository",
+                      extensions=("jsonl",), schemes=("jsonl",))
+repositories.register("sql", "src.accessdata.sql_repository:create_repository",
+                      extensions=("db",), schemes=("sqlite",))
+repositories.register("xlsx", "src.accessdata.xlsx_repository:create_repository",
+                      extensions=("xlsx",), schemes=("xlsx",))
@@ -0,0 +1,604 @@
+import bisect
+import gzip
+import json
+import os
+import re
+import threading
+from typing import Callable, Generator, Iterable, Iterator, Optional
+
+from src.interfaces import repository as repo
+from src.interfaces.logger import ILogger
+from src.services.content_hash import content_hash
+from src.services.metrics import metrics
+
+# segment-<id>-<generation>.jsonl[.gz|.zst]; a merge or compression writes a new generation of a segment
+_SEGMENT_FILE = re.compile(r"^segment-(\d{6})-(\d{3})\.jsonl(\.gz|\.zst)?$")
+_INDEX_FILE = "index.json"
+
+Location = tuple[int, int]  # (segment id, offset in the uncompressed segment)
+Block = tuple[int, int, int]  # (uncompressed start, compressed start, compressed length)
+
+
+class _Codec:
+    def __init__(self, suffix: str, compress: Callable[[bytes], bytes], decompress: Callable[[bytes], bytes]):
+        self.suffix = suffix
+        self.compress = compress
+        self.decompress = decompress
+
+
+def _codec(name: Optional[str]) -> Optional[_Codec]:
+    if not name:
+        return None
+    if name == "gzip":
+        return _Codec(".gz", lambda data: gzip.compress(data, compresslevel=6, mtime=0), gzip.decompress)
+    if name == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError("zstd compression requires the 'zstandard' package: pip install zstandard") from e
+        return _Codec(".zst", zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress)
+    raise ValueError(f"Unsupported compression: {name}")
+
+
+def _segment_name(segment: int, generation: int, suffix: str = "") -> str:
+    return f"segment-{segment:06d}-{generation:03d}.jsonl{suffix}"
+
+
+def _blocks_name(file_name: str) -> str:
+    # Block table of a compressed segment, written before the segment itself
+    return file_name.split(".jsonl")[0] + ".blocks.json"
+
+
+class SegmentedJsonlRepository(repo.IDataAccessRepository):
+    def __init__(self, directory: str, logger: ILogger, segment_size: int = 64 * 1024 * 1024,
+                 compression: Optional[str] = "gzip", block_size: int = 256 * 1024,
+                 compact_ratio: float = 0.5, compact_min_stale: int = 1000, background: bool = True):
+        """
+        Log-structured JSONL storage in ``directory``: records are appended to the active
+        segment, which is sealed and replaced by a new one once it reaches ``segment_size``
+        bytes. A newer segment supersedes records with the same id in older ones, and an
+        id -> (segment, offset) index is kept in ``index.json``.
+
+        Sealed segments are compressed with ``compression`` ("gzip", "zstd" when the
+        ``zstandard`` package is installed, or None) in independent blocks of about
+        ``block_size`` bytes, so a single record is read by decompressing only its block.
+        Once there are at least ``compact_min_stale`` superseded records in sealed segments
+        and they exceed ``compact_ratio`` of the live ones, the sealed segments are merged
+        into one without them. Compression and merging run in a background thread, or
+        inline when ``background`` is off; ``compact()`` runs both right away.
+
+        Merged and compressed segments are written under new file names and swapped in
+        afterwards, so a crash at any point leaves a readable store.
+
+        The index also keeps the ``content_hash`` of every item, so writing an item
+        equal to the stored one appends nothing.
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.__directory = directory
+        self.__logger = logger
+        self.__segment_size = segment_size
+        self.__codec = _codec(compression)
+        self.__block_size = block_size
+        self.__compact_ratio = compact_ratio
+        self.__compact_min_stale = compact_min_stale
+        self.__background = background
+
+        self.__lock = threading.RLock()
+        self.__changed = threading.Condition(self.__lock)
+        self.__maintenance_lock = threading.Lock()
+        self.__files: dict[int, str] = {}
+        self.__blocks: dict[int, list[Block]] = {}
+        self.__offsets: dict[str, Location] = {}
+        self.__hashes: dict[str, str] = {}
+        self.__stale: dict[int, int] = {}
+        self.__active = 1
+        self.__active_size = 0
+        self.__readers = 0
+        self.__block_cache: Optional[tuple[int, int, bytes]] = None
+        self.__worker: Optional[threading.Thread] = None
+        self.__closing = False
+        self._load()
+        self.__logger.log_debug(f"Repository init successfully")
+
+
+    @metrics.timed("repository_op_seconds", backend="segmented", op="insert")
+    def insert(self, item: dict) -> dict:
+        self._append_many([item])
+        self.__logger.log_debug(f"def:insert - New item added into {self.__directory}")
+        return item
+
+
+    @metrics.timed("repository_op_seconds", backend="segmented", op="get_first_or_default")
+    def get_first_or_default(self, id_keys: dict[str, str | int]) -> Optional[dict]:
+        if "id" not in id_keys:
+            return next((item for item in self.iter_items() if self._is_equals(item, id_keys)), None)
+        with self.__lock:
+            location = self.__offsets.get(self._key(id_keys["id"]))
+            item = self._read_at(*location) if location is not None else None
+        if item is not None and self._is_equals(item, id_keys):
+            return item
+        return None
+
+
+    @metrics.timed("repository_op_seconds", backend="segmented", op="update")
+    def update(self, new_item: dict, id_keys: dict[str, str | int]) -> dict:
+        old_item = self.get_first_or_default(id_keys)
+        if not old_item:
+            raise ValueError('Unable to update item.')
+        with self.__lock:
+            self._append_many([new_item])
+            old_key = self._key(old_item.get("id"))
+            if old_key != self._key(new_item.get("id")):
+                # Removed from the index, the old record is dropped by the next merge. Unlike a
+                # superseded record it would come back if the index were rebuilt before that.
+                segment, _ = self.__offsets.pop(old_key)
+                self.__hashes.pop(old_key, None)
+                self.__stale[segment] = self.__stale.get(segment, 0) + 1
+                self._save_index()
+        self.__logger.log_debug(f"def:update - Item {id_keys} update successfully")
+        return new_item
+
+
+    @metrics.timed("repository_op_seconds", backend="segmented", op="upsert")
+    def upsert(self, item: dict) -> dict:
+        self._append_many([item])
+        self.__logger.log_debug(f"def:upsert - Item {item.get('id')} written into {self.__directory}")
+        return item
+
+
+    @metrics.timed("repository_op_seconds", backend="segmented", op="upsert_many")
+    def upsert_many(self, items: Iterable[dict]) -> int:
+        count = self._append_many(items)
+        self.__logger.log_debug(f"def:upsert_many - {count} items written into {self.__directory}")
+        return count
+
+
+    def iter_items(self) -> Iterator[dict]:
+        """
+        Streams the current record of every item, segment by segment from the oldest.
+        Only one block or line is held in memory at a time; segments are not swapped
+        while the iteration runs. An item written meanwhile can be yielded again in its
+        new version.
+        """
+        with self.__lock:
+            self.__readers += 1
+            segments = sorted(self.__files.items())
+        try:
+            for segment, file_name in segments:
+                for offset, line in self._iter_segment(segment, file_name):
+                    item = self._parse(line, file_name)
+                    if item is not None and self.__offsets.get(self._key(item.get("id"))) == (segment, offset):
+                        yield item
+        finally:
+            with self.__lock:
+                self.__readers -= 1
+                self.__changed.notify_all()
+
+
+    @metrics.timed("repository_op_seconds", backend="segmented", op="compact")
+    def compact(self):
+        """Seals the active segment, then compresses and merges the sealed ones without superseded records."""
+        with self.__lock:
+            if self.__active_size:
+                self._rotate(start_maintenance=False)
+        self._maintain(force=True)
+
+
+    def close(self):
+        with self.__lock:
+            self.__closing = True
+            self.__changed.notify_all()
+            worker, self.__worker = self.__worker, None
+        if worker is not None:
+            worker.join()
+        with self.__lock:
+            self._save_index()
+            self.__closing = False
+
+
+    def _append_many(self, items: Iterable[dict]) -> int:
+        records = [(self._key(item.get("id")), content_hash(item), item) for item in items]
+        with self.__lock:
+            lines: list[bytes] = []
+            keys: list[tuple[Optional[str], str]] = []
+            # Hashes of this batch, for items repeated in it
+            written: dict[str, str] = {}
+            for key, item_hash, item in records:
+                if key is not None and written.get(key, self.__hashes.get(key)) == item_hash:
+                    continue
+                if key is not None:
+                    written[key] = item_hash
+                lines.append((json.dumps(item, ensure_ascii=False) + '\n').encode('utf-8'))
+                keys.append((key, item_hash))
+            if len(lines) < len(records):
+                metrics.inc("items_unchanged_total", len(records) - len(lines), backend="segmented")
+            if not lines:
+                return 0
+            with open(self._path(self.__files[self.__active]), 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(b''.join(lines))
+            for (key, item_hash), line in zip(keys, lines):
+                self._index_record(key, (self.__active, offset), item_hash)
+                offset += len(line)
+            self.__active_size = offset
+            if self.__active_size >= self.__segment_size:
+                self._rotate()
+        return len(lines)
+
+
+    def _index_record(self, key: Optional[str], location: Location, item_hash: str):
+        if key is None:
+            return
+        previous = self.__offsets.get(key)
+        if previous is not None:
+            self.__stale[previous[0]] = self.__stale.get(previous[0], 0) + 1
+        self.__offsets[key] = location
+        self.__hashes[key] = item_hash
+
+
+    def _rotate(self, start_maintenance: bool = True):
+        sealed = self.__active
+        self.__active += 1
+        self.__files[self.__active] = _segment_name(self.__active, 0)
+        self.__active_size = 0
+        open(self._path(self.__files[self.__active]), 'ab').close()
+        self._save_index()
+        self.__logger.log_debug(f"def:rotate - segment {sealed} sealed in {self.__directory}")
+        if start_maintenance:
+            self._start_maintenance()
+
+
+    def _start_maintenance(self):
+        if not self.__background:
+            # Inline maintenance could wait for this thread's own readers to finish
+            if not self.__readers:
+                self._maintain()
+            return
+        if self.__worker is None or not self.__worker.is_alive():
+            self.__worker = threading.Thread(target=self._maintain, name="segment-maintenance", daemon=True)
+            self.__worker.start()
+
+
+    def _maintain(self, force: bool = False):
+        with self.__maintenance_lock:
+            while not self.__closing:
+                with self.__lock:
+                    sealed = {s: f for s, f in self.__files.items() if s != self.__active}
+                    uncompressed = [s for s in sorted(sealed) if self.__codec and s not in self.__blocks]
+                    stale = sum(n for s, n in self.__stale.items() if s in sealed)
+                    merge_due = stale > 0 and (force or (stale >= self.__compact_min_stale
+                                                         and stale > self.__compact_ratio * len(self.__offsets)))
+                if uncompressed:
+                    self._compress(uncompressed[0], sealed[uncompressed[0]])
+                elif merge_due:
+                    self._merge(sorted(sealed.items()))
+                    force = False
+                else:
+                    return
+
+
+    def _compress(self, segment: int, file_name: str):
+        new_name = self._next_generation(file_name, self.__codec.suffix)
+        blocks = self._write_segment(new_name, (line for _, line in self._iter_segment(segment, file_name)))
+        with self.__lock:
+            self._wait_for_readers()
+            self._install(segment, new_name, blocks, [file_name])
+        self.__logger.log_debug(f"def:compress - segment {segment} compressed into {new_name}")
+
+
+    def _merge(self, segments: list[tuple[int, str]]):
+        """Writes the live records of ``segments`` into a new generation of the newest one."""
+        target = segments[-1][0]
+        new_name = self._next_generation(segments[-1][1], self.__codec.suffix if self.__codec else "")
+        moved: list[tuple[str, Location, int]] = []
+
+        def live_lines() -> Generator[bytes, None, None]:
+            offset = 0
+            for segment, file_name in segments:
+                for line_offset, line in self._iter_segment(segment, file_name):
+                    item = self._parse(line, file_name)
+                    key = self._key(item.get("id")) if item is not None else None
+                    if key is not None and self.__offsets.get(key) == (segment, line_offset):
+                        moved.append((key, (segment, line_offset), offset))
+                        offset += len(line)
+                        yield line
+
+        # Records move only to a newer segment, so an older copy never wins when the index is rebuilt
+        blocks = self._write_segment(new_name, live_lines())
+        with self.__lock:
+            self._wait_for_readers()
+            dropped = 0
+            for key, old_location, offset in moved:
+                if self.__offsets.get(key) == old_location:
+                    self.__offsets[key] = (target, offset)
+                else:
+                    dropped += 1
+            for segment, _ in segments:
+                self.__stale.pop(segment, None)
+            if dropped:
+                self.__stale[target] = dropped
+            for segment, _ in segments[:-1]:
+                del self.__files[segment]
+                self.__blocks.pop(segment, None)
+            self._install(target, new_name, blocks, [file_name for _, file_name in segments])
+        self.__logger.log_debug(f"def:merge - {len(segments)} segments merged into {new_name}, "
+                                f"{len(moved)} records kept")
+
+
+    def _wait_for_readers(self):
+        # Called holding the lock, which no new reader gets before the swap is done
+        while self.__readers:
+            self.__changed.wait()
+
+
+    def _install(self, segment: int, file_name: str, blocks: Optional[list[Block]], old_files: list[str]):
+        """Makes ``file_name`` the file of ``segment`` and removes the files it replaces."""
+        self.__files[segment] = file_name
+        if blocks is not None:
+            self.__blocks[segment] = blocks
+        else:
+            self.__blocks.pop(segment, None)
+        self.__block_cache = None
+        self._save_index()
+        for old_file in old_files:
+            self._remove(old_file)
+
+
+    def _write_segment(self, file_name: str, lines: Iterable[bytes]) -> Optional[list[Block]]:
+        """Writes ``lines`` into a new segment file, compressed in blocks when a codec is set."""
+        path = self._path(file_name)
+        temp_file = path + ".tmp"
+        blocks: Optional[list[Block]] = [] if self.__codec else None
+        with open(temp_file, 'wb') as f:
+            if blocks is None:
+                for line in lines:
+                    f.write(line)
+            else:
+                block: list[bytes] = []
+                size = start = 0
+                for line in lines:
+                    block.append(line)
+                    size += len(line)
+                    if size - start >= self.__block_size:
+                        blocks.append(self._write_block(f, start, block))
+                        block, start = [], size
+                if block:
+                    blocks.append(self._write_block(f, start, block))
+            f.flush()
+            os.fsync(f.fileno())
+        if blocks is not None:
+            self._write_json(self._path(_blocks_name(file_name)), blocks)
+        os.replace(temp_file, path)
+        return blocks
+
+
+    def _write_block(self, f, start: int, lines: list[bytes]) -> Block:
+        data = self.__codec.compress(b''.join(lines))
+        offset = f.tell()
+        f.write(data)
+        return start, offset, len(data)
+
+
+    def _iter_segment(self, segment: int, file_name: str, start: int = 0) -> Generator[tuple[int, bytes], None, None]:
+        """Yields (uncompressed offset, line) of the records in the segment file, from ``start`` when uncompressed."""
+        path = self._path(file_name)
+        blocks = self.__blocks.get(segment) if self._is_compressed(file_name) else None
+        if blocks is None and self._is_compressed(file_name):
+            blocks = self._load_blocks(file_name)
+        with open(path, 'rb') as f:
+            if blocks is None:
+                offset = f.seek(start)
+                for line in f:
+                    yield offset, line
+                    offset += len(line)
+                return
+            for start, compressed_start, length in blocks:
+                f.seek(compressed_start)
+                data = self._decompress(file_name, f.read(length))
+                position = 0
+                while position < len(data):
+                    end = data.find(b'\n', position)
+                    end = len(data) if end < 0 else end + 1
+                    yield start + position, data[position:end]
+                    position = end
+
+
+    def _read_at(self, segment: int, offset: int) -> Optional[dict]:
+        file_name = self.__files.get(segment)
+        if file_name is None:
+            return None
+        if not self._is_compressed(file_name):
+            with open(self._path(file_name), 'rb') as f:
+                f.seek(offset)
+                return self._parse(f.readline(), file_name)
+
+        blocks = self.__blocks[segment]
+        index = bisect.bisect_right(blocks, (offset, float("inf"), 0)) - 1
+        start, compressed_start, length = blocks[index]
+        if self.__block_cache is not None and self.__block_cache[:2] == (segment, index):
+            data = self.__block_cache[2]
+        else:
+            with open(self._path(file_name), 'rb') as f:
+                f.seek(compressed_start)
+                data = self._decompress(file_name, f.read(length))
+            # Items of one listing page are usually written, and read back, together
+            self.__block_cache = (segment, index, data)
+        end = data.find(b'\n', offset - start)
+        return self._parse(data[offset - start:end + 1 if end >= 0 else len(data)], file_name)
+
+
+    def _decompress(self, file_name: str, data: bytes) -> bytes:
+        suffix = os.path.splitext(file_name)[1]
+        codec = self.__codec if self.__codec and self.__codec.suffix == suffix else _codec(
+            "gzip" if suffix == ".gz" else "zstd")
+        return codec.decompress(data)
+
+
+    def _load(self):
+        for name in os.listdir(self.__directory):
+            if name.endswith(".tmp"):
+                # Left behind by an interrupted compression or merge
+                os.remove(os.path.join(self.__directory, name))
+
+        index = self._read_json(self._path(_INDEX_FILE))
+        if index is not None and self._load_index(index):
+            return
+        if index is not None:
+            self.__logger.log_warning(f"def:load - index of {self.__directory} out of date, rebuilding")
+        self._rebuild_index()
+
+
+    def _load_index(self, index: dict) -> bool:
+        try:
+            files = {int(s): name for s, (name, _) in index["files"].items()}
+            sizes = {int(s): size for s, (_, size) in index["files"].items()}
+            active = index["active"]
+            for segment, name in files.items():
+                path = self._path(name)
+                if not os.path.exists(path):
+                    return False
+                if os.path.getsize(path) != sizes[segment] and not (segment == active
+                                                                    and os.path.getsize(path) > sizes[segment]):
+                    return False
+            blocks = {s: self._load_blocks(name) for s, name in files.items() if self._is_compressed(name)}
+            if any(b is None for b in blocks.values()):
+                return False
+            self.__files = files
+            self.__blocks = blocks
+            self.__offsets = {key: (s, o) for key, (s, o) in index["offsets"].items()}
+            # Missing in indexes saved before hashes were kept, those items are written again once
+            self.__hashes = index.get("hashes", {})
+            self.__stale = {int(s): n for s, n in index["stale"].items()}
+            self.__active = active
+        except (KeyError, TypeError, ValueError) as e:
+            self.__logger.log_warning(f"def:load_index - invalid index of {self.__directory}: {e}")
+            return False
+
+        # Only records appended to the active segment after the index was saved have to be scanned
+        self.__active_size = sizes[active]
+        for offset, line in self._iter_segment(active, files[active], start=sizes[active]):
+            item = self._parse(line, files[active])
+            if item is not None:
+                self._index_record(self._key(item.get("id")), (active, offset), content_hash(item))
+        self.__active_size = os.path.getsize(self._path(files[active]))
+        self._remove_unreferenced()
+        self.__logger.log_debug(f"def:load_index - {len(self.__offsets)} items indexed")
+        return True
+
+
+    def _rebuild_index(self):
+        latest: dict[int, tuple[int, str]] = {}
+        for name in os.listdir(self.__directory):
+            match = _SEGMENT_FILE.match(name)
+            if not match or (match.group(3) and not os.path.exists(self._path(_blocks_name(name)))):
+                continue
+            segment, generation = int(match.group(1)), int(match.group(2))
+            if segment not in latest or generation > latest[segment][0]:
+                latest[segment] = (generation, name)
+
+        self.__files = {segment: name for segment, (_, name) in latest.items()}
+        self.__blocks = {s: self._load_blocks(name) for s, name in self.__files.items() if self._is_compressed(name)}
+        self.__offsets = {}
+        self.__hashes = {}
+        self.__stale = {}
+        for segment, file_name in sorted(self.__files.items()):
+            for offset, line in self._iter_segment(segment, file_name):
+                item = self._parse(line, file_name)
+                if item is not None:
+                    self._index_record(self._key(item.get("id")), (segment, offset), content_hash(item))
+
+        last = max(self.__files, default=0)
+        if last and not self._is_compressed(self.__files[last]):
+            self.__active = last
+            self.__active_size = os.path.getsize(self._path(self.__files[last]))
+        else:
+            self.__active = last + 1
+            self.__files[self.__active] = _segment_name(self.__active, 0)
+            self.__active_size = 0
+            open(self._path(self.__files[self.__active]), 'ab').close()
+        self._remove_unreferenced()
+        self._save_index()
+        self.__logger.log_debug(f"def:rebuild_index - {len(self.__offsets)} items indexed")
+
+
+    def _remove_unreferenced(self):
+        referenced = set(self.__files.values())
+        for name in os.listdir(self.__directory):
+            match = _SEGMENT_FILE.match(name)
+            if match and name not in referenced:
+                self._remove(name)
+
+
+    def _save_index(self):
+        self._write_json(self._path(_INDEX_FILE), {
+            "active": self.__active,
+            "files": {s: [name, os.path.getsize(self._path(name))] for s, name in self.__files.items()},
+            "stale": self.__stale,
+            "offsets": self.__offsets,
+            "hashes": self.__hashes,
+        })
+
+
+    def _load_blocks(self, file_name: str) -> Optional[list[Block]]:
+        blocks = self._read_json(self._path(_blocks_name(file_name)))
+        return [tuple(block) for block in blocks] if blocks is not None else None
+
+
+    def _remove(self, file_name: str):
+        for path in (self._path(file_name), self._path(_blocks_name(file_name))):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+    def _next_generation(self, file_name: str, suffix: str) -> str:
+        match = _SEGMENT_FILE.match(file_name)
+        return _segment_name(int(match.group(1)), int(match.group(2)) + 1, suffix)
+
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.__directory, file_name)
+
+
+    def _parse(self, line: bytes, file_name: str) -> Optional[dict]:
+        if not line.strip():
+            return None
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            self.__logger.log_error(f"Invalid JSON in segment {file_name}: {line.decode('utf-8', 'replace').strip()}")
+            return None
+
+
+    @staticmethod
+    def _is_compressed(file_name: str) -> bool:
+        return not file_name.endswith(".jsonl")
+
+
+    @staticmethod
+    def _read_json(path: str) -> Optional[dict | list]:
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            return None
+
+
+    @staticmethod
+    def _write_json(path: str, data: dict | list):
+        temp_file = path + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_file, path)
+
+
+    @staticmethod
+    def _key(value: Optional[str | int]) -> Optional[str]:
+        return None if value is None else str(value)
+
+
+    @staticmethod
+    def _is_equals(item: dict, id_keys: dict[str, str | int]) -> bool:
+        return all([item.get(k) == v for k, v in id_keys.items()])
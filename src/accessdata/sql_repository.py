@@ -1,94 +1,520 @@
+from src.interfaces.checkpoint_store import ICheckpointStore
 from src.interfaces.logger import ILogger
 from src.interfaces import repository as repo
+from src.services.content_hash import content_hash
+from src.services.metrics import metrics
+import datetime as dt
+import functools
+import json
+import re
 import sqlite3
-from typing import Optional
+from typing import Callable, Optional, Iterable, Iterator
+
+# PRAGMA user_version of the current schema, see _migrate
+SCHEMA_VERSION = 2
+
+# "60,5 cm", "25 kg": a number with a decimal comma or point and a unit
+_MEASURE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*(mm|cm|m|g|kg|ml|l)\s*$", re.IGNORECASE)
+
+# Measures are stored in the smallest unit, where catalog values are whole numbers,
+# which SQLite stores in one or two bytes instead of eight
+UNITS = {"mm": ("mm", 1), "cm": ("mm", 10), "m": ("mm", 1000),
+         "g": ("g", 1), "kg": ("g", 1000), "ml": ("ml", 1), "l": ("ml", 1000)}
+
+
+def parse_measure(value: object) -> tuple[Optional[float], Optional[str]]:
+    """Converts a detail value like "60,5 cm" into (605.0, "mm"), or returns (None, None)."""
+    return _parse_measure(value) if isinstance(value, str) else (None, None)
+
+
+def to_base_unit(number: float, unit: str) -> tuple[float, str]:
+    base, factor = UNITS[unit.lower()]
+    return round(number * factor, 6), base
+
+
+@functools.lru_cache(maxsize=65536)
+def _parse_measure(value: str) -> tuple[Optional[float], Optional[str]]:
+    # Sizes repeat across a catalog, most values are parsed once
+    match = _MEASURE.match(value)
+    if not match:
+        return None, None
+    return to_base_unit(float(match.group(1).replace(",", ".")), match.group(2))
+
+
+_INSERT_DETAIL = """
+    INSERT INTO product_details (product_id, position, key_id, value, number, unit)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+# Two price changes within a second keep the later price
+_INSERT_PRICE = """
+    INSERT INTO price_history (product_id, changed_at, price) VALUES (?, ?, ?)
+    ON CONFLICT(product_id, changed_at) DO UPDATE SET price = excluded.price
+"""
 
 
 class SqlRepository(repo.IDataAccessRepository):
-    def __init__(self, db_path: str, logger: ILogger):
+    def __init__(self, db_path: str, logger: ILogger, batch_size: int = 500, synchronous: str = "NORMAL",
+                 measure_index: bool = False):
+        """
+        SQLite storage with ``products`` and ``product_details`` tables.
+
+        Both tables are clustered by their primary key (``WITHOUT ROWID``): a product is
+        found with one b-tree search and its details are read in order with one range
+        scan. Detail keys are stored once in ``detail_keys`` and referenced by id, values
+        such as "60,5 cm" are also kept as a number of mm, g or ml (see ``find_by_measure``).
+        Databases of an older schema are migrated when opened (``PRAGMA user_version``).
+
+        With ``measure_index`` enabled an index over the measures lets ``find_by_measure``
+        skip the table scan, at the cost of a larger file and slower writes; it is created
+        or dropped when the database is opened.
+
+        The connection uses WAL journaling with the given ``synchronous`` level,
+        which keeps commits durable against application crashes while avoiding
+        an fsync per transaction. ``upsert_many`` writes items in a single
+        transaction, ``batch_size`` items per ``executemany`` round.
+
+        Crawl progress can be kept in the ``checkpoints`` table (see ``checkpoint_store``),
+        so it is committed in the same transaction as the items it covers.
+        """
         self.__logger = logger
         self.__logger.log_debug(f"Repository init successfully")
-        self.conn = sqlite3.connect(db_path)
+        self.__batch_size = batch_size
+        self.__measure_index = measure_index
+        # Written from the pipeline's persist thread, one thread at a time
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._configure_connection(synchronous)
+        self.__key_ids: dict[str, int] = {}
+        self.__key_names: dict[int, str] = {}
         self._create_tables()
+        self._load_keys()
+
+
+    def _configure_connection(self, synchronous: str):
+        if synchronous.upper() not in ("OFF", "NORMAL", "FULL", "EXTRA"):
+            raise ValueError(f"Unsupported synchronous mode: {synchronous}")
+        cursor = self.conn.cursor()
+        cursor.execute("PRAGMA journal_mode = WAL;")
+        cursor.execute(f"PRAGMA synchronous = {synchronous};")
+        cursor.execute("PRAGMA temp_store = MEMORY;")
+        cursor.execute("PRAGMA cache_size = -20000;")
 
 
     def _create_tables(self):
         cursor = self.conn.cursor()
         cursor.execute("""
-            CREATE TABLE IF NOT EXISTS products (
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                name TEXT PRIMARY KEY,
+                state TEXT
+            );
+        """)
+        try:
+            self.conn.commit()
+            self._migrate()
+            self._sync_measure_index()
+            self.__logger.log_debug(f"def:create_tables - Tables crated")
+        except Exception as e:
+            self.__logger.log_error(f"def:create_tables - error: {e}")
+            raise
+
+
+    def _migrate(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        self.conn.execute("BEGIN")
+        try:
+            if version < 1:
+                self._migrate_to_1()
+            if version < 2:
+                self._migrate_to_2()
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+
+    def _migrate_to_1(self):
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        # Version 0: a rowid products table and product_details(product_id, key, value)
+        # with the key text in every row
+        if "products" in tables:
+            self.conn.execute("ALTER TABLE products RENAME TO products_v0")
+        if "product_details" in tables:
+            self.conn.execute("DROP INDEX IF EXISTS ix_product_details_product_id")
+            self.conn.execute("ALTER TABLE product_details RENAME TO product_details_v0")
+        self._create_product_tables()
+        if "products" in tables:
+            self.conn.execute("INSERT INTO products SELECT id, name, description, price FROM products_v0")
+            self.conn.execute("DROP TABLE products_v0")
+        if "product_details" in tables:
+            count = self._copy_v0_details()
+            self.conn.execute("DROP TABLE product_details_v0")
+            self.__logger.log_info(f"def:migrate - {count} product details moved to schema 1")
+
+
+    def _migrate_to_2(self):
+        # A NULL hash never matches, so products stored before are rewritten once
+        self.conn.execute("ALTER TABLE products ADD COLUMN content_hash TEXT")
+        self.conn.execute("""
+            CREATE TABLE price_history (
+                product_id TEXT NOT NULL,
+                changed_at TEXT NOT NULL,
+                price TEXT,
+                PRIMARY KEY (product_id, changed_at)
+            ) WITHOUT ROWID;
+        """)
+        # The current prices start the history
+        self.conn.execute("INSERT INTO price_history SELECT id, ?, price FROM products", (self._now(),))
+
+
+    def _create_product_tables(self):
+        self.conn.execute("""
+            CREATE TABLE products (
                 id TEXT PRIMARY KEY,
                 name TEXT,
                 description TEXT,
                 price TEXT
+            ) WITHOUT ROWID;
+        """)
+        self.conn.execute("""
+            CREATE TABLE detail_keys (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
             );
         """)
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS product_details (
-                product_id TEXT,
-                key TEXT,
+        self.conn.execute("""
+            CREATE TABLE product_details (
+                product_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                key_id INTEGER NOT NULL REFERENCES detail_keys(id),
                 value TEXT,
+                number REAL,
+                unit TEXT,
+                PRIMARY KEY (product_id, position),
                 FOREIGN KEY(product_id) REFERENCES products(id)
-            );
+            ) WITHOUT ROWID;
         """)
-        try:
-            self.conn.commit()
-            self.__logger.log_debug(f"def:create_tables - Tables crated")
-        except Exception as e:
-            self.__logger.log_error(f"def:create_tables - error: {e}")
 
 
+    def _sync_measure_index(self):
+        if self.__measure_index:
+            # Covers find_by_measure, e.g. "Plotis" between 50 and 60 cm, without touching the table
+            self.conn.execute("""
+                CREATE INDEX IF NOT EXISTS ix_product_details_measure
+                ON product_details (key_id, unit, number) WHERE number IS NOT NULL;
+            """)
+        else:
+            self.conn.execute("DROP INDEX IF EXISTS ix_product_details_measure")
+        self.conn.commit()
+
+
+    def _copy_v0_details(self) -> int:
+        count = 0
+        product_id, position = None, 0
+        rows = self.conn.execute("SELECT product_id, key, value FROM product_details_v0 ORDER BY product_id, rowid")
+        while batch := rows.fetchmany(1000):
+            new_rows = []
+            for row_product_id, key, value in batch:
+                position = position + 1 if row_product_id == product_id else 0
+                product_id = row_product_id
+                new_rows.append((product_id, position, self._key_id(key if key is not None else ""), value,
+                                 *parse_measure(value)))
+            self.conn.executemany("""
+                INSERT INTO product_details (product_id, position, key_id, value, number, unit)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, new_rows)
+            count += len(new_rows)
+        return count
+
+
+    @metrics.timed("repository_op_seconds", backend="sql", op="get_first_or_default")
     def get_first_or_default(self, id_keys: dict[str, str | int]) -> Optional[dict]:
         cursor = self.conn.cursor()
-        cursor.execute("SELECT * FROM products WHERE id = ?", (id_keys["id"],))
+        cursor.execute("SELECT id, name, description, price FROM products WHERE id = ?", (id_keys["id"],))
         row = cursor.fetchone()
         if row:
             product = {"id": row[0], "name": row[1], "description": row[2], "price": row[3]}
-            cursor.execute("SELECT key, value FROM product_details WHERE product_id = ?", (row[0],))
-            details = [{key: value} for key, value in cursor.fetchall()]
-            product["details"] = details
+            cursor.execute("SELECT key_id, value FROM product_details WHERE product_id = ? ORDER BY position",
+                           (row[0],))
+            product["details"] = [{self._key_name(key_id): value} for key_id, value in cursor.fetchall()]
             return product
         return None
 
 
+    @metrics.timed("repository_op_seconds", backend="sql", op="update")
     def update(self, new_item: dict, id_keys: dict[str, str | int]) -> dict:
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            UPDATE products
-            SET name = ?, description = ?, price = ?
-            WHERE id = ?
-        """, (new_item["name"], new_item["description"], new_item["price"], id_keys["id"]))
-
-        # Clear and re-insert details
-        cursor.execute("DELETE FROM product_details WHERE product_id = ?", (id_keys["id"],))
-        for detail in new_item.get("details", []):
-            for key, value in detail.items():
-                cursor.execute("""
-                    INSERT INTO product_details (product_id, key, value)
-                    VALUES (?, ?, ?)
-                """, (id_keys["id"], key, value))
         try:
-            self.conn.commit()
-            self.__logger.log_error(f"def: update - item {id_keys} successfully")
+            with self.conn:
+                self._upsert_batch([{**new_item, "id": id_keys["id"]}])
+            self.__logger.log_debug(f"def: update - item {id_keys} successfully")
         except Exception as e:
+            self._load_keys()
             self.__logger.log_error(f"def: update - error: {e}")
         return new_item
 
 
+    @metrics.timed("repository_op_seconds", backend="sql", op="insert")
     def insert(self, item: dict) -> dict:
         cursor = self.conn.cursor()
         cursor.execute("""
-            INSERT INTO products (id, name, description, price)
-            VALUES (?, ?, ?, ?)
-        """, (item["id"], item["name"], item["description"], item["price"]))
-        for detail in item.get("details", []):
-            for key, value in detail.items():
-                cursor.execute("""
-                    INSERT INTO product_details (product_id, key, value)
-                    VALUES (?, ?, ?)
-                """, (item["id"], key, value))
+            INSERT INTO products (id, name, description, price, content_hash)
+            VALUES (?, ?, ?, ?, ?)
+        """, (item["id"], item["name"], item["description"], item["price"], content_hash(item)))
+        cursor.executemany(_INSERT_DETAIL, self._detail_rows(item["id"], item))
+        cursor.execute(_INSERT_PRICE, (item["id"], self._now(), item["price"]))
         try:
             self.conn.commit()
             self.__logger.log_debug(f"def:insert - item inserted successfully")
         except Exception as e:
+            self._load_keys()
             self.__logger.log_error(f"def:insert - error: {e}")
-        return item
\ No newline at end of file
+        return item
+
+
+    def upsert(self, item: dict) -> dict:
+        self.upsert_many([item])
+        return item
+
+
+    @metrics.timed("repository_op_seconds", backend="sql", op="upsert_many")
+    def upsert_many(self, items: Iterable[dict], batch_size: Optional[int] = None,
+                    checkpoint: Optional[tuple[str, dict]] = None) -> int:
+        """
+        Inserts new items and replaces existing ones in a single transaction. Items equal
+        to the stored ones (same ``content_hash``) are skipped, and a price change adds a
+        row to ``price_history``.
+
+        :param items: The items to write, each with an "id" key.
+        :param batch_size: Number of items sent per ``executemany`` round, defaults to the repository setting.
+        :param checkpoint: Optional (name, state) crawl progress saved in the same transaction.
+        :return: The number of items written, without the skipped ones.
+        """
+        batch_size = batch_size or self.__batch_size
+        count = 0
+        try:
+            with self.conn:
+                batch: list[dict] = []
+                for item in items:
+                    batch.append(item)
+                    if len(batch) >= batch_size:
+                        count += self._upsert_batch(batch)
+                        batch = []
+                if batch:
+                    count += self._upsert_batch(batch)
+                if checkpoint:
+                    self._save_checkpoint(*checkpoint)
+        except Exception as e:
+            # Keys added in the rolled back transaction are gone
+            self._load_keys()
+            self.__logger.log_error(f"def:upsert_many - error: {e}")
+            raise
+        self.__logger.log_debug(f"def:upsert_many - {count} items written")
+        return count
+
+
+    def iter_items(self) -> Iterator[dict]:
+        """Streams the products ordered by id, each with its details in stored order."""
+        # Two scans in primary key order merged here, a join would sort the details of every product
+        details = self._iter_rows("SELECT product_id, key_id, value FROM product_details "
+                                  "ORDER BY product_id, position")
+        detail = next(details, None)
+        for product_id, name, description, price in self._iter_rows(
+                "SELECT id, name, description, price FROM products ORDER BY id"):
+            while detail is not None and detail[0] < product_id:
+                detail = next(details, None)  # Details without a product
+            product = {"id": product_id, "name": name, "description": description, "price": price, "details": []}
+            while detail is not None and detail[0] == product_id:
+                product["details"].append({self._key_name(detail[1]): detail[2]})
+                detail = next(details, None)
+            yield product
+
+
+    @metrics.timed("repository_op_seconds", backend="sql", op="find_by_measure")
+    def find_by_measure(self, key: str, low: float, high: float, unit: str = "cm") -> list[str]:
+        """Returns the sorted ids of products with a detail ``key`` between ``low`` and ``high`` ``unit``."""
+        (low, base), (high, _) = to_base_unit(low, unit), to_base_unit(high, unit)
+        key_id = self.__key_ids.get(key)
+        if key_id is None:
+            self._load_keys()
+            key_id = self.__key_ids.get(key)
+            if key_id is None:
+                return []
+        rows = self.conn.execute("""
+            SELECT DISTINCT product_id FROM product_details
+            WHERE key_id = ? AND unit = ? AND number BETWEEN ? AND ?
+            ORDER BY product_id
+        """, (key_id, base, low, high))
+        return [row[0] for row in rows]
+
+
+    def price_history(self, product_id: str | int) -> list[dict]:
+        """Returns the prices of a product from the oldest, each with the UTC time it was first seen."""
+        rows = self.conn.execute("""
+            SELECT changed_at, price FROM price_history WHERE product_id = ? ORDER BY changed_at
+        """, (product_id,))
+        return [{"changed_at": changed_at, "price": price} for changed_at, price in rows]
+
+
+    @metrics.timed("repository_op_seconds", backend="sql", op="bulk_insert")
+    def bulk_insert(self, items: Iterable[dict], batch_size: int = 1000) -> int:
+        """Writes the whole stream in one transaction, ``batch_size`` items per ``executemany`` round."""
+        return self.upsert_many(items, batch_size)
+
+
+    def checkpoint_store(self, name: str) -> ICheckpointStore:
+        """Returns the store of the crawl progress called ``name`` kept in this database."""
+        return SqlCheckpointStore(self, name)
+
+
+    def load_checkpoint(self, name: str) -> Optional[dict]:
+        row = self.conn.execute("SELECT state FROM checkpoints WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+
+    def save_checkpoint(self, name: str, state: Optional[dict]):
+        """Saves the crawl progress ``name``, or removes it when ``state`` is None."""
+        with self.conn:
+            self._save_checkpoint(name, state)
+
+
+    def close(self):
+        self.conn.close()
+
+
+    def _save_checkpoint(self, name: str, state: Optional[dict]):
+        if state is None:
+            self.conn.execute("DELETE FROM checkpoints WHERE name = ?", (name,))
+        else:
+            self.conn.execute("""
+                INSERT INTO checkpoints (name, state) VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET state = excluded.state
+            """, (name, json.dumps(state)))
+
+
+    def _upsert_batch(self, batch: list[dict]) -> int:
+        # The last occurrence of an id wins, so its details are not inserted twice
+        unique = list({item["id"]: item for item in batch}.values())
+        stored = self._stored_state([item["id"] for item in unique])
+        now = self._now()
+        changed: list[tuple[dict, str]] = []
+        prices: list[tuple] = []
+        for item in unique:
+            item_hash = content_hash(item)
+            old_hash, old_price = stored.get(str(item["id"]), (None, None))
+            if item_hash == old_hash:
+                continue
+            changed.append((item, item_hash))
+            price = None if item["price"] is None else str(item["price"])
+            if old_hash is None or price != old_price:
+                prices.append((item["id"], now, price))
+        if len(changed) < len(unique):
+            metrics.inc("items_unchanged_total", len(unique) - len(changed), backend="sql")
+        if not changed:
+            return 0
+
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT INTO products (id, name, description, price, content_hash)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                name = excluded.name,
+                description = excluded.description,
+                price = excluded.price,
+                content_hash = excluded.content_hash
+        """, [(item["id"], item["name"], item["description"], item["price"], item_hash)
+              for item, item_hash in changed])
+        cursor.executemany("DELETE FROM product_details WHERE product_id = ?",
+                           [(item["id"],) for item, _ in changed])
+        cursor.executemany(_INSERT_DETAIL, [row for item, _ in changed for row in self._detail_rows(item["id"], item)])
+        cursor.executemany(_INSERT_PRICE, prices)
+        return len(changed)
+
+
+    def _stored_state(self, ids: list) -> dict[str, tuple[Optional[str], Optional[str]]]:
+        """Returns id -> (content hash, price) of the stored products among ``ids``."""
+        stored = {}
+        # Within SQLite's limit of 32766 parameters per statement
+        for start in range(0, len(ids), 10000):
+            chunk = ids[start:start + 10000]
+            rows = self.conn.execute(f"SELECT id, content_hash, price FROM products "
+                                     f"WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+            stored.update((product_id, (item_hash, price)) for product_id, item_hash, price in rows)
+        return stored
+
+
+    def _iter_rows(self, sql: str) -> Iterator[tuple]:
+        cursor = self.conn.execute(sql)
+        while rows := cursor.fetchmany(1000):
+            yield from rows
+
+
+    def _detail_rows(self, product_id: str | int, item: dict) -> list[tuple]:
+        rows = []
+        for detail in item.get("details", []):
+            for key, value in detail.items():
+                rows.append((product_id, len(rows), self._key_id(key), value, *parse_measure(value)))
+        return rows
+
+
+    def _key_id(self, name: str) -> int:
+        key_id = self.__key_ids.get(name)
+        if key_id is None:
+            # Runs in the caller's transaction, a rollback reloads the cache
+            self.conn.execute("INSERT INTO detail_keys (name) VALUES (?) ON CONFLICT(name) DO NOTHING", (name,))
+            key_id = self.conn.execute("SELECT id FROM detail_keys WHERE name = ?", (name,)).fetchone()[0]
+            self.__key_ids[name] = key_id
+            self.__key_names[key_id] = name
+        return key_id
+
+
+    def _key_name(self, key_id: int) -> str:
+        name = self.__key_names.get(key_id)
+        if name is None:
+            # Added through another connection to the same database
+            self._load_keys()
+            name = self.__key_names[key_id]
+        return name
+
+
+    @staticmethod
+    def _now() -> str:
+        return dt.datetime.now(dt.timezone.utc).isoformat(timespec="seconds")
+
+
+    def _load_keys(self):
+        rows = self.conn.execute("SELECT id, name FROM detail_keys").fetchall()
+        self.__key_ids = {name: key_id for key_id, name in rows}
+        self.__key_names = {key_id: name for key_id, name in rows}
+
+
+class SqlCheckpointStore(ICheckpointStore):
+    def __init__(self, repository: SqlRepository, name: str):
+        """Crawl progress ``name`` kept in the ``checkpoints`` table of ``repository``."""
+        self.__repository = repository
+        self.__name = name
+
+
+    def load(self) -> Optional[dict]:
+        return self.__repository.load_checkpoint(self.__name)
+
+
+    def save(self, state: dict):
+        self.__repository.save_checkpoint(self.__name, state)
+
+
+    def clear(self):
+        self.__repository.save_checkpoint(self.__name, None)
+
+
+    def save_with_items(self, repository: repo.IDataAccessRepository, items: list[dict],
+                        state: dict) -> Optional[int]:
+        if repository is not self.__repository:
+            return None
+        return self.__repository.upsert_many(items, checkpoint=(self.__name, state))
+
+
+def create_repository(path: str, create_logger: Callable[[str], ILogger], measure_index: bool = False) -> SqlRepository:
+    """Registry factory of .db files and sqlite:// URIs."""
+    return SqlRepository(path, create_logger("SqlRepository"), measure_index=measure_index)
@@ -1,16 +1,182 @@
 from src.interfaces import repository as repo
 from openpyxl import Workbook, load_workbook
 from pathlib import Path
-from typing import Optional, Any
+from typing import Callable, Optional, Any, Iterable, Iterator
+import heapq
+import os
+import time
 
 from src.interfaces.logger import ILogger
+from src.services.content_hash import content_hash
+from src.services.metrics import metrics
+
+PRODUCT_COLUMNS = ["id", "name", "description", "price", "content_hash"]
+_HASH_COLUMN = 5
+
+
+class _WorkbookSession:
+    """
+    A loaded workbook together with an id index over its ``products`` and
+    ``product_details`` sheets, so single products can be read and replaced
+    without scanning or rebuilding the sheets. Writes of an item equal to the stored
+    one (same ``content_hash``) change nothing and return False.
+
+    Detail rows a product no longer needs are blanked and kept in a free list; later
+    writes fill them before appending, so the sheet does not grow with every update.
+    """
+    def __init__(self, wb: Workbook):
+        self.wb = wb
+        self.ws_products = wb["products"]
+        self.ws_details = wb["product_details"]
+        self.product_rows: dict[Any, int] = {}
+        self.detail_rows: dict[Any, list[int]] = {}
+        # A heap, the lowest free row is filled first
+        self.free_detail_rows: list[int] = []
+
+        for row_idx, row in enumerate(self.ws_products.iter_rows(min_row=2, max_col=1, values_only=True), start=2):
+            if row[0] is not None:
+                self.product_rows.setdefault(row[0], row_idx)
+
+        for row_idx, row in enumerate(self.ws_details.iter_rows(min_row=2, max_col=1, values_only=True), start=2):
+            if row[0] is not None:
+                self.detail_rows.setdefault(row[0], []).append(row_idx)
+            else:
+                self.free_detail_rows.append(row_idx)
+
+        # Workbooks created before hashes were kept get the column on their next save
+        if self.ws_products.cell(row=1, column=_HASH_COLUMN).value is None:
+            self.ws_products.cell(row=1, column=_HASH_COLUMN).value = PRODUCT_COLUMNS[_HASH_COLUMN - 1]
+
+
+    def is_unchanged(self, item: dict, product_id: Any) -> bool:
+        row_idx = self.product_rows.get(product_id)
+        return (row_idx is not None and item.get("id") == product_id
+                and self.ws_products.cell(row=row_idx, column=_HASH_COLUMN).value == content_hash(item))
+
+
+    def get(self, product_id: Any) -> Optional[dict]:
+        row_idx = self.product_rows.get(product_id)
+        if row_idx is None:
+            return None
+
+        row = [self.ws_products.cell(row=row_idx, column=col).value for col in range(1, 5)]
+        product: dict[str, Any] = {
+            "id": row[0],
+            "name": row[1],
+            "description": row[2],
+            "price": row[3],
+            "details": []
+        }
+        for d_idx in self.detail_rows.get(product_id, []):
+            key = self.ws_details.cell(row=d_idx, column=2).value
+            value = self.ws_details.cell(row=d_idx, column=3).value
+            product["details"].append({key: value})
+        return product
+
+
+    def insert(self, item: dict):
+        self.ws_products.append([
+            item["id"],
+            item["name"],
+            item["description"],
+            item["price"],
+            content_hash(item)
+        ])
+        self.product_rows.setdefault(item["id"], self.ws_products.max_row)
+        rows = self._write_details(item["id"], item, [])
+        if rows:
+            self.detail_rows.setdefault(item["id"], []).extend(rows)
+
+
+    def update(self, new_item: dict, product_id: Any) -> bool:
+        if self.is_unchanged(new_item, product_id):
+            return False
+
+        # Update main product
+        row_idx = self.product_rows.get(product_id)
+        if row_idx is not None:
+            self.ws_products.cell(row=row_idx, column=2).value = new_item["name"]
+            self.ws_products.cell(row=row_idx, column=3).value = new_item["description"]
+            self.ws_products.cell(row=row_idx, column=4).value = new_item["price"]
+            self.ws_products.cell(row=row_idx, column=_HASH_COLUMN).value = content_hash(new_item)
+
+        # Overwrite the product's own detail rows in place, blank and free the ones left over
+        old_rows = self.detail_rows.get(product_id, [])
+        details_count = sum(len(detail) for detail in new_item.get("details", []))
+        new_rows = self._write_details(product_id, new_item, old_rows[:details_count])
+        for d_idx in old_rows[details_count:]:
+            for col in range(1, 4):
+                self.ws_details.cell(row=d_idx, column=col).value = None
+            heapq.heappush(self.free_detail_rows, d_idx)
+
+        self.detail_rows[product_id] = new_rows
+        return True
+
+
+    def _write_details(self, product_id: Any, item: dict, rows: list[int]) -> list[int]:
+        """
+        Writes the details of ``item`` into ``rows``, then into free rows and appended
+        ones. The rows are filled in sheet order, so the sheet keeps the details in the
+        order of the item.
+
+        :return: The rows of the details.
+        """
+        details = [(key, value) for detail in item.get("details", []) for key, value in detail.items()]
+        rows = list(rows)
+        while len(rows) < len(details) and self.free_detail_rows:
+            rows.append(heapq.heappop(self.free_detail_rows))
+        rows.sort()
+        for d_idx, (key, value) in zip(rows, details):
+            self.ws_details.cell(row=d_idx, column=1).value = product_id
+            self.ws_details.cell(row=d_idx, column=2).value = key
+            self.ws_details.cell(row=d_idx, column=3).value = value
+        for key, value in details[len(rows):]:
+            self.ws_details.append([product_id, key, value])
+            rows.append(self.ws_details.max_row)
+        return rows
+
+
+    def upsert(self, item: dict) -> bool:
+        if item["id"] in self.product_rows:
+            return self.update(item, item["id"])
+        self.insert(item)
+        return True
+
+
+def _in_product_order(product_ids: Iterable[tuple], detail_ids: Iterable[tuple]) -> bool:
+    """True when the detail rows of every product follow each other in the order of the products."""
+    detail_ids = (row[0] for row in detail_ids if row[0] is not None)
+    next_id = next(detail_ids, None)
+    seen: set = set()
+    for (product_id,) in product_ids:
+        if product_id is None or product_id in seen:
+            continue
+        seen.add(product_id)
+        while next_id is not None and next_id == product_id:
+            next_id = next(detail_ids, None)
+    return next_id is None
 
 
 class ExcelRepository(repo.IDataAccessRepository):
-    def __init__(self, file_path: str, logger: ILogger):
+    def __init__(self, file_path: str, logger: ILogger, buffered: bool = False,
+                 flush_every: int = 100, flush_interval: float = 30.0):
+        """
+        Excel (.xlsx) storage with ``products`` and ``product_details`` sheets.
+
+        By default every call loads and saves the workbook. With ``buffered``
+        enabled the workbook is loaded once and kept in memory; changes are
+        written back every ``flush_every`` writes or ``flush_interval``
+        seconds, on ``flush()`` and on ``close()``.
+        """
         self.__logger = logger
         self.__logger.log_debug(f"Repository init successfully")
         self.file_path = file_path
+        self.__buffered = buffered
+        self.__flush_every = flush_every
+        self.__flush_interval = flush_interval
+        self.__session: Optional[_WorkbookSession] = None
+        self.__pending = 0
+        self.__last_flush = time.monotonic()
         self._ensure_workbook()
 
 
@@ -20,7 +186,7 @@ class ExcelRepository(repo.IDataAccessRepository):
             wb = Workbook()
             ws1 = wb.active
             ws1.title = "products"
-            ws1.append(["id", "name", "description", "price"])
+            ws1.append(PRODUCT_COLUMNS)
             ws2 = wb.create_sheet("product_details")
             ws2.append(["product_id", "key", "value"])
             try:
@@ -30,82 +196,202 @@ class ExcelRepository(repo.IDataAccessRepository):
                 self.__logger.log_error(f"def:ensure_workbook - error: {e}")
 
 
+    @metrics.timed("repository_op_seconds", backend="xlsx", op="get_first_or_default")
     def get_first_or_default(self, id_keys: dict[str, str | int]) -> Optional[dict]:
-        wb = load_workbook(self.file_path)
-        ws_products = wb["products"]
-        ws_details = wb["product_details"]
-
-        for row in ws_products.iter_rows(min_row=2, values_only=True):
-            if row[0] == id_keys["id"]:
-                product: dict[str, Any] = {
-                    "id": row[0],
-                    "name": row[1],
-                    "description": row[2],
-                    "price": row[3],
-                    "details": []
-                }
-                for d_row in ws_details.iter_rows(min_row=2, values_only=True):
-                    if d_row[0] == row[0]:
-                        product["details"].append({d_row[1]: d_row[2]})
-                return product
-        return None
+        return self._get_session().get(id_keys["id"])
 
 
+    @metrics.timed("repository_op_seconds", backend="xlsx", op="update")
     def update(self, new_item: dict, id_keys: dict[str, str | int]) -> dict:
-        wb = load_workbook(self.file_path)
-        ws_products = wb["products"]
-        ws_details = wb["product_details"]
-
-        # Update main product
-        for row in ws_products.iter_rows(min_row=2):
-            if row[0].value == id_keys["id"]:
-                row[1].value = new_item["name"]
-                row[2].value = new_item["description"]
-                row[3].value = new_item["price"]
-                break
-
-        # Delete old details
-        details_to_keep: list[Any] = []
-        for row in ws_details.iter_rows(min_row=2):
-            if row[0].value != id_keys["id"]:
-                details_to_keep.append([cell.value for cell in row])
-
-        # Clear sheet and re-add header + retained rows
-        ws_details.delete_rows(2, ws_details.max_row)
-        for row in details_to_keep:
-            ws_details.append(row)
-
-        # Add new details
-        for detail in new_item.get("details", []):
-            for key, value in detail.items():
-                ws_details.append([id_keys["id"], key, value])
-        try:
-            wb.save(self.file_path)
-            self.__logger.log_debug(f"def:update - item {id_keys} update successfully")
-        except Exception as e:
-            self.__logger.log_error(f"def:update - error: {e}")
+        session = self._get_session()
+        if session.update(new_item, id_keys["id"]):
+            self._write(session, "update", f"item {id_keys} update successfully")
+        else:
+            self._skip("update", 1)
         return new_item
 
 
+    @metrics.timed("repository_op_seconds", backend="xlsx", op="insert")
     def insert(self, item: dict) -> dict:
-        wb = load_workbook(self.file_path)
-        ws_products = wb["products"]
-        ws_details = wb["product_details"]
+        session = self._get_session()
+        session.insert(item)
+        self._write(session, "insert", "successfully")
+        return item
 
-        ws_products.append([
-            item["id"],
-            item["name"],
-            item["description"],
-            item["price"]
-        ])
 
-        for detail in item.get("details", []):
-            for key, value in detail.items():
-                ws_details.append([item["id"], key, value])
+    @metrics.timed("repository_op_seconds", backend="xlsx", op="upsert")
+    def upsert(self, item: dict) -> dict:
+        session = self._get_session()
+        if session.upsert(item):
+            self._write(session, "upsert", f"item {item['id']} written successfully")
+        else:
+            self._skip("upsert", 1)
+        return item
+
+
+    @metrics.timed("repository_op_seconds", backend="xlsx", op="upsert_many")
+    def upsert_many(self, items: Iterable[dict]) -> int:
+        session = self._get_session()
+        count = changes = 0
+        for item in items:
+            changes += session.upsert(item)
+            count += 1
+        if count > changes:
+            self._skip("upsert_many", count - changes)
+        if changes:
+            # The whole batch costs a single save
+            self._write(session, "upsert_many", f"{changes} items written successfully", changes)
+        return changes
+
+
+    def iter_items(self) -> Iterator[dict]:
+        """
+        Streams the products in sheet order. The workbook is read in read-only mode, which
+        keeps plain values instead of cell objects.
+
+        When the details follow the order of the products, as ``bulk_insert`` and the
+        conversions write them, both sheets are read side by side and only the product ids
+        are kept in memory; one extra pass over the id columns checks the order first.
+        Updates can move details out of product order, then they are grouped by product
+        in memory.
+        """
+        self.flush()
+        wb = load_workbook(self.file_path, read_only=True)
+        try:
+            products = wb["products"]
+            details_sheet = wb["product_details"]
+            if _in_product_order(products.iter_rows(min_row=2, max_col=1, values_only=True),
+                                 details_sheet.iter_rows(min_row=2, max_col=1, values_only=True)):
+                details_rows = details_sheet.iter_rows(min_row=2, max_col=3, values_only=True)
+                next_detail = next(details_rows, None)
+                yielded: set = set()
+                for product_id, name, description, price in products.iter_rows(min_row=2, max_col=4,
+                                                                               values_only=True):
+                    if product_id is None or product_id in yielded:
+                        continue
+                    yielded.add(product_id)
+                    details = []
+                    while next_detail is not None and next_detail[0] in (product_id, None):
+                        if next_detail[0] is not None:
+                            details.append({next_detail[1]: next_detail[2]})
+                        next_detail = next(details_rows, None)
+                    yield {"id": product_id, "name": name, "description": description, "price": price,
+                           "details": details}
+                return
+
+            grouped: dict[Any, list[dict]] = {}
+            for product_id, key, value in details_sheet.iter_rows(min_row=2, max_col=3, values_only=True):
+                if product_id is not None:
+                    grouped.setdefault(product_id, []).append({key: value})
+            yielded = set()
+            for product_id, name, description, price in products.iter_rows(min_row=2, max_col=4,
+                                                                           values_only=True):
+                # Like get_first_or_default, the first row of an id wins
+                if product_id is not None and product_id not in yielded:
+                    yielded.add(product_id)
+                    yield {"id": product_id, "name": name, "description": description, "price": price,
+                           "details": grouped.pop(product_id, [])}
+        finally:
+            wb.close()
+
+
+    @metrics.timed("repository_op_seconds", backend="xlsx", op="bulk_insert")
+    def bulk_insert(self, items: Iterable[dict], batch_size: int = 1000) -> int:
+        """
+        Into an empty workbook the items are streamed in openpyxl's write-only mode, which
+        writes rows straight to disk; the new workbook then replaces the file. Into a
+        workbook that already has products they are upserted ``batch_size`` at a time.
+        """
+        if not self._is_empty():
+            return super().bulk_insert(items, batch_size)
+
+        wb = Workbook(write_only=True)
+        ws_products = wb.create_sheet("products")
+        ws_details = wb.create_sheet("product_details")
+        ws_products.append(PRODUCT_COLUMNS)
+        ws_details.append(["product_id", "key", "value"])
+        count = 0
+        for item in items:
+            ws_products.append([item["id"], item["name"], item["description"], item["price"], content_hash(item)])
+            for detail in item.get("details", []):
+                for key, value in detail.items():
+                    ws_details.append([item["id"], key, value])
+            count += 1
+
+        temp_file = self.file_path + ".tmp.xlsx"
+        wb.save(temp_file)
+        os.replace(temp_file, self.file_path)
+        # A buffered session still holds the empty workbook
+        self.__session = None
+        self.__pending = 0
+        self.__logger.log_debug(f"def:bulk_insert - {count} items written into {self.file_path}")
+        return count
 
+
+    @metrics.timed("repository_op_seconds", backend="xlsx", op="flush")
+    def flush(self):
+        """Saves buffered changes to the workbook file."""
+        if self.__session is not None and self.__pending:
+            self._save(self.__session, "flush", f"{self.__pending} changes saved")
+
+
+    def close(self):
+        self.flush()
+        self.__session = None
+
+
+    def _is_empty(self) -> bool:
+        if self.__session is not None:
+            return not self.__session.product_rows
+        wb = load_workbook(self.file_path, read_only=True)
         try:
-            wb.save(self.file_path)
-            self.__logger.log_debug(f"def:insert - successfully")
+            return not any(row[0] is not None
+                           for row in wb["products"].iter_rows(min_row=2, max_col=1, values_only=True))
+        finally:
+            wb.close()
+
+
+    def _skip(self, method: str, count: int):
+        metrics.inc("items_unchanged_total", count, backend="xlsx")
+        self.__logger.log_debug(f"def:{method} - {count} unchanged items skipped")
+
+
+    def _get_session(self) -> _WorkbookSession:
+        if self.__session is not None:
+            return self.__session
+        session = _WorkbookSession(load_workbook(self.file_path))
+        if self.__buffered:
+            self.__session = session
+            self.__last_flush = time.monotonic()
+        return session
+
+
+    def _write(self, session: _WorkbookSession, method: str, message: str, changes: int = 1):
+        if not self.__buffered:
+            self._save(session, method, message)
+            return
+
+        self.__pending += changes
+        self.__logger.log_debug(f"def:{method} - {message}")
+        if (self.__pending >= self.__flush_every
+                or time.monotonic() - self.__last_flush >= self.__flush_interval):
+            self.flush()
+
+
+    def _save(self, session: _WorkbookSession, method: str, message: str):
+        try:
+            session.wb.save(self.file_path)
+            self.__pending = 0
+            self.__last_flush = time.monotonic()
+            self.__logger.log_debug(f"def:{method} - {message}")
         except Exception as e:
-            self.__logger.log_error(f"def:insert - error: {e}")
-        return item
\ No newline at end of file
+            self.__logger.log_error(f"def:{method} - error: {e}")
+
+
+def create_repository(path: str, create_logger: Callable[[str], ILogger], flush_every: int = 100,
+                      flush_interval: float = 30.0) -> ExcelRepository:
+    """Registry factory of .xlsx files, always buffered."""
+    return ExcelRepository(path, create_logger("ExcelRepository"),
+                           buffered=True,
+                           flush_every=flush_every,
+                           flush_interval=flush_interval)
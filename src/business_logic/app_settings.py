@@ -31,14 +31,164 @@ class AppSettings:
         return self.settings.get('Logging', {}).get('LogLevel', 'INFO').upper()
 
 
+    @property
+    def log_buffered(self) -> bool:
+        return self.settings.get('Logging', {}).get('Buffered', True)
+
+
     @property
     def scrape_url(self) -> str:
         return self.settings.get('Scrapping', {}).get('Url', '')
 
 
     @property
-    def scrape_interval(self) -> int:
-        return self.settings.get('Scrapping', {}).get('Interval', 0)
+    def scrape_urls(self) -> list[str]:
+        """Category urls from ``Scrapping.Urls``, or the single ``Scrapping.Url``."""
+        urls = self.settings.get('Scrapping', {}).get('Urls', [])
+        if not urls and self.scrape_url:
+            urls = [self.scrape_url]
+        return urls
+
+
+    @property
+    def scrape_processes(self) -> int:
+        return self.settings.get('Scrapping', {}).get('Processes', 0)
+
+
+    @property
+    def scrape_runs(self) -> int:
+        """Complete scrapes before the app exits, 0 = keep scraping."""
+        return self.settings.get('Scrapping', {}).get('Runs', 0)
+
+
+    @property
+    def scrape_interval(self) -> float:
+        """Seconds between requests when no ``RequestsPerSecond`` is set."""
+        return self.settings.get('Scrapping', {}).get('Interval', 2)
+
+
+    @property
+    def scrape_adaptive(self) -> bool:
+        return self.settings.get('Scrapping', {}).get('Adaptive', False)
+
+
+    @property
+    def scrape_max_requests_per_second(self) -> float:
+        return self.settings.get('Scrapping', {}).get('MaxRequestsPerSecond', 10)
+
+
+    @property
+    def scrape_latency_target(self) -> float:
+        return self.settings.get('Scrapping', {}).get('LatencyTarget', 2.0)
+
+
+    @property
+    def scrape_timeout(self) -> float:
+        return self.settings.get('Scrapping', {}).get('Timeout', 30)
+
+
+    @property
+    def scrape_max_retries(self) -> int:
+        return self.settings.get('Scrapping', {}).get('MaxRetries', 5)
+
+
+    @property
+    def scrape_max_retry_after(self) -> float:
+        """Longest Retry-After, in seconds, a request waits for before it gives up."""
+        return self.settings.get('Scrapping', {}).get('MaxRetryAfter', 300)
+
+
+    @property
+    def scrape_prefetch_pages(self) -> int:
+        """Listing pages requested ahead of the one being processed."""
+        return self.settings.get('Scrapping', {}).get('PrefetchPages', 1)
+
+
+    @property
+    def scrape_workers(self) -> int:
+        return self.settings.get('Scrapping', {}).get('Workers', 1)
+
+
+    @property
+    def scrape_requests_per_second(self) -> float:
+        return self.settings.get('Scrapping', {}).get('RequestsPerSecond', 0)
+
+
+    @property
+    def scrape_pool_size(self) -> int:
+        return self.settings.get('Scrapping', {}).get('PoolSize', 10)
+
+
+    @property
+    def http_cache_path(self) -> str:
+        return self.settings.get('Scrapping', {}).get('HttpCachePath', '')
+
+
+    @property
+    def archive_path(self) -> str:
+        return self.settings.get('Scrapping', {}).get('ArchivePath', '')
+
+
+    @property
+    def replay(self) -> bool:
+        return self.settings.get('Scrapping', {}).get('Replay', False)
+
+
+    @property
+    def scrape_parser(self) -> str:
+        return self.settings.get('Scrapping', {}).get('Parser', '')
+
+
+    @property
+    def parse_processes(self) -> int:
+        return self.settings.get('Scrapping', {}).get('ParseProcesses', 0)
+
+
+    @property
+    def incremental(self) -> bool:
+        return self.settings.get('Scrapping', {}).get('Incremental', False)
+
+
+    @property
+    def full_refresh_every(self) -> int:
+        return self.settings.get('Scrapping', {}).get('FullRefreshEvery', 0)
+
+
+    @property
+    def queue_size(self) -> int:
+        return self.settings.get('Scrapping', {}).get('QueueSize', 100)
+
+
+    @property
+    def work_queue_path(self) -> str:
+        """SQLite file of the work queue shared by several scrapper workers, empty when not used."""
+        return self.settings.get('Scrapping', {}).get('WorkQueuePath', '')
+
+
+    @property
+    def work_queue_journal_mode(self) -> str:
+        """DELETE for a queue file on a network volume, which does not support WAL."""
+        return self.settings.get('Scrapping', {}).get('WorkQueueJournalMode', 'WAL')
+
+
+    @property
+    def lease_seconds(self) -> float:
+        return self.settings.get('Scrapping', {}).get('LeaseSeconds', 300)
+
+
+    @property
+    def max_attempts(self) -> int:
+        return self.settings.get('Scrapping', {}).get('MaxAttempts', 5)
+
+
+    @property
+    def checkpoint_every(self) -> int:
+        return self.settings.get('Scrapping', {}).get('CheckpointEvery', 100)
+
+
+    @property
+    def checkpoint_interval(self) -> float:
+        return self.settings.get('Scrapping', {}).get('CheckpointInterval', 30)
 
 
     @property
@@ -48,3 +198,53 @@ class AppSettings:
             return path
         raise KeyError("Json path not provided in settings. Please check appsettings.json file")
 
+
+    @property
+    def db_batch_size(self) -> int:
+        return self.settings.get('DataBase', {}).get('BatchSize', 100)
+
+
+    @property
+    def db_flush_every(self) -> int:
+        return self.settings.get('DataBase', {}).get('FlushEvery', 100)
+
+
+    @property
+    def db_flush_interval(self) -> float:
+        return self.settings.get('DataBase', {}).get('FlushInterval', 30)
+
+
+    @property
+    def db_store_progress(self) -> bool:
+        return self.settings.get('DataBase', {}).get('StoreProgress', False)
+
+
+    @property
+    def db_measure_index(self) -> bool:
+        return self.settings.get('DataBase', {}).get('MeasureIndex', False)
+
+
+    @property
+    def db_segment_size(self) -> int:
+        """Segment size in MB of a segmented .jsonl database, 0 = a single file."""
+        return self.settings.get('DataBase', {}).get('SegmentSize', 0)
+
+
+    @property
+    def db_compression(self) -> str:
+        return self.settings.get('DataBase', {}).get('Compression', 'gzip')
+
+
+    @property
+    def metrics_stats_path(self) -> str:
+        return self.settings.get('Metrics', {}).get('StatsPath', '')
+
+
+    @property
+    def metrics_interval(self) -> float:
+        return self.settings.get('Metrics', {}).get('Interval', 10)
+
+
+    @property
+    def metrics_prometheus_port(self) -> int:
+        return self.settings.get('Metrics', {}).get('PrometheusPort', 0)
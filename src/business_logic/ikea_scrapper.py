@@ -1,31 +1,225 @@
-from typing import Generator, Optional, Any
+from typing import Generator, AsyncGenerator, Optional, Any, Callable, Mapping
 
+from src.interfaces.async_transport import IAsyncTransport, TransportResponse
 from src.interfaces.logger import ILogger
-from src.interfaces.web_scrapper import IWebScrapper
+from src.interfaces.web_scrapper import IStagedWebScrapper
+from src.interfaces.work_queue import IWorkQueue, WorkItem
+from src.services.checkpoint import Checkpointer, JsonCheckpointStore
+from src.services.fingerprint_store import FingerprintStore
+from src.services.http_cache import HttpCache
+from src.services.http_transport import create_async_transport
+from src.services.metrics import metrics
+from src.services.page_archive import PageArchive
+from src.services.parse_pool import ParsePool
+from src.services.rate_limiter import TokenBucket
+from concurrent.futures import Future, ThreadPoolExecutor
+import asyncio
+import datetime as dt
+import email.utils
+import math
+import os
+import random
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from bs4 import BeautifulSoup, Tag, SoupStrainer
+from bs4.builder import builder_registry
+import soupsieve
 from urllib.parse import urlparse
+import socket
 import time
-import json
-import os
+import uuid
+
+
+# CSS selectors are compiled once instead of on every select() call
+_CARDS_SELECTOR = soupsieve.compile("#productFilterList > div > div.container.p-0 > div > div > div")
+_CARD_LINK_SELECTOR = soupsieve.compile("div.card-body > div.itemInfo.v2-b > a")
+_CARD_DESCRIPTION_SELECTOR = soupsieve.compile("div.card-body > div.itemInfo.v2-b > h4")
+_CARD_PRICE_SELECTOR = soupsieve.compile("div.itemPrice-wrapper p.itemNormalPrice span[data-price]")
+_PAGE_COUNTER_SELECTOR = soupsieve.compile("span.showing_current_max")
+_MODAL_SIZE_SELECTOR = soupsieve.compile("#modal-product-size")
+_TABLE_BODY_SELECTOR = soupsieve.compile("tbody")
+_ROW_SELECTOR = soupsieve.compile("tr")
+_CELL_SELECTOR = soupsieve.compile("td")
+_ITEM_CODE_SELECTOR = soupsieve.compile("span.item-code")
+
+
+class _ScopeStrainer(SoupStrainer):
+    def __init__(self, *rules: tuple[Optional[str], str, str]):
+        """
+        Lets the parser build only the subtrees whose root tag matches one of the
+        ``(tag name or None, attribute, value)`` rules. Everything else in the
+        document is discarded while parsing, so it never becomes a Tag object.
+        """
+        super().__init__()
+        self.__rules = rules
+
+
+    @property
+    def includes_everything(self) -> bool:
+        return False
+
+
+    @property
+    def excludes_everything(self) -> bool:
+        return False
 
 
-class IkeaScrapper(IWebScrapper):
-    def __init__(self, url:str, logger: ILogger, headers: Optional[dict] = None, time_delay: int = 2 ):
+    def allow_tag_creation(self, nsprefix: Optional[str], name: str, attrs: Optional[dict]) -> bool:
+        attrs = attrs or {}
+        for rule_name, attr, value in self.__rules:
+            if rule_name and rule_name != name:
+                continue
+            attr_value = attrs.get(attr)
+            if attr_value is None:
+                continue
+            values = attr_value.split() if isinstance(attr_value, str) else attr_value
+            if value in values:
+                return True
+        return False
+
+
+# Listing pages only need the product list and the pagination counter, detail pages only the size modal
+_LISTING_SCOPE = _ScopeStrainer((None, "id", "productFilterList"), ("span", "class", "showing_current_max"))
+_DETAIL_SCOPE = _ScopeStrainer((None, "id", "modal-product-size"))
+
+
+def resolve_parser(parser: Optional[str] = None) -> str:
+    """
+    Returns the BeautifulSoup tree builder to use: ``parser`` when it is installed,
+    otherwise lxml when available and the built-in html.parser as the last resort.
+    """
+    if parser and builder_registry.lookup(parser):
+        return parser
+    return "lxml" if builder_registry.lookup("lxml") else "html.parser"
+
+
+# A listing card's item with the link of its detail page
+Card = tuple[dict, Optional[str]]
+# A listing card with its downloaded, not yet parsed detail page response
+RawItem = tuple[dict, Optional[str], Optional[requests.Response | TransportResponse]]
+
+
+class IkeaScrapper(IStagedWebScrapper):
+    def __init__(self, url:str, logger: ILogger, headers: Optional[dict] = None, time_delay: float = 2,
+                 max_workers: int = 1, rate_limiter: Optional[TokenBucket] = None,
+                 transport: Optional[IAsyncTransport] = None,
+                 state_file: str = ".\\src\\business_logic\\ikea_scraper_state.json",
+                 http_cache: Optional[HttpCache] = None, pool_size: int = 10,
+                 archive: Optional[PageArchive] = None, replay: bool = False,
+                 parser: Optional[str] = None,
+                 fingerprints: Optional[FingerprintStore] = None, full_refresh_every: int = 0,
+                 parse_pool: Optional[ParsePool] = None, checkpointer: Optional[Checkpointer] = None,
+                 timeout: float = 30.0, max_retries: int = 5, backoff: float = 1.0, max_backoff: float = 60.0,
+                 max_retry_after: float = 300.0, prefetch_pages: int = 1, work_queue: Optional[IWorkQueue] = None,
+                 worker_id: Optional[str] = None, poll_interval: float = 1.0):
         """
         A web scraper for IKEA product listings.
 
         This class handles parsing the base URL, managing HTTP headers,
         applying a request delay, and maintaining scraping state across sessions.
         It uses a logger to track progress and errors.
+
+        With ``max_workers`` above 1 the detail pages of a listing page are fetched
+        in parallel, while items are still yielded in page order. All requests go
+        through ``rate_limiter``; by default it allows one request per ``time_delay``
+        seconds. Pass the same limiter to several scrappers to share one budget. The
+        limiter is told the outcome of every request, so an ``AdaptiveRateLimiter``
+        tunes the rate to what the site answers well.
+
+        A request fails after ``timeout`` seconds. Connection errors, timeouts, 408,
+        429 and 5xx answers are retried up to ``max_retries`` attempts in all, waiting
+        as long as the site's ``Retry-After`` asks or else a random time up to
+        ``backoff`` seconds doubled with every attempt (at most ``max_backoff``). A
+        ``Retry-After`` longer than ``max_retry_after`` seconds is not waited for, the
+        request fails right away. Other error statuses are not retried.
+
+        While the detail pages of a listing page are fetched, up to ``prefetch_pages``
+        following listing pages are already requested, never beyond the page count the
+        first listing page's counter ("Rodoma 24 iš 120") gives. They go through the same
+        rate limiter as every other request, and in ``apage_items`` they also take one of
+        the ``max_workers`` request slots. A resumed run prefetches from its saved page.
+
+        ``apage_items`` is the asyncio counterpart of ``page_items``. It sends requests
+        through ``transport`` (aiohttp when installed by default) and keeps up to
+        ``max_workers`` detail requests of a page in flight.
+
+        Synchronous requests share one keep-alive session with a connection pool of
+        ``pool_size`` connections. When ``http_cache`` is given, detail pages are
+        revalidated with their stored ETag/Last-Modified and a 304 answer reuses the
+        previously extracted details.
+
+        With ``work_queue`` several scrappers, in other processes or on other machines,
+        share one crawl. Listing pages put the detail pages of their cards (and the
+        following listing pages) into the queue, and every scrapper leases up to
+        ``max_workers`` queued pages at a time as ``worker_id`` (host name, process id and
+        a random suffix by default). A detail page that fails is retried later, by any
+        worker; the lease of an item is acked once the item is committed as stored, so the
+        items of a worker that dies, or that fails to store them, are fetched again. While other
+        workers still hold leases, the queue is polled every ``poll_interval`` seconds.
+        The crawl is completed when the queue is drained, and ``clear_state`` empties the
+        queue for the next one. ``apage_items`` does not support a work queue.
+
+        Every page fetched is recorded into ``archive`` when one is given. With ``replay``
+        enabled no requests are sent at all: pages are read back from the archive and run
+        through the same parsing code without any delay, which makes it cheap to
+        re-extract fields after a parsing fix. Pages missing from the archive are skipped.
+
+        ``parser`` selects the BeautifulSoup backend (lxml by default when installed).
+        Only the parts of a page the scrapper reads are turned into a tree.
+
+        With ``fingerprints`` the scrape is incremental: a product whose listing card
+        (name, description, price) matches the fingerprint stored for its detail URL
+        is skipped without fetching its detail page. Every ``full_refresh_every``-th
+        run (0 = never) fetches all products again. Fingerprints are recorded only once
+        their items are committed (see ``checkpointer``), and a run counts as completed
+        once all of its items are, so products lost in a crash are fetched again.
+
+        With ``parse_pool`` the fetched pages are parsed in its worker processes, which
+        get the raw page bytes and return plain dicts, so parsing scales with the CPU
+        cores instead of being serialized by the GIL.
+
+        Resume state goes through ``checkpointer``. Its owner commits the items once
+        they are stored, so a resume neither skips nor repeats them. Without one, the
+        state is kept in ``state_file`` and an item counts as done as soon as the
+        consumer asks for the next one; the file is rewritten atomically, at most
+        every 100 items or 30 seconds and when the scrape ends or stops.
         """
         parsed_url = urlparse(url)
         self.__is_completed = False
         self.__logger = logger
-        self.__base_url = f"{parsed_url.scheme}://{parsed_url.hostname}"
+        self.__base_url = f"{parsed_url.scheme}://{parsed_url.netloc}"
         self.__rel_path = parsed_url.path
-        self.__time_delay = time_delay
-        self.__state_file = ".\\src\\business_logic\\ikea_scraper_state.json"
+        self.__max_workers = max(max_workers, 1)
+        if rate_limiter:
+            self.__rate_limiter = rate_limiter
+        else:
+            self.__rate_limiter = TokenBucket(1 / time_delay if time_delay > 0 else 0)
+        self.__transport = transport
+        self.__timeout = timeout
+        self.__max_retries = max(max_retries, 1)
+        self.__backoff = backoff
+        self.__max_backoff = max_backoff
+        self.__max_retry_after = max_retry_after
+        self.__prefetch_pages = max(prefetch_pages, 0)
+        self.__page_count: Optional[int] = None
+        self.__work_queue = work_queue
+        self.__worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.__poll_interval = poll_interval
+        self.__http_cache = http_cache
+        self.__archive = archive
+        self.__fingerprints = fingerprints
+        self.__full_refresh_every = full_refresh_every
+        self.__full_run = True
+        self.__parser = resolve_parser(parser)
+        self.__parse_pool = parse_pool
+        if parser and parser != self.__parser:
+            self.__logger.log_warning(f"Parser {parser} is not installed, using {self.__parser}")
+        self.__replay = replay
+        if replay and archive is None:
+            raise ValueError("Replay mode requires an archive")
+        self.__auto_commit = checkpointer is None
+        self.__checkpointer = checkpointer or Checkpointer(JsonCheckpointStore(state_file))
         self.__current_page = 1
         self.__current_item = 0
         if headers:
@@ -36,16 +230,61 @@ class IkeaScrapper(IWebScrapper):
                           " (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
             "Accept-Language": "lt",
-            "Accept-Encoding": "gzip, deflate",
+            # Includes br/zstd when the brotli/zstandard decoders are installed
+            "Accept-Encoding": ACCEPT_ENCODING.replace(",", ", "),
             "Connection": "keep-alive",
             "Upgrade-Insecure-Requests": "1"
         }
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=max(pool_size, self.__max_workers))
+        self.__session.mount("https://", adapter)
+        self.__session.mount("http://", adapter)
 
 
     def page_items(self) -> Generator[dict, None, None]:
-        for item in self._get_all_items(self.__base_url + self.__rel_path):
-            yield item
-        self.__is_completed = True
+        try:
+            for item in self._get_all_items(self.__base_url + self.__rel_path):
+                yield item
+            self._complete_run()
+            self.__is_completed = True
+        finally:
+            self._flush_state()
+
+
+    def raw_page_items(self) -> Generator[RawItem, None, None]:
+        try:
+            for raw_item in self._get_all_items(self.__base_url + self.__rel_path, parse=False):
+                yield raw_item
+            self._complete_run()
+            self.__is_completed = True
+        finally:
+            self._flush_state()
+
+
+    def parse_raw_item(self, raw_item: RawItem) -> dict:
+        item, details_link, response = raw_item
+        if details_link:
+            data = self._to_item_data(self.__base_url + details_link, response) if response is not None else None
+            self._fill_item(item, details_link, data)
+        else:
+            # Warn if item link is missing — likely means incomplete or malformed HTML
+            self.__logger.log_warning(f"Item has no details {item}")
+        return item
+
+
+    async def apage_items(self) -> AsyncGenerator[dict, None]:
+        if self.__work_queue is not None:
+            raise ValueError("A work queue is only supported by page_items and raw_page_items")
+        transport = self.__transport or create_async_transport(self.__timeout)
+        try:
+            async for item in self._aget_all_items(self.__base_url + self.__rel_path, transport):
+                yield item
+            self._complete_run()
+            self.__is_completed = True
+        finally:
+            self._flush_state()
+            if transport is not self.__transport:
+                await transport.close()
 
     @property
     def is_completed(self) -> bool:
@@ -53,86 +292,415 @@ class IkeaScrapper(IWebScrapper):
 
 
     def clear_state(self):
-        if os.path.exists(self.__state_file):
-            os.remove(self.__state_file)
+        self.__checkpointer.clear()
+        if self.__work_queue is not None:
+            self.__work_queue.clear()
         self.__is_completed = False
 
 
-    def _save_state(self):
-        with open(self.__state_file, "w") as f:
-            json.dump({
-                "page_number": self.__current_page,
-                "item_number": self.__current_item
-            }, f)
+    def _state(self, item_number: int) -> dict:
+        return {"page_number": self.__current_page, "item_number": item_number}
+
+
+    def _track_item(self, on_stored: Optional[Callable[[], None]] = None) -> int:
+        # Resuming after this item starts with the next card of the page
+        return self.__checkpointer.track(self._state(self.__current_item + 1), on_stored)
+
+
+    def _fingerprint_update(self, card: Card) -> Optional[Callable[[], None]]:
+        """Returns what records the fingerprint of the card's item once it is stored, if anything."""
+        item, details_link = card
+        fingerprints = self.__fingerprints
+        if fingerprints is None or not details_link:
+            return None
+
+        def update():
+            # The item of the card is the one its details were filled into
+            if item.get("id"):
+                fingerprints.update(details_link, item)
+        return update
+
+
+    def _commit_item(self, count: int):
+        if self.__auto_commit:
+            self.__checkpointer.commit(count)
+
+
+    def _flush_state(self):
+        if self.__auto_commit:
+            self.__checkpointer.flush()
 
 
     def _load_state(self):
-        if os.path.exists(self.__state_file):
-            with open(self.__state_file, "r") as f:
-                data = json.load(f)
-                self.__current_page = data.get("page_number", 1)
-                self.__current_item = data.get("item_number", 0)
+        data = self.__checkpointer.load() or {}
+        self.__current_page = data.get("page_number", 1)
+        self.__current_item = data.get("item_number", 0)
 
 
-    def _get_all_items(self, url: str) -> Generator[dict, None, None]:
+    def _start_run(self):
+        self.__checkpointer.start()
         self._load_state()
+        self.__page_count = None
+        if self.__fingerprints is None:
+            self.__full_run = True
+        else:
+            self.__full_run = (self.__full_refresh_every > 0 and
+                               self.__fingerprints.incremental_runs + 1 >= self.__full_refresh_every)
+            self.__logger.log_info(f"Starting {'full' if self.__full_run else 'incremental'} run")
+
+
+    def _complete_run(self):
+        if self.__fingerprints is not None:
+            fingerprints, full_run = self.__fingerprints, self.__full_run
+            self.__checkpointer.after_stored(lambda: fingerprints.complete_run(full_run))
+
+
+    def _get_all_items(self, url: str, parse: bool = True) -> Generator[dict | RawItem, None, None]:
+        if self.__work_queue is not None:
+            yield from self._get_queued_items(url, parse)
+            return
+        self._start_run()
+        prefetcher = (ThreadPoolExecutor(max_workers=self.__prefetch_pages, thread_name_prefix="listing-prefetch")
+                      if self.__prefetch_pages else None)
+        listings: dict[int, Future] = {}
+
+        try:
+            while True:
+                req_url = self._get_page_url(url)
+                self.__logger.log_info(f"Processing page Nr.: {self.__current_page}, url: {req_url}")
+
+                prefetched = listings.pop(self.__current_page, None)
+                listing = prefetched.result() if prefetched else self._get_listing(req_url)
+                if not listing:
+                    self.__logger.log_error(f"Can't get page {req_url}")
+                    break
+
+                if prefetcher:
+                    for page in self._pages_to_prefetch(listing, listings):
+                        listings[page] = prefetcher.submit(self._get_listing, self._get_page_url(url, page))
+
+                for card, i in self._get_page_items(listing, parse):
+                    if parse:
+                        self.__logger.log_debug(f"Item {i.get('id')} complete")
+                    count = self._track_item(self._fingerprint_update(card))
+                    yield i
+                    self._commit_item(count)
+                self._save_page_caches()
+
+                if listing["has_next_page"]:
+                    self._next_page()
+                    continue
+                break
+        finally:
+            if prefetcher:
+                prefetcher.shutdown(wait=True, cancel_futures=True)
+
+
+    def _get_queued_items(self, url: str, parse: bool = True) -> Generator[dict | RawItem, None, None]:
+        """Works through the shared work queue until it is drained, together with the other workers."""
+        self._start_run()
+        self.__current_item = 0  # Cards are queued per item, a resume state is not used
+        queue = self.__work_queue
+        queue.enqueue([(self._get_page_url(url, 1), {"page": 1})], kind="listing")
+        task = self._add_item_details if parse else self._fetch_item
+
+        executor = ThreadPoolExecutor(max_workers=self.__max_workers) if self.__max_workers > 1 else None
+        # Leases not acked yet, items waiting to be stored included
+        held: set[int] = set()
+        try:
+            while True:
+                leased = queue.lease(self.__worker_id, self.__max_workers)
+                held.update(work.id for work in leased)
+                if not leased:
+                    if queue.is_drained():
+                        break
+                    # Other workers still hold leases, or failed pages wait for their retry
+                    time.sleep(self.__poll_interval)
+                    continue
+
+                for work in leased:
+                    if work.kind == "listing":
+                        self._process_queued_listing(url, work)
+                details = [work for work in leased if work.kind == "detail"]
+                jobs = [(task, work) for work in details]
+                results = executor.map(self._run_queued_item, jobs) if executor else map(self._run_queued_item, jobs)
+                for work, item in zip(details, results):
+                    if item is None:
+                        continue
+                    if parse:
+                        self.__logger.log_debug(f"Item {item.get('id')} complete")
+                    # The queue keeps the progress, the tracked state is left empty
+                    count = self.__checkpointer.track(None, self._ack_when_stored(work, held))
+                    yield item
+                    self._commit_item(count)
+                self._save_page_caches()
+        finally:
+            if executor:
+                executor.shutdown(wait=True, cancel_futures=True)
+            # Leases not finished yet go back to the queue now instead of when they expire
+            queue.release(list(held), self.__worker_id)
+
+
+    def _ack_when_stored(self, work: WorkItem, held: set[int]) -> Callable[[], None]:
+        """Returns what acks the lease of a detail page and records its fingerprint once its item is stored."""
+        update = self._fingerprint_update((work.payload["item"], work.payload["link"]))
+
+        def ack():
+            self.__work_queue.ack(work.id, self.__worker_id)
+            held.discard(work.id)
+            if update:
+                update()
+        return ack
+
+
+    def _process_queued_listing(self, url: str, work: WorkItem):
+        """Queues the cards of a leased listing page and the listing pages after it."""
+        page = work.payload["page"]
+        self.__logger.log_info(f"Processing page Nr.: {page}, url: {work.url}")
+        try:
+            listing = self._get_listing(work.url)
+        except requests.HTTPError as e:
+            self.__work_queue.fail(work.id, self.__worker_id, str(e))
+            return
+        if not listing:
+            self.__logger.log_error(f"Can't get page {work.url}")
+        else:
+            # Cards without a details link still need a unique key in the queue
+            self.__work_queue.enqueue([(link or f"{work.url}#{i}", {"item": item, "link": link})
+                                       for i, (item, link) in self._get_page_cards(listing)], kind="detail")
+            if listing["has_next_page"]:
+                last = page + 1
+                if listing["item_count"] and listing["cards"]:
+                    # Every worker can lease the later pages right away instead of one page at a time
+                    last = max(last, math.ceil(listing["item_count"] / len(listing["cards"])))
+                self.__work_queue.enqueue([(self._get_page_url(url, p), {"page": p})
+                                           for p in range(page + 1, last + 1)], kind="listing")
+        self.__work_queue.ack(work.id, self.__worker_id)
+
+
+    def _run_queued_item(self, job: tuple[Callable, WorkItem]) -> Optional[dict | RawItem]:
+        task, work = job
+        try:
+            return task((work.payload["item"], work.payload["link"]))
+        except requests.HTTPError as e:
+            self.__work_queue.fail(work.id, self.__worker_id, str(e))
+            return None
+
+
+    async def _aget_all_items(self, url: str, transport: IAsyncTransport) -> AsyncGenerator[dict, None]:
+        self._start_run()
+        semaphore = asyncio.Semaphore(self.__max_workers)
+        listings: dict[int, asyncio.Future] = {}
+
+        try:
+            while True:
+                req_url = self._get_page_url(url)
+                self.__logger.log_info(f"Processing page Nr.: {self.__current_page}, url: {req_url}")
+
+                prefetched = listings.pop(self.__current_page, None)
+                listing = await (prefetched or self._aget_listing(req_url, transport))
+                if not listing:
+                    self.__logger.log_error(f"Can't get page {req_url}")
+                    break
+
+                if self.__prefetch_pages:
+                    for page in self._pages_to_prefetch(listing, listings):
+                        listings[page] = asyncio.ensure_future(
+                            self._aprefetch_listing(self._get_page_url(url, page), transport, semaphore))
+
+                cards = self._get_page_cards(listing)
+                tasks = [asyncio.ensure_future(self._aadd_item_details(card, transport, semaphore))
+                         for _, card in cards]
+                try:
+                    # Tasks run concurrently, but are awaited in page order so the resume state stays correct
+                    for (i, card), task in zip(cards, tasks):
+                        item = await task
+                        self.__current_item = i
+                        self.__logger.log_debug(f"Item {item.get('id')} complete")
+                        count = self._track_item(self._fingerprint_update(card))
+                        yield item
+                        self._commit_item(count)
+                finally:
+                    for task in tasks:
+                        task.cancel()
+                self._save_page_caches()
+
+                if listing["has_next_page"]:
+                    self._next_page()
+                    continue
+                break
+        finally:
+            for prefetched in listings.values():
+                prefetched.cancel()
+
 
-        while True:
-            req_url = f"{url}?&product-room=product&page={self.__current_page}&order=RECOMMENDED"
-            self.__logger.log_info(f"Processing page Nr.: {self.__current_page}, url: {req_url}")
+    def _get_page_url(self, url: str, page: Optional[int] = None) -> str:
+        return f"{url}?&product-room=product&page={page or self.__current_page}&order=RECOMMENDED"
+
+
+    def _pages_to_prefetch(self, listing: dict, scheduled: dict) -> list[int]:
+        """Returns the listing pages after the current one to request now, up to ``prefetch_pages`` ahead."""
+        if not listing["has_next_page"]:
+            return []
+        if self.__page_count is None and listing["item_count"] and listing["cards"]:
+            # A page with a next page is full, so its size divides the counter's total
+            self.__page_count = math.ceil(listing["item_count"] / len(listing["cards"]))
+            self.__logger.log_info(f"Listing has {self.__page_count} pages")
+        last = self.__current_page + self.__prefetch_pages
+        if self.__page_count is not None:
+            last = min(last, self.__page_count)
+        return [page for page in range(self.__current_page + 1, last + 1) if page not in scheduled]
+
+
+    def _next_page(self):
+        self.__current_page += 1
+        self.__current_item = 0
+        self.__checkpointer.advance(self._state(0))
+
+
+    @staticmethod
+    def _get_item_count(soup: BeautifulSoup) -> Optional[int]:
+        """Returns the total of the page counter ("Rodoma 24 iš 120"), if the page has one."""
+        page_counter = _PAGE_COUNTER_SELECTOR.select_one(soup)
+        if page_counter:
+            val = page_counter.text.strip().split()
+            if val and val[-1].isdigit():
+                return int(val[-1])
+        return None
+
+
+    @staticmethod
+    def _has_next_page(soup: BeautifulSoup) -> bool:
+        page_counter = _PAGE_COUNTER_SELECTOR.select_one(soup)
+        if page_counter:
+            val = page_counter.text.strip().split()
+            # Checks if the last number is a new maximum and a digit
+            return val[-1].isdigit() and not any([x == val[-1] for x in val[:-1]])
+        return False
 
-            soup = self._get_soup(req_url)
-            if not soup:
-                self.__logger.log_error(f"Can't get page {req_url}")
+
+    @staticmethod
+    def _get_card_tags(soup: BeautifulSoup) -> list[Tag]:
+        return _CARDS_SELECTOR.select(soup)
+
+
+    def _get_page_cards(self, listing: dict) -> list[tuple[int, tuple[dict, Optional[str]]]]:
+        """Returns the not yet processed cards of a listing page with their index on the page."""
+        cards: list[tuple[int, tuple[dict, Optional[str]]]] = []
+        for i, card in enumerate(listing["cards"]):
+            if i < self.__current_item:
+                continue
+            item, details_link = card
+            if (not self.__full_run and details_link
+                    and self.__fingerprints.is_unchanged(details_link, item)):
+                self.__logger.log_debug(f"Item {details_link} unchanged, skipped")
                 continue
+            cards.append((i, card))
+        return cards
 
-            for i in self._get_page_items(soup):
-                self.__logger.log_debug(f"Item {i['id']} complete")
-                yield i
-                self._save_state()
-
-            page_counter = soup.select_one('span.showing_current_max')
-            if page_counter:
-                val = page_counter.text.strip().split()
-                # Checks if the last number is a new maximum and a digit
-                if val[-1].isdigit() and not any([x == val[-1] for x in val[:-1]]):
-                    self.__current_page += 1
-                    self.__current_item = 0
-                    self._save_state()
-                    continue
-            break
-
-
-    def _get_page_items(self, soup: BeautifulSoup) -> Generator[dict, None, None]:
-        items = soup.select("#productFilterList > div > div.container.p-0 > div > div > div")
-        start_index = self.__current_item
-
-        for i in range(start_index, len(items)):
-            a_tag = items[i].select_one("div.card-body > div.itemInfo.v2-b > a")
-            description_tag = items[i].select_one("div.card-body > div.itemInfo.v2-b > h4")
-            price_tag = items[i].select_one("div.itemPrice-wrapper p.itemNormalPrice span[data-price]")
-
-            item: dict[str, Any] = {
-                "name": a_tag.get_text(strip=True) if a_tag else "",
-                "description": description_tag.get_text(strip=True) if description_tag else "",
-                "price": price_tag.get("data-price") if price_tag else "",
-                "details": []
-            }
-
-            if a_tag:
-                details_link = a_tag.get("href")
-                d_soup = self._get_soup(self.__base_url + str(details_link))
-                if not d_soup:
-                    self.__logger.log_error(f"Can't get item details page {details_link}")
-                else:
-                    item["details"] = self._get_item_details(d_soup)
-                    item["id"] = self._get_item_id(d_soup)
+
+    def _get_page_items(self, listing: dict, parse: bool = True) -> Generator[tuple[Card, dict | RawItem], None, None]:
+        """Yields the not yet processed cards of a listing page, each with its item or raw item."""
+        cards = self._get_page_cards(listing)
+        task = self._add_item_details if parse else self._fetch_item
+
+        executor = ThreadPoolExecutor(max_workers=self.__max_workers) if self.__max_workers > 1 else None
+        try:
+            # Both map variants keep the page order, so the resume state stays correct
+            if executor:
+                results = executor.map(task, [card for _, card in cards])
             else:
-                # Warn if item link is missing — likely means incomplete or malformed HTML
-                self.__logger.log_warning(f"Item has no details {item}")
+                results = map(task, [card for _, card in cards])
 
-            self.__current_item = i  # Updates index to allow resuming from current position
-            yield item
+            for (i, card), item in zip(cards, results):
+                self.__current_item = i  # Updates index to allow resuming from current position
+                yield card, item
+        finally:
+            if executor:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+
+    @staticmethod
+    def _get_card(card_tag: Tag) -> tuple[dict, Optional[str]]:
+        a_tag = _CARD_LINK_SELECTOR.select_one(card_tag)
+        description_tag = _CARD_DESCRIPTION_SELECTOR.select_one(card_tag)
+        price_tag = _CARD_PRICE_SELECTOR.select_one(card_tag)
+
+        item: dict[str, Any] = {
+            "name": a_tag.get_text(strip=True) if a_tag else "",
+            "description": description_tag.get_text(strip=True) if description_tag else "",
+            "price": price_tag.get("data-price") if price_tag else "",
+            "details": []
+        }
+        return item, str(a_tag.get("href")) if a_tag else None
+
+
+    def _add_item_details(self, card: tuple[dict, Optional[str]]) -> dict:
+        return self.parse_raw_item(self._fetch_item(card))
+
+
+    def _fetch_item(self, card: tuple[dict, Optional[str]]) -> RawItem:
+        item, details_link = card
+        if not details_link:
+            return item, details_link, None
+        req_url = self.__base_url + details_link
+        return item, details_link, self._get_response(req_url, self._conditional_headers(req_url))
+
+
+    async def _aadd_item_details(self, card: tuple[dict, Optional[str]], transport: IAsyncTransport,
+                                 semaphore: asyncio.Semaphore) -> dict:
+        item, details_link = card
+        if details_link:
+            async with semaphore:
+                data = await self._aget_item_data(self.__base_url + details_link, transport)
+            self._fill_item(item, details_link, data)
+        else:
+            # Warn if item link is missing — likely means incomplete or malformed HTML
+            self.__logger.log_warning(f"Item has no details {item}")
+        return item
+
+
+    def _fill_item(self, item: dict, details_link: str, data: Optional[dict]):
+        if not data:
+            self.__logger.log_error(f"Can't get item details page {details_link}")
+        else:
+            item["details"] = list(data["details"])
+            item["id"] = data["id"]
+
+
+    async def _aget_item_data(self, req_url: str, transport: IAsyncTransport) -> Optional[dict]:
+        response = await self._aget_response(req_url, transport, self._conditional_headers(req_url))
+        if self.__parse_pool:
+            # Waiting for the parse worker must not block the event loop
+            return await asyncio.to_thread(self._to_item_data, req_url, response)
+        return self._to_item_data(req_url, response)
+
+
+    def _conditional_headers(self, req_url: str) -> dict[str, str]:
+        return self.__http_cache.conditional_headers(req_url) if self.__http_cache else {}
+
+
+    def _to_item_data(self, req_url: str, response: requests.Response | TransportResponse) -> Optional[dict]:
+        if response.status_code == 404:
+            return None  # Only returned in replay mode, for pages missing from the archive
+        if response.status_code == 304 and self.__http_cache:
+            data = self.__http_cache.get(req_url)
+            if data is not None:
+                # Not modified, neither the download nor the parse is needed
+                self.__logger.log_debug(f"Item details not modified {req_url}")
+                return data
+
+        data = self._parse(parse_detail_page, response.content, "detail")
+        if self.__http_cache:
+            self.__http_cache.store(req_url, response.headers, data)
+        return data
+
+
+    def _save_page_caches(self):
+        if self.__http_cache:
+            self.__http_cache.save()
+        if self.__fingerprints is not None:
+            self.__fingerprints.save()
 
 
     @staticmethod
@@ -140,19 +708,19 @@ class IkeaScrapper(IWebScrapper):
         item_details: list[dict[str,str]] = []
 
         # Find the product size. PopUp window in web
-        modal_size_tag = d_soup.select_one("#modal-product-size")
+        modal_size_tag = _MODAL_SIZE_SELECTOR.select_one(d_soup)
         if not modal_size_tag:
             return item_details  # Return empty list if the modal is not found
 
         # Find the first <tbody> within the modal
-        first_table = modal_size_tag.select_one("tbody")
+        first_table = _TABLE_BODY_SELECTOR.select_one(modal_size_tag)
         if not first_table:
             return item_details  # Return empty list if no table is found
 
         # Select all rows in the table
-        rows = first_table.select("tr")
+        rows = _ROW_SELECTOR.select(first_table)
         for row in rows:
-            td = row.select("td")
+            td = _CELL_SELECTOR.select(row)
             # Ensure the row has exactly two columns
             if len(td) == 2:
                 key = td[0].text.strip().rstrip(":")  # Remove trailing colon
@@ -164,30 +732,230 @@ class IkeaScrapper(IWebScrapper):
 
     @staticmethod
     def _get_item_id(d_soup: BeautifulSoup) -> Optional[str]:
-        modal_size_tag = d_soup.select_one("#modal-product-size")
+        modal_size_tag = _MODAL_SIZE_SELECTOR.select_one(d_soup)
         if modal_size_tag:
-            id_tag = modal_size_tag.select_one("span.item-code")
+            id_tag = _ITEM_CODE_SELECTOR.select_one(modal_size_tag)
             if id_tag:
                 return id_tag.get_text(strip=True)
         return None
 
 
-    def _get_soup(self, req_url: str) -> Optional[BeautifulSoup]:
-        max_retries = 5
-        for attempt in range(1, max_retries + 1):
-            response = requests.get(req_url, headers=self.__headers)
+    def _get_listing(self, req_url: str) -> Optional[dict]:
+        response = self._get_response(req_url)
+        if response.status_code == 404:
+            return None
+        return self._parse(parse_listing_page, response.content, "listing")
+
+
+    async def _aget_listing(self, req_url: str, transport: IAsyncTransport) -> Optional[dict]:
+        response = await self._aget_response(req_url, transport)
+        if response.status_code == 404:
+            return None
+        with metrics.timer("parse_seconds", page="listing"):
+            if self.__parse_pool:
+                return await asyncio.wrap_future(self.__parse_pool.submit(parse_listing_page, response.content,
+                                                                          self.__parser))
+            return parse_listing_page(response.content, self.__parser)
+
+
+    async def _aprefetch_listing(self, req_url: str, transport: IAsyncTransport,
+                                 semaphore: asyncio.Semaphore) -> Optional[dict]:
+        # Takes a slot of the detail requests, so at most max_workers requests are in flight
+        async with semaphore:
+            return await self._aget_listing(req_url, transport)
+
+
+    def _parse(self, parse_page: Callable[[bytes, str], dict], content: bytes, page: str) -> dict:
+        with metrics.timer("parse_seconds", page=page):
+            if self.__parse_pool:
+                return self.__parse_pool.run(parse_page, content, self.__parser)
+            return parse_page(content, self.__parser)
+
+
+    def _replay_response(self, req_url: str) -> TransportResponse:
+        content = self.__archive.get(req_url)
+        if content is None:
+            self.__logger.log_warning(f"Page is not in the archive {req_url}")
+            return TransportResponse(404, b"")
+        return TransportResponse(200, content)
+
+
+    def _archive_response(self, req_url: str, response: requests.Response | TransportResponse):
+        if self.__archive is not None and 200 <= response.status_code < 300:
+            self.__archive.record(req_url, response.content)
+
+
+    def _record_response(self, response: requests.Response | TransportResponse, seconds: float, attempt: int):
+        metrics.inc("http_requests_total", status=response.status_code)
+        metrics.inc("http_response_bytes_total", len(response.content))
+        metrics.observe("http_request_seconds", seconds)
+        if attempt > 1:
+            metrics.inc("http_retries_total")
+        self.__rate_limiter.record(response.status_code, seconds)
+
+
+    def _record_failure(self, error: Exception, seconds: float, attempt: int):
+        metrics.inc("http_errors_total", error=type(error).__name__)
+        if attempt > 1:
+            metrics.inc("http_retries_total")
+        self.__rate_limiter.record(None, seconds)
+
+
+    def _retry_delay(self, attempt: int,
+                     response: Optional[requests.Response | TransportResponse] = None) -> Optional[float]:
+        """Seconds to wait before the next attempt, None when the site asks to wait longer than allowed."""
+        retry_after = retry_after_seconds(response.headers) if response is not None else None
+        if retry_after is not None:
+            # Retrying earlier than the site asks would only be refused again
+            if retry_after > self.__max_retry_after:
+                self.__logger.log_error(f"def:retry_delay - Retry-After of {retry_after:.0f} s is beyond "
+                                        f"the {self.__max_retry_after:.0f} s allowed, giving up")
+                return None
+            return retry_after
+        # Full jitter, so parallel workers that failed together do not retry together
+        return random.uniform(0, min(self.__max_backoff, self.__backoff * 2 ** (attempt - 1)))
+
+
+    def _get_response(self, req_url: str, extra_headers: Optional[dict[str, str]] = None) -> requests.Response:
+        if self.__replay:
+            return self._replay_response(req_url)
+
+        headers = {**self.__headers, **extra_headers} if extra_headers else self.__headers
+        for attempt in range(1, self.__max_retries + 1):
+            self.__rate_limiter.acquire()
+            started = time.perf_counter()
+            try:
+                response = self.__session.get(req_url, headers=headers, timeout=self.__timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record_failure(e, time.perf_counter() - started, attempt)
+                self.__logger.log_error(f"[Attempt {attempt}] Failed to fetch URL: {req_url}, error: {e}")
+                delay = self._retry_delay(attempt)
+            else:
+                self._record_response(response, time.perf_counter() - started, attempt)
+                if 200 <= response.status_code < 300 or response.status_code == 304:
+                    self._archive_response(req_url, response)
+                    return response
+                self.__logger.log_error(
+                    f"[Attempt {attempt}] Failed to fetch URL: {req_url}, "
+                    f"status code: {response.status_code}"
+                )
+                if not is_retryable(response.status_code):
+                    break
+                delay = self._retry_delay(attempt, response)
+                if delay is None:
+                    break
+            if attempt < self.__max_retries:
+                time.sleep(delay)
 
-            if 200 <= response.status_code < 300:
-                time.sleep(self.__time_delay)
-                return BeautifulSoup(response.content, 'html.parser')
+        # After all retries failed
+        raise requests.HTTPError(
+            f"Failed to retrieve content from {req_url} after {attempt} attempts. "
+        )
+
+
+    async def _aget_response(self, req_url: str, transport: IAsyncTransport,
+                             extra_headers: Optional[dict[str, str]] = None) -> TransportResponse:
+        if self.__replay:
+            return self._replay_response(req_url)
+
+        headers = {**self.__headers, **extra_headers} if extra_headers else self.__headers
+        for attempt in range(1, self.__max_retries + 1):
+            await self.__rate_limiter.acquire_async()
+            started = time.perf_counter()
+            try:
+                response = await transport.get(req_url, headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record_failure(e, time.perf_counter() - started, attempt)
+                self.__logger.log_error(f"[Attempt {attempt}] Failed to fetch URL: {req_url}, error: {e}")
+                delay = self._retry_delay(attempt)
             else:
+                self._record_response(response, time.perf_counter() - started, attempt)
+                if 200 <= response.status_code < 300 or response.status_code == 304:
+                    self._archive_response(req_url, response)
+                    return response
                 self.__logger.log_error(
                     f"[Attempt {attempt}] Failed to fetch URL: {req_url}, "
                     f"status code: {response.status_code}"
                 )
-                time.sleep(1)  # Delay before retrying
+                if not is_retryable(response.status_code):
+                    break
+                delay = self._retry_delay(attempt, response)
+                if delay is None:
+                    break
+            if attempt < self.__max_retries:
+                await asyncio.sleep(delay)
 
         # After all retries failed
         raise requests.HTTPError(
-            f"Failed to retrieve content from {req_url} after {max_retries} attempts. "
-        )
\ No newline at end of file
+            f"Failed to retrieve content from {req_url} after {attempt} attempts. "
+        )
+
+
+def is_retryable(status_code: int) -> bool:
+    """Whether a request answered with ``status_code`` may succeed when sent again."""
+    return status_code in (408, 429) or status_code >= 500
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait according to a ``Retry-After`` header in seconds or as an HTTP date, if any."""
+    value = next((v for k, v in headers.items() if k.lower() == "retry-after"), None)
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=dt.timezone.utc)
+    return max(0.0, (retry_at - dt.datetime.now(dt.timezone.utc)).total_seconds())
+
+
+def parse_listing_page(content: bytes, parser: str) -> dict:
+    """
+    Extracts the product cards and the pagination of a listing page into plain data,
+    so it can run in a ``ParsePool`` worker.
+    """
+    soup = BeautifulSoup(content, parser, parse_only=_LISTING_SCOPE)
+    return {"cards": [IkeaScrapper._get_card(tag) for tag in IkeaScrapper._get_card_tags(soup)],
+            "has_next_page": IkeaScrapper._has_next_page(soup),
+            "item_count": IkeaScrapper._get_item_count(soup)}
+
+
+def parse_detail_page(content: bytes, parser: str) -> dict:
+    """Extracts the size details and the item code of a product page into plain data."""
+    soup = BeautifulSoup(content, parser, parse_only=_DETAIL_SCOPE)
+    return {"details": IkeaScrapper._get_item_details(soup), "id": IkeaScrapper._get_item_id(soup)}
+
+
+async def merge_page_items(scrappers: list[IkeaScrapper]) -> AsyncGenerator[dict, None]:
+    """
+    Runs ``apage_items`` of several scrappers (e.g. one per category) concurrently
+    on the current event loop and yields their items as they arrive.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=len(scrappers) * 10)
+    finished = object()
+
+    async def produce(scrapper: IkeaScrapper):
+        try:
+            async for item in scrapper.apage_items():
+                await queue.put(item)
+        finally:
+            await queue.put(finished)
+
+    producers = [asyncio.ensure_future(produce(s)) for s in scrappers]
+    try:
+        remaining = len(producers)
+        while remaining:
+            item = await queue.get()
+            if item is finished:
+                remaining -= 1
+                continue
+            yield item
+        # Surfaces errors raised by any of the scrappers
+        await asyncio.gather(*producers)
+    finally:
+        for producer in producers:
+            producer.cancel()
@@ -0,0 +1,33 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class TransportResponse:
+    """A minimal HTTP response, shaped like the parts of ``requests.Response`` the scrapper uses."""
+    def __init__(self, status_code: int, content: bytes, headers: Optional[dict[str, str]] = None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class IAsyncTransport(ABC):
+    @abstractmethod
+    async def get(self, url: str, headers: dict[str, str]) -> TransportResponse:
+        """
+        Sends a GET request without blocking the event loop.
+
+        :param url: The absolute URL to fetch.
+        :param headers: HTTP headers to send with the request.
+        :return: The response status, body and headers.
+        :raises requests.ConnectionError: When the request fails without a response.
+        :raises requests.Timeout: When the response does not arrive in time.
+        """
+        pass
+
+    async def close(self):
+        """
+        Releases connections held by the transport.
+
+        The default implementation does nothing.
+        """
+        pass
@@ -0,0 +1,40 @@
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from src.interfaces.repository import IDataAccessRepository
+
+
+class ICheckpointStore(ABC):
+    @abstractmethod
+    def load(self) -> Optional[dict]:
+        """
+        Reads the last saved crawl progress.
+
+        :return: The saved state, or None when nothing was saved yet.
+        """
+        pass
+
+    @abstractmethod
+    def save(self, state: dict):
+        """
+        Replaces the saved crawl progress with ``state``, atomically.
+
+        :param state: A JSON serializable dictionary.
+        """
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """Removes the saved crawl progress."""
+        pass
+
+    def save_with_items(self, repository: IDataAccessRepository, items: list[dict], state: dict) -> Optional[int]:
+        """
+        Writes ``items`` to ``repository`` and saves ``state`` in the same transaction.
+
+        The default implementation does nothing. Stores kept inside a repository
+        should override it for that repository.
+
+        :return: The number of items written (see ``upsert_many``), None if the store can't do it for ``repository``.
+        """
+        return None
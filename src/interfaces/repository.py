@@ -1,5 +1,6 @@
 from abc import ABC, abstractmethod
-from typing import Optional
+from itertools import islice
+from typing import Optional, Self, Iterable, Iterator
 
 class IDataAccessRepository(ABC):
     @abstractmethod
@@ -31,4 +32,88 @@ class IDataAccessRepository(ABC):
         :param id_keys: A dictionary of keys to identify which item to update.
         :return: The updated item as a dictionary.
         """
-        pass
\ No newline at end of file
+        pass
+
+    def upsert(self, item: dict) -> dict:
+        """
+        Inserts the item, or replaces the stored item with the same "id".
+
+        The default implementation looks the item up and then calls ``update`` or ``insert``.
+        Repositories should override it when the storage can do both in one step.
+
+        :param item: A dictionary representing the item, including its "id".
+        :return: The stored item as a dictionary.
+        """
+        if self.get_first_or_default({"id": item["id"]}):
+            return self.update(item, {"id": item["id"]})
+        return self.insert(item)
+
+    def upsert_many(self, items: Iterable[dict]) -> int:
+        """
+        Upserts a sequence of items.
+
+        The default implementation calls ``upsert`` for every item. Repositories should
+        override it to write the whole sequence in one storage round-trip, and skip items
+        whose ``content_hash`` matches the stored item.
+
+        :param items: An iterable of item dictionaries, each including its "id".
+        :return: The number of items written. Skipped unchanged items are not counted, they
+            are only reported as ``items_unchanged_total``.
+        """
+        count = 0
+        for item in items:
+            self.upsert(item)
+            count += 1
+        return count
+
+    def iter_items(self) -> Iterator[dict]:
+        """
+        Streams every stored item, each once, without loading the whole store into memory.
+
+        Repositories that can be read back in full must override it.
+
+        :return: An iterator over the item dictionaries.
+        """
+        raise NotImplementedError(f"{type(self).__name__} cannot list its items")
+
+    def bulk_insert(self, items: Iterable[dict], batch_size: int = 1000) -> int:
+        """
+        Writes a stream of items with distinct ids, e.g. the ``iter_items`` of another repository.
+
+        The default implementation calls ``upsert_many`` for every ``batch_size`` items, so
+        memory use does not grow with the length of the stream. Repositories should override
+        it when the storage has a faster way to load many items at once.
+
+        :param items: An iterable of item dictionaries, each with a distinct "id".
+        :param batch_size: Number of items held in memory at a time.
+        :return: The number of items written, without skipped unchanged items.
+        """
+        count = 0
+        iterator = iter(items)
+        while batch := list(islice(iterator, batch_size)):
+            count += self.upsert_many(batch)
+        return count
+
+    def flush(self):
+        """
+        Makes the items written so far durable.
+
+        The default implementation does nothing, which suits repositories that write
+        through on every call. Repositories that buffer writes should override it.
+        """
+        pass
+
+    def close(self):
+        """
+        Flushes any pending changes and releases resources held by the repository.
+
+        The default implementation does nothing. Repositories that keep files,
+        connections or in-memory indexes open should override it.
+        """
+        pass
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
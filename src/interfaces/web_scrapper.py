@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Generator
+from typing import Generator, Any
 
 class IWebScrapper(ABC):
     @abstractmethod
@@ -32,3 +32,33 @@ class IWebScrapper(ABC):
         :return: True if the scraping process is finished, False otherwise.
         """
         pass
+
+
+class IStagedWebScrapper(IWebScrapper):
+    """
+    A scrapper whose downloading and parsing can run as separate pipeline stages.
+
+    ``page_items()`` must yield the same items as ``parse_raw_item`` applied to every
+    item of ``raw_page_items()``, in the same order.
+    """
+
+    @abstractmethod
+    def raw_page_items(self) -> Generator[Any, None, None]:
+        """
+        Yields every item with its pages downloaded but not yet parsed.
+
+        Progress tracking (resume state, completion) behaves exactly as in ``page_items()``.
+        :return: A generator of opaque raw items to pass to ``parse_raw_item``.
+        """
+        pass
+
+    @abstractmethod
+    def parse_raw_item(self, raw_item: Any) -> dict:
+        """
+        Turns a raw item from ``raw_page_items()`` into the final item dictionary.
+
+        Must be safe to call from a different thread than the one iterating ``raw_page_items()``.
+        :param raw_item: An item yielded by ``raw_page_items()``.
+        :return: A dictionary representing the scraped product item.
+        """
+        pass
@@ -0,0 +1,82 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Optional
+
+
+class WorkItem:
+    """A leased unit of crawl work: a listing page or a product detail page."""
+    def __init__(self, item_id: int, url: str, kind: str, payload: Optional[dict], attempts: int):
+        self.id = item_id
+        self.url = url
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+
+
+class IWorkQueue(ABC):
+    @abstractmethod
+    def enqueue(self, entries: Iterable[tuple[str, Optional[dict]]], kind: str) -> int:
+        """
+        Adds work items, each URL at most once per crawl.
+
+        :param entries: ``(url, payload)`` pairs, the payload is any JSON serializable dict or None.
+        :param kind: ``"listing"`` or ``"detail"``. Listing pages are leased before detail pages.
+        :return: The number of items added, URLs already queued are ignored.
+        """
+        pass
+
+    @abstractmethod
+    def lease(self, owner: str, limit: int) -> list[WorkItem]:
+        """
+        Takes up to ``limit`` pending items for ``owner``. Leases of other owners that
+        expired are reclaimed first, so the work of a dead worker is not lost.
+
+        :param owner: A name unique to the worker, e.g. its host name and process id.
+        :return: The leased items, an empty list when nothing is available right now.
+        """
+        pass
+
+    @abstractmethod
+    def ack(self, item_id: int, owner: str) -> bool:
+        """
+        Marks a leased item as done.
+
+        :return: False if the lease of ``owner`` expired and the item was leased by another worker.
+        """
+        pass
+
+    @abstractmethod
+    def fail(self, item_id: int, owner: str, error: str):
+        """Gives a leased item back to be retried later, or marks it failed once it ran out of attempts."""
+        pass
+
+    @abstractmethod
+    def release(self, item_ids: Iterable[int], owner: str):
+        """Gives leased items that were never worked on back to the queue, without counting an attempt."""
+        pass
+
+    @abstractmethod
+    def counts(self) -> dict[str, int]:
+        """
+        Counts the items of the current crawl by state.
+
+        :return: The number of ``pending``, ``leased``, ``done`` and ``failed`` items.
+        """
+        pass
+
+    def is_drained(self) -> bool:
+        """True when no item is pending or leased, i.e. the crawl has finished on every worker."""
+        counts = self.counts()
+        return counts["pending"] == 0 and counts["leased"] == 0
+
+    @abstractmethod
+    def clear(self):
+        """Removes all items of a drained queue, so the next crawl starts over. Does nothing while work is left."""
+        pass
+
+    def close(self):
+        """
+        Releases the connection to the broker.
+
+        The default implementation does nothing.
+        """
+        pass
@@ -0,0 +1,207 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from src.interfaces.checkpoint_store import ICheckpointStore
+from src.interfaces.repository import IDataAccessRepository
+
+
+class JsonCheckpointStore(ICheckpointStore):
+    def __init__(self, file_path: str):
+        """Crawl progress in a JSON file, replaced atomically by writing a temp file and renaming it."""
+        self.__file_path = file_path
+
+
+    def load(self) -> Optional[dict]:
+        if not os.path.exists(self.__file_path):
+            return None
+        try:
+            with open(self.__file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except json.JSONDecodeError:
+            # Only a file written by an older version can be torn, start over rather than crash
+            return None
+
+
+    def save(self, state: dict):
+        temp_file = self.__file_path + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.__file_path)
+
+
+    def clear(self):
+        if os.path.exists(self.__file_path):
+            os.remove(self.__file_path)
+
+
+class Checkpointer:
+    def __init__(self, store: ICheckpointStore, every: int = 100, interval: float = 30.0):
+        """
+        Records crawl progress only for items that were actually stored.
+
+        The scrapper calls ``track`` with its resume state for every item it yields,
+        in yield order. Whoever stores the items calls ``commit(count)`` (or
+        ``persist``) once the first ``count`` of them are durable. The state of the
+        last stored item is then written to ``store`` when ``every`` items or
+        ``interval`` seconds have passed since the previous write, and by ``flush``.
+        A resume therefore never skips an item that was yielded but not stored.
+
+        Work that must not run before an item is stored, e.g. remembering it as
+        unchanged for the next run, is passed to ``track`` as ``on_stored``. It is held
+        until the progress past the item is saved, right after ``before_save`` flushed
+        the repository, and runs in the thread that saved it. Items tracked with a None
+        state only run their ``on_stored``, they leave the saved progress as it is.
+        """
+        self.__store = store
+        self.__every = max(every, 1)
+        self.__interval = interval
+        self.__lock = threading.Lock()
+        self.__pending: deque[tuple[int, Optional[dict], list[Callable[[], None]]]] = deque()
+        # Callbacks of committed items, run once the progress past them is saved
+        self.__held: list[Callable[[], None]] = []
+        self.__tracked = 0
+        self.__state: Optional[dict] = None
+        self.__unsaved = 0
+        self.__saved_at = time.monotonic()
+
+
+    def load(self) -> Optional[dict]:
+        return self.__store.load()
+
+
+    def start(self):
+        """Starts counting the items of a new run from zero."""
+        with self.__lock:
+            self.__pending.clear()
+            self.__tracked = 0
+
+
+    def track(self, state: Optional[dict], on_stored: Optional[Callable[[], None]] = None) -> int:
+        """
+        Records the resume state after the next yielded item.
+
+        :param on_stored: Called once the item is committed and the progress past it is saved.
+        :return: The number of items tracked in this run, including this one.
+        """
+        with self.__lock:
+            self.__tracked += 1
+            self.__pending.append((self.__tracked, state, [on_stored] if on_stored else []))
+            return self.__tracked
+
+
+    def advance(self, state: dict):
+        """Records a new resume state without an item, e.g. when a page ends."""
+        with self.__lock:
+            if self.__pending:
+                # Still reached right after the last yielded item, so it is stored together with it
+                count, _, callbacks = self.__pending[-1]
+                self.__pending[-1] = (count, state, callbacks)
+            else:
+                self.__state = state
+                self.__unsaved += 1
+
+
+    def after_stored(self, callback: Callable[[], None]):
+        """Calls ``callback`` once every item tracked so far is committed and saved, right away when they are."""
+        with self.__lock:
+            if self.__pending:
+                self.__pending[-1][2].append(callback)
+                return
+            if self.__held:
+                self.__held.append(callback)
+                return
+        callback()
+
+
+    def commit(self, count: int, before_save: Optional[Callable[[], None]] = None):
+        """
+        Marks the first ``count`` tracked items as stored and saves the progress when it is due.
+
+        :param before_save: Called right before the progress is saved, e.g. to flush a buffered repository.
+        """
+        callbacks: list[Callable[[], None]] = []
+        with self.__lock:
+            self._take(count)
+            if self.__unsaved and (self.__unsaved >= self.__every
+                                   or time.monotonic() - self.__saved_at >= self.__interval):
+                callbacks = self._save(before_save)
+        self._run(callbacks)
+
+
+    def persist(self, repository: IDataAccessRepository, items: list[dict], count: int) -> int:
+        """
+        Upserts ``items`` and commits the first ``count`` tracked items. When the store
+        lives in ``repository``, the progress is saved in the same transaction as the items.
+
+        :return: The number of items written, as returned by ``upsert_many``.
+        """
+        with self.__lock:
+            state = next((s for n, s, _ in reversed(self.__pending) if n <= count and s is not None), None)
+        written = self.__store.save_with_items(repository, items, state) if state is not None else None
+        if written is not None:
+            with self.__lock:
+                self._take(count)
+                # The items and the progress past them were committed together
+                callbacks, self.__held = self.__held, []
+                # A page end may have moved the state past the one just saved
+                self.__unsaved = 0 if self.__state is state else 1
+                self.__saved_at = time.monotonic()
+            self._run(callbacks)
+            return written
+        written = repository.upsert_many(items)
+        # The items must be on disk before the progress past them is
+        self.commit(count, repository.flush)
+        return written
+
+
+    def flush(self, before_save: Optional[Callable[[], None]] = None):
+        callbacks: list[Callable[[], None]] = []
+        with self.__lock:
+            if self.__unsaved:
+                callbacks = self._save(before_save)
+        self._run(callbacks)
+
+
+    def clear(self):
+        with self.__lock:
+            self.__store.clear()
+            self.__pending.clear()
+            self.__held.clear()
+            self.__state = None
+            self.__unsaved = 0
+
+
+    def _take(self, count: int):
+        """Moves the state past the first ``count`` items and holds their ``on_stored`` callbacks."""
+        while self.__pending and self.__pending[0][0] <= count:
+            _, state, item_callbacks = self.__pending.popleft()
+            if state is not None:
+                self.__state = state
+            # Items without a state count too, their callbacks wait for the save
+            self.__unsaved += 1
+            self.__held.extend(item_callbacks)
+
+
+    @staticmethod
+    def _run(callbacks: list[Callable[[], None]]):
+        # Outside the lock, a callback may track or commit again
+        for callback in callbacks:
+            callback()
+
+
+    def _save(self, before_save: Optional[Callable[[], None]] = None) -> list[Callable[[], None]]:
+        """Saves the progress and returns the held callbacks, which may run now."""
+        if before_save:
+            before_save()
+        if self.__state is not None:
+            self.__store.save(self.__state)
+        self.__unsaved = 0
+        self.__saved_at = time.monotonic()
+        callbacks, self.__held = self.__held, []
+        return callbacks
@@ -0,0 +1,13 @@
+import hashlib
+import json
+
+_ENCODER = json.JSONEncoder(ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def content_hash(item: dict) -> str:
+    """
+    Short hash of everything stored for ``item``. It does not depend on the order of
+    the item's keys, so an unchanged product scraped again hashes like the stored one
+    and its write can be skipped.
+    """
+    return hashlib.sha1(_ENCODER.encode(item).encode("utf-8")).hexdigest()[:16]
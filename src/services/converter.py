@@ -0,0 +1,30 @@
+import time
+
+from src.interfaces.logger import ILogger
+from src.interfaces.repository import IDataAccessRepository
+from src.services.metrics import metrics
+
+
+def convert(source: IDataAccessRepository, target: IDataAccessRepository, logger: ILogger,
+            batch_size: int = 1000, progress_every: int = 10000) -> int:
+    """
+    Copies every item of ``source`` into ``target``, e.g. a .jsonl database into a new .xlsx file.
+
+    Items are streamed from ``source.iter_items`` into ``target.bulk_insert``, so memory use
+    does not depend on the number of items. Items already in ``target`` are replaced.
+
+    :return: The number of items written, items ``target`` already holds unchanged are not counted.
+    """
+    started = time.perf_counter()
+
+    def counted():
+        for count, item in enumerate(source.iter_items(), 1):
+            if count % progress_every == 0:
+                logger.log_info(f"def:convert - {count} items copied")
+            yield item
+
+    count = target.bulk_insert(counted(), batch_size)
+    target.flush()
+    metrics.inc("items_converted_total", count)
+    logger.log_info(f"def:convert - {count} items copied in {time.perf_counter() - started:.1f} s")
+    return count
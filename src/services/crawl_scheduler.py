@@ -0,0 +1,231 @@
+import hashlib
+import multiprocessing
+import os
+import queue
+import re
+import signal
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Generator, Optional
+from urllib.parse import urlparse
+
+from src.interfaces.logger import ILogger
+from src.interfaces.web_scrapper import IWebScrapper
+from src.services.checkpoint import Checkpointer, JsonCheckpointStore
+from src.services.metrics import metrics
+from src.services.rate_limiter import TokenBucket
+
+# Builds the scrapper of one category: (category url, state file, shared rate limiter or None, checkpointer)
+ScrapperFactory = Callable[[str, str, Optional[TokenBucket], Checkpointer], IWebScrapper]
+
+_ITEM, _DONE, _ERROR, _METRICS = "item", "done", "error", "metrics"
+
+# Workers forward their metrics to the main process after this many items
+_METRICS_EVERY = 100
+
+# Set in every worker process by _init_worker
+_results: Optional[multiprocessing.Queue] = None
+_stop = None
+_rate_limiter: Optional[TokenBucket] = None
+# Number of items of each category the main process stored, by category index
+_stored = None
+
+
+def category_key(url: str) -> str:
+    """Short file-name-safe key of a category url, e.g. ``virtuves-sistema-metod-1a2b3c4d``."""
+    name = os.path.basename(urlparse(url).path.rstrip("/")) or "category"
+    name = re.sub(r"[^A-Za-z0-9_-]+", "-", name)[:40]
+    return f"{name}-{hashlib.sha1(url.encode('utf-8')).hexdigest()[:8]}"
+
+
+def namespaced_path(path: str, url: str) -> str:
+    """Inserts the category key of ``url`` before the extension of ``path``."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{category_key(url)}{ext}"
+
+
+class CrawlScheduler(IWebScrapper):
+    def __init__(self, urls: list[str], scrapper_factory: ScrapperFactory, logger: ILogger, processes: int = 0,
+                 state_file: str = ".\\src\\business_logic\\ikea_scraper_state.json",
+                 rate_limiter: Optional[TokenBucket] = None, queue_size: int = 100,
+                 checkpointer: Optional[Checkpointer] = None, checkpoint_every: int = 100,
+                 checkpoint_interval: float = 30.0):
+        """
+        Scrapes several categories at once, one category per worker process.
+
+        Each category gets its own resume state, ``state_file`` with the category key
+        inserted before the extension, so an interrupted crawl resumes every category
+        where it stopped. ``processes`` defaults to one per category, at most one per CPU.
+
+        The state of a category only moves past the items the main process stored.
+        The scheduler tracks every item it yields with ``checkpointer``, the one its
+        consumer commits stored items to (e.g. the ``PipelineRunner``'s), and each
+        worker commits its own ``Checkpointer`` (saving every ``checkpoint_every`` items
+        or ``checkpoint_interval`` seconds) as far as the items it sent were stored.
+        Without a ``checkpointer`` an item counts as stored once the next one is asked for.
+
+        ``scrapper_factory`` runs inside the workers, so it has to be picklable (a
+        module-level function or a ``functools.partial`` of one). The scrapper it builds
+        has to track its items with the checkpointer it receives. Workers receive
+        ``rate_limiter`` when they start; a ``SharedTokenBucket`` makes all of them
+        share one request budget.
+
+        Items of all categories are yielded as they arrive, so the scheduler plugs into
+        anything that consumes an ``IWebScrapper``.
+        """
+        self.__urls = list(dict.fromkeys(urls))
+        self.__factory = scrapper_factory
+        self.__logger = logger
+        self.__processes = processes if processes > 0 else min(len(self.__urls), os.cpu_count() or 1)
+        self.__state_file = state_file
+        self.__rate_limiter = rate_limiter
+        self.__queue_size = queue_size
+        self.__checkpointer = checkpointer
+        self.__checkpoint_every = checkpoint_every
+        self.__checkpoint_interval = checkpoint_interval
+        self.__completed: set[str] = set()
+
+
+    @property
+    def is_completed(self) -> bool:
+        return all(url in self.__completed for url in self.__urls)
+
+
+    def clear_state(self):
+        for url in self.__urls:
+            state_file = namespaced_path(self.__state_file, url)
+            if os.path.exists(state_file):
+                os.remove(state_file)
+        self.__completed.clear()
+
+
+    def page_items(self) -> Generator[dict, None, None]:
+        pending = [url for url in self.__urls if url not in self.__completed]
+        if not pending:
+            return
+        # Spawned workers start clean, even when the caller already runs threads
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue(self.__queue_size)
+        stop = context.Event()
+        # Only this process writes the counts, the workers read them
+        stored = context.Array("q", len(self.__urls), lock=False)
+        indexes = {url: index for index, url in enumerate(self.__urls)}
+        failed: dict[str, str] = {}
+        if self.__checkpointer:
+            self.__checkpointer.start()
+        with ProcessPoolExecutor(min(self.__processes, len(pending)), mp_context=context, initializer=_init_worker,
+                                 initargs=(results, stop, self.__rate_limiter, stored)) as pool:
+            running: dict[Future, str] = {
+                pool.submit(_crawl_category, self.__factory, url, namespaced_path(self.__state_file, url),
+                            indexes[url], self.__checkpoint_every, self.__checkpoint_interval): url
+                for url in pending
+            }
+            self.__logger.log_info(f"def:page_items - crawling {len(pending)} categories in "
+                                   f"{min(self.__processes, len(pending))} processes")
+            active = set(pending)
+            try:
+                while active:
+                    try:
+                        kind, url, payload = results.get(timeout=0.5)
+                    except queue.Empty:
+                        self._check_workers(running, active, failed)
+                        continue
+                    if kind == _ITEM:
+                        if self.__checkpointer:
+                            self.__checkpointer.track(None, partial(_count_stored, stored, indexes[url]))
+                        yield payload
+                        if not self.__checkpointer:
+                            _count_stored(stored, indexes[url])
+                        continue
+                    if kind == _METRICS:
+                        metrics.merge(payload)
+                        continue
+                    active.discard(url)
+                    if kind == _DONE and payload:
+                        self.__completed.add(url)
+                        self.__logger.log_info(f"def:page_items - category {url} completed")
+                    elif kind == _ERROR:
+                        failed[url] = payload
+                        self.__logger.log_error(f"def:page_items - category {url} failed: {payload}")
+            finally:
+                stop.set()
+                # Keep reading so no worker stays blocked on a full queue while stopping
+                while not all(future.done() for future in running):
+                    try:
+                        results.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {len(pending)} categories failed: {', '.join(failed)}")
+
+
+    @staticmethod
+    def _check_workers(running: dict[Future, str], active: set[str], failed: dict[str, str]):
+        # A worker that died (e.g. killed by the OS) never reports back through the queue
+        for future, url in running.items():
+            if url in active and future.done() and future.exception() is not None:
+                active.discard(url)
+                failed[url] = str(future.exception())
+
+
+def _count_stored(stored, index: int):
+    stored[index] += 1
+
+
+def _init_worker(results: multiprocessing.Queue, stop, rate_limiter: Optional[TokenBucket], stored):
+    global _results, _stop, _rate_limiter, _stored
+    # Ctrl+C is handled by the main process, which stops the workers through ``stop``
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _results, _stop, _rate_limiter, _stored = results, stop, rate_limiter, stored
+
+
+def _crawl_category(factory: ScrapperFactory, url: str, state_file: str, index: int, checkpoint_every: int,
+                    checkpoint_interval: float):
+    checkpointer = Checkpointer(JsonCheckpointStore(state_file), every=checkpoint_every, interval=checkpoint_interval)
+    try:
+        scrapper = factory(url, state_file, _rate_limiter, checkpointer)
+        items = scrapper.page_items()
+        sent = 0
+        try:
+            for item in items:
+                if not _send((_ITEM, url, item)):
+                    return
+                sent += 1
+                # The items are stored by the main process, the progress follows it there
+                checkpointer.commit(_stored[index])
+                if sent % _METRICS_EVERY == 0:
+                    _send((_METRICS, url, metrics.drain()))
+        finally:
+            items.close()
+        if not _wait_until_stored(checkpointer, index, sent):
+            return
+        # Saved before the main process hears of it, it clears the states once every category is done
+        checkpointer.flush()
+        _send((_METRICS, url, metrics.drain()))
+        _send((_DONE, url, scrapper.is_completed))
+    except Exception as e:
+        _send((_METRICS, url, metrics.drain()))
+        _send((_ERROR, url, f"{type(e).__name__}: {e}"))
+    finally:
+        checkpointer.commit(_stored[index])
+        checkpointer.flush()
+
+
+def _wait_until_stored(checkpointer: Checkpointer, index: int, sent: int) -> bool:
+    """Commits the items of the category as they are stored until all ``sent`` are, False when stopped first."""
+    while _stored[index] < sent:
+        checkpointer.commit(_stored[index])
+        if _stop.wait(0.05):
+            return False
+    checkpointer.commit(sent)
+    return True
+
+
+def _send(message: tuple) -> bool:
+    while not _stop.is_set():
+        try:
+            _results.put(message, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import threading
+
+
+class FingerprintStore:
+    def __init__(self, file_path: str):
+        """
+        Compact record of what every product looked like on its listing card the
+        last time its details were stored: detail URL -> product id and a short
+        hash of the card's name, description and price. Persisted as JSON in
+        ``file_path``, normally next to the repository file.
+
+        It also counts the incremental runs completed since the last full refresh.
+        """
+        self.__file_path = file_path
+        self.__lock = threading.Lock()
+        self.__entries: dict[str, dict[str, str]] = {}
+        self.__incremental_runs = 0
+        self.__changed = False
+        self._load()
+
+
+    @staticmethod
+    def fingerprint(item: dict) -> str:
+        data = json.dumps([item.get("name"), item.get("description"), item.get("price")], ensure_ascii=False)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+
+    def is_unchanged(self, url: str, item: dict) -> bool:
+        """True when ``url`` was stored before with the same card data as ``item``."""
+        with self.__lock:
+            entry = self.__entries.get(url)
+        return entry is not None and entry["fingerprint"] == self.fingerprint(item)
+
+
+    def update(self, url: str, item: dict):
+        with self.__lock:
+            self.__entries[url] = {"id": item["id"], "fingerprint": self.fingerprint(item)}
+            self.__changed = True
+
+
+    @property
+    def incremental_runs(self) -> int:
+        return self.__incremental_runs
+
+
+    def complete_run(self, full: bool):
+        with self.__lock:
+            self.__incremental_runs = 0 if full else self.__incremental_runs + 1
+            self.__changed = True
+        self.save()
+
+
+    def save(self):
+        with self.__lock:
+            if not self.__changed:
+                return
+            temp_file = self.__file_path + ".tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({"incremental_runs": self.__incremental_runs, "items": self.__entries}, f, ensure_ascii=False)
+            os.replace(temp_file, self.__file_path)
+            self.__changed = False
+
+
+    def _load(self):
+        if not os.path.exists(self.__file_path):
+            return
+        try:
+            with open(self.__file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.__entries = data.get("items", {})
+            self.__incremental_runs = data.get("incremental_runs", 0)
+        except json.JSONDecodeError:
+            self.__entries = {}
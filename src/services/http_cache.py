@@ -0,0 +1,76 @@
+import json
+import os
+import threading
+from typing import Optional, Any, Mapping
+
+
+class HttpCache:
+    def __init__(self, file_path: str):
+        """
+        Remembers the ETag/Last-Modified validators of fetched pages together with
+        the data extracted from them, persisted as JSON in ``file_path``.
+
+        A page can then be revalidated with a conditional GET, and when the server
+        answers 304 Not Modified the stored data is reused without downloading or
+        parsing the page again.
+        """
+        self.__file_path = file_path
+        self.__lock = threading.Lock()
+        self.__entries: dict[str, dict[str, Any]] = {}
+        self.__changed = False
+        self._load()
+
+
+    def conditional_headers(self, url: str) -> dict[str, str]:
+        """Returns the If-None-Match/If-Modified-Since headers for ``url``, or an empty dict."""
+        with self.__lock:
+            entry = self.__entries.get(url)
+        headers: dict[str, str] = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+    def get(self, url: str) -> Optional[Any]:
+        with self.__lock:
+            entry = self.__entries.get(url)
+        return entry["data"] if entry else None
+
+
+    def store(self, url: str, headers: Mapping[str, str], data: Any):
+        """Stores ``data`` for ``url`` if the response ``headers`` carry a validator."""
+        lowered = {k.lower(): v for k, v in headers.items()}
+        etag = lowered.get("etag")
+        last_modified = lowered.get("last-modified")
+        if not etag and not last_modified:
+            return
+        with self.__lock:
+            self.__entries[url] = {"etag": etag, "last_modified": last_modified, "data": data}
+            self.__changed = True
+
+
+    def save(self):
+        with self.__lock:
+            if not self.__changed:
+                return
+            directory = os.path.dirname(self.__file_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            temp_file = self.__file_path + ".tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.__entries, f, ensure_ascii=False)
+            os.replace(temp_file, self.__file_path)
+            self.__changed = False
+
+
+    def _load(self):
+        if not os.path.exists(self.__file_path):
+            return
+        try:
+            with open(self.__file_path, 'r', encoding='utf-8') as f:
+                self.__entries = json.load(f)
+        except json.JSONDecodeError:
+            self.__entries = {}
@@ -0,0 +1,74 @@
+import asyncio
+from typing import Optional
+
+import requests
+
+from src.interfaces.async_transport import IAsyncTransport, TransportResponse
+
+
+class AiohttpTransport(IAsyncTransport):
+    def __init__(self, limit: int = 100, timeout: float = 30):
+        """
+        Non-blocking transport on top of ``aiohttp``, keeping up to ``limit`` connections open.
+
+        ``aiohttp`` is an optional dependency and is imported only when this transport is created.
+        """
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError("AiohttpTransport requires the 'aiohttp' package: pip install aiohttp") from e
+        self.__aiohttp = aiohttp
+        self.__limit = limit
+        self.__timeout = timeout
+        self.__session: Optional["aiohttp.ClientSession"] = None
+
+
+    async def get(self, url: str, headers: dict[str, str]) -> TransportResponse:
+        if self.__session is None:
+            # The session has to be created inside the running event loop
+            self.__session = self.__aiohttp.ClientSession(
+                connector=self.__aiohttp.TCPConnector(limit=self.__limit),
+                timeout=self.__aiohttp.ClientTimeout(total=self.__timeout)
+            )
+        try:
+            async with self.__session.get(url, headers=headers) as response:
+                content = await response.read()
+                return TransportResponse(response.status, content, dict(response.headers))
+        except asyncio.TimeoutError as e:
+            raise requests.Timeout(f"No response from {url} in {self.__timeout} s") from e
+        except self.__aiohttp.ClientError as e:
+            # Surfaced as the requests errors the scrapper retries, whatever the transport
+            raise requests.ConnectionError(str(e)) from e
+
+
+    async def close(self):
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+
+class ThreadedRequestsTransport(IAsyncTransport):
+    def __init__(self, timeout: float = 30):
+        """Fallback transport running blocking ``requests`` calls in the default thread pool."""
+        self.__timeout = timeout
+        self.__session = requests.Session()
+
+
+    async def get(self, url: str, headers: dict[str, str]) -> TransportResponse:
+        response = await asyncio.to_thread(self.__session.get, url, headers=headers, timeout=self.__timeout)
+        return TransportResponse(response.status_code, response.content, dict(response.headers))
+
+
+    async def close(self):
+        self.__session.close()
+
+
+def create_async_transport(timeout: float = 30) -> IAsyncTransport:
+    """
+    Returns an ``AiohttpTransport`` when aiohttp is installed, otherwise a ``ThreadedRequestsTransport``,
+    either giving up a request after ``timeout`` seconds.
+    """
+    try:
+        return AiohttpTransport(timeout=timeout)
+    except ImportError:
+        return ThreadedRequestsTransport(timeout=timeout)
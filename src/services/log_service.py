@@ -1,8 +1,12 @@
 from src.interfaces.logger import ILogger
+import atexit
 import datetime as dt
 import os
+import queue
+import threading
+import time
 from enum import IntEnum
-from typing import Self, Callable
+from typing import Self, Callable, Optional, TextIO
 
 
 class LogLevel(IntEnum):
@@ -13,12 +17,165 @@ class LogLevel(IntEnum):
     CRITICAL = 50
 
 
+def _format_line(log_date: str, log_type: str, module_name: str, message: str) -> str:
+    cleaned_msg = message.replace('\r', '').replace('\n', '')
+    return '[{:^10}] {:>10} : {} - {}'.format(log_date, log_type, module_name, cleaned_msg)
+
+
+class LogWriter:
+    def __init__(self, directory: str = ".\\logs\\", flush_interval: float = 1.0, batch_size: int = 1000):
+        """
+        Writes log lines to the daily log file from a background thread.
+
+        ``write`` only puts the raw message on a queue, so logging never waits for the
+        disk. The writer thread formats up to ``batch_size`` queued messages at a time,
+        writes them through a file handle it keeps open, flushes it at least every
+        ``flush_interval`` seconds and switches to a new file when the date changes.
+        Queued messages are written when the process exits.
+        """
+        self.__directory = os.path.dirname(directory)
+        self.__flush_interval = flush_interval
+        self.__batch_size = batch_size
+        self.__queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.__lock = threading.Lock()
+        self.__thread: Optional[threading.Thread] = None
+        self.__file: Optional[TextIO] = None
+        self.__file_date: Optional[dt.date] = None
+        self.__stamp_second = -1
+        self.__stamp = ""
+        self.__stamp_date: Optional[dt.date] = None
+        atexit.register(self.close)
+
+
+    def write(self, created: float, log_type: str, module_name: str, message: str):
+        if self.__thread is None:
+            self._start()
+        self.__queue.put((created, log_type, module_name, message))
+
+
+    def flush(self):
+        """Waits until the messages written so far are in the log file."""
+        if self.__thread is None:
+            return
+        done = threading.Event()
+        self.__queue.put(done)
+        done.wait()
+
+
+    def close(self):
+        with self.__lock:
+            thread, self.__thread = self.__thread, None
+        if thread is not None:
+            self.__queue.put(None)
+            thread.join()
+
+
+    def _start(self):
+        with self.__lock:
+            if self.__thread is None:
+                if self.__directory and not os.path.exists(self.__directory):
+                    os.makedirs(self.__directory)
+                self.__thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self.__thread.start()
+
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            try:
+                entries = [self.__queue.get(timeout=self.__flush_interval)]
+            except queue.Empty:
+                entries = []
+            while entries and len(entries) < self.__batch_size:
+                try:
+                    entries.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            lines: list[str] = []
+            for entry in entries:
+                if entry is None:
+                    stop = True
+                elif isinstance(entry, threading.Event):
+                    self._write_lines(lines)
+                    lines = []
+                    if self.__file:
+                        self.__file.flush()
+                    entry.set()
+                else:
+                    created, log_type, module_name, message = entry
+                    stamp = self._stamp(created)
+                    if self.__stamp_date != self.__file_date:
+                        # Lines collected so far belong to the previous day's file
+                        self._write_lines(lines)
+                        lines = []
+                        self._open(self.__stamp_date)
+                    lines.append(_format_line(stamp, log_type, module_name, message))
+            self._write_lines(lines)
+
+            if self.__file and (stop or time.monotonic() - last_flush >= self.__flush_interval):
+                self.__file.flush()
+                last_flush = time.monotonic()
+            if stop:
+                if self.__file:
+                    self.__file.close()
+                    self.__file = None
+                    self.__file_date = None
+                return
+
+
+    def _write_lines(self, lines: list[str]):
+        if lines:
+            self.__file.write('\n'.join(lines) + '\n')
+
+
+    def _open(self, date: dt.date):
+        if self.__file:
+            self.__file.close()
+        log_path = os.path.join(self.__directory, f"{date.strftime('%Y-%m-%d')}.log")
+        self.__file = open(log_path, 'a', encoding='utf-8')
+        self.__file_date = date
+
+
+    def _stamp(self, created: float) -> str:
+        # Messages logged within the same second share one formatted timestamp and date
+        second = int(created)
+        if second != self.__stamp_second:
+            local = time.localtime(second)
+            self.__stamp_second = second
+            self.__stamp = time.strftime('%Y-%m-%d %H:%M:%S', local)
+            self.__stamp_date = dt.date(local.tm_year, local.tm_mon, local.tm_mday)
+        return self.__stamp
+
+
+_shared_writer: Optional[LogWriter] = None
+_shared_writer_lock = threading.Lock()
+
+
+def shared_log_writer() -> LogWriter:
+    """Returns the LogWriter shared by all buffered loggers of this process."""
+    global _shared_writer
+    with _shared_writer_lock:
+        if _shared_writer is None:
+            _shared_writer = LogWriter()
+        return _shared_writer
+
+
 class Logger(ILogger):
-    def __init__(self, module_name: str, log_level: LogLevel | str):
+    def __init__(self, module_name: str, log_level: LogLevel | str, writer: Optional[LogWriter] = None):
+        """
+        Logs to the daily file in ``logs``, or prints when the level is DEBUG.
+
+        With a ``writer`` file logging is buffered: messages are handed to the writer's
+        background thread instead of being written by the caller. Logging methods of
+        disabled levels are replaced by a no-op when the logger is created.
+        """
         self.__module_name = module_name
+        self.__writer = writer
         self._print_log: Callable[[str], None]
         directory = os.path.dirname(".\\logs\\")
-        if not os.path.exists(directory):
+        if not writer and directory and not os.path.exists(directory):
             os.makedirs(directory)
 
         self._log_file_dir = directory
@@ -36,34 +193,41 @@ class Logger(ILogger):
         else:
             self._print_log = self._log_to_file
 
+        for level in LogLevel:
+            if level < self.__min_level:
+                setattr(self, f"log_{level.name.lower()}", self._skip)
+
 
     def log_debug(self, message: str) -> Self:
-        if self.__min_level <= LogLevel.DEBUG:
-            self._print_log(self._get_log_line('DEBUG', message))
-        return self
+        return self._log(LogLevel.DEBUG, 'DEBUG', message)
 
 
     def log_info(self, message: str) -> Self:
-        if self.__min_level <= LogLevel.INFO:
-            self._print_log(self._get_log_line('INFO', message))
-        return self
+        return self._log(LogLevel.INFO, 'INFO', message)
 
 
     def log_warning(self, message: str) -> Self:
-        if self.__min_level <= LogLevel.WARNING:
-            self._print_log(self._get_log_line('WARNING', message))
-        return self
+        return self._log(LogLevel.WARNING, 'WARNING', message)
 
 
     def log_error(self, message: str) -> Self:
-        if self.__min_level <= LogLevel.ERROR:
-            self._print_log(self._get_log_line('ERROR', message))
-        return self
+        return self._log(LogLevel.ERROR, 'ERROR', message)
 
 
     def log_critical(self, message: str) -> Self:
-        if self.__min_level <= LogLevel.CRITICAL:
-            self._print_log(self._get_log_line('CRITICAL', message))
+        return self._log(LogLevel.CRITICAL, 'CRITICAL', message)
+
+
+    def _skip(self, message: str) -> Self:
+        return self
+
+
+    def _log(self, level: LogLevel, log_type: str, message: str) -> Self:
+        if self.__min_level <= level:
+            if self.__writer and self.__min_level != LogLevel.DEBUG:
+                self.__writer.write(time.time(), log_type, self.__module_name, message)
+            else:
+                self._print_log(self._get_log_line(log_type, message))
         return self
 
 
@@ -76,7 +240,4 @@ class Logger(ILogger):
 
     def _get_log_line(self, log_type: str, message: str) -> str:
         log_date: str = dt.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        cleaned_msg = message.replace('\r', '').replace('\n', '')
-        return '[{:^10}] {:>10} : {} - {}'.format(log_date, log_type, self.__module_name, cleaned_msg)
-
-
+        return _format_line(log_date, log_type, self.__module_name, message)
@@ -0,0 +1,278 @@
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any, Callable, Generator, Optional, Self, TypeVar
+
+if TYPE_CHECKING:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Upper bounds in seconds, from a cached page parse up to a slow, retried request
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        """Counts observations per bucket, the last bucket catches everything above the highest bound."""
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+    def quantile(self, q: float) -> float:
+        """Estimates the ``q`` quantile by interpolating inside the bucket that contains it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        Thread-safe counters and latency histograms of a scrape, identified by a name
+        and optional labels, e.g. ``inc("http_requests_total", status=200)``.
+        """
+        self.__lock = threading.Lock()
+        self.__counters: dict[tuple[str, Labels], float] = {}
+        self.__histograms: dict[tuple[str, Labels], Histogram] = {}
+        self.__started = time.monotonic()
+
+
+    def inc(self, name: str, value: float = 1, **labels: object):
+        key = (name, self._labels(labels))
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+
+    def observe(self, name: str, value: float, **labels: object):
+        key = (name, self._labels(labels))
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = Histogram()
+            histogram.observe(value)
+
+
+    @contextmanager
+    def timer(self, name: str, **labels: object) -> Generator[None, None, None]:
+        """Observes the seconds spent in the ``with`` block, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+
+    def timed(self, name: str, **labels: object) -> Callable[[F], F]:
+        """Decorator form of ``timer``, for timing every call of a function or method."""
+        def decorator(function: F) -> F:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return function(*args, **kwargs)
+            return wrapper  # type: ignore[return-value]
+        return decorator
+
+
+    def counter(self, name: str, **labels: object) -> float:
+        with self.__lock:
+            return self.__counters.get((name, self._labels(labels)), 0)
+
+
+    def drain(self) -> dict:
+        """Returns the raw metrics gathered since the last drain and starts from zero, for ``merge``."""
+        with self.__lock:
+            counters = list(self.__counters.items())
+            histograms = [(key, h.counts, h.sum) for key, h in self.__histograms.items()]
+            self.__counters.clear()
+            self.__histograms.clear()
+        return {"counters": counters, "histograms": histograms}
+
+
+    def merge(self, drained: dict):
+        """Adds metrics drained from another registry, e.g. one of a worker process."""
+        with self.__lock:
+            for key, value in drained["counters"]:
+                self.__counters[key] = self.__counters.get(key, 0) + value
+            for key, counts, total in drained["histograms"]:
+                histogram = self.__histograms.get(key)
+                if histogram is None:
+                    histogram = self.__histograms[key] = Histogram()
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.count += sum(counts)
+                histogram.sum += total
+
+
+    def reset(self):
+        with self.__lock:
+            self.__counters.clear()
+            self.__histograms.clear()
+            self.__started = time.monotonic()
+
+
+    def snapshot(self) -> dict:
+        """Returns all metrics as plain data, with p50/p99 of every histogram and items per second."""
+        with self.__lock:
+            uptime = time.monotonic() - self.__started
+            counters = {self._key(name, labels): value for (name, labels), value in self.__counters.items()}
+            histograms = {
+                self._key(name, labels): {"count": h.count, "sum": h.sum, "p50": h.quantile(0.5),
+                                          "p99": h.quantile(0.99)}
+                for (name, labels), h in self.__histograms.items()
+            }
+            items = sum(v for (name, _), v in self.__counters.items() if name == "items_stored_total")
+        return {"uptime_seconds": uptime, "items_per_second": items / uptime if uptime > 0 else 0.0,
+                "counters": counters, "histograms": histograms}
+
+
+    def to_prometheus(self) -> str:
+        """Renders all metrics in the Prometheus text exposition format."""
+        lines: list[str] = []
+        with self.__lock:
+            typed: set[str] = set()
+            for (name, labels), value in sorted(self.__counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{self._key(name, labels)} {value:g}")
+            for (name, labels), h in sorted(self.__histograms.items(), key=lambda e: e[0]):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                cumulative = 0
+                for bound, bucket_count in zip(h.buckets + (float("inf"),), h.counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self._key(name + '_bucket', labels + (('le', le),))} {cumulative}")
+                lines.append(f"{self._key(name + '_sum', labels)} {h.sum:g}")
+                lines.append(f"{self._key(name + '_count', labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+    @staticmethod
+    def _labels(labels: dict[str, object]) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+    @staticmethod
+    def _key(name: str, labels: Labels) -> str:
+        if not labels:
+            return name
+        return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+# Shared by everything in the process, like the loggers' shared writer
+metrics = MetricsRegistry()
+
+
+class MetricsReporter:
+    def __init__(self, registry: MetricsRegistry = metrics, stats_path: str = "", interval: float = 10.0,
+                 prometheus_port: int = 0):
+        """
+        Publishes ``registry`` while a scrape runs: every ``interval`` seconds (and on
+        ``stop``) its snapshot replaces the JSON file ``stats_path``, and with a
+        ``prometheus_port`` the metrics are served as Prometheus text on
+        ``http://127.0.0.1:<port>/metrics``. Either can be left out.
+        """
+        self.__registry = registry
+        self.__stats_path = stats_path
+        self.__interval = interval
+        self.__prometheus_port = prometheus_port
+        self.__stop = threading.Event()
+        self.__thread: Optional[threading.Thread] = None
+        self.__server: Optional["ThreadingHTTPServer"] = None
+
+
+    def start(self) -> Self:
+        if self.__prometheus_port:
+            # http.server is imported only when the metrics are served, it is slow to import
+            from http.server import ThreadingHTTPServer
+
+            self.__server = ThreadingHTTPServer(("127.0.0.1", self.__prometheus_port), self._handler())
+            threading.Thread(target=self.__server.serve_forever, name="metrics-http", daemon=True).start()
+        if self.__stats_path:
+            self.__stop.clear()
+            self.__thread = threading.Thread(target=self._run, name="metrics-stats", daemon=True)
+            self.__thread.start()
+        return self
+
+
+    def stop(self):
+        if self.__thread is not None:
+            self.__stop.set()
+            self.__thread.join()
+            self.__thread = None
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+
+    def write_stats(self):
+        directory = os.path.dirname(self.__stats_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        temp_file = self.__stats_path + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(self.__registry.snapshot(), f, indent=2)
+        os.replace(temp_file, self.__stats_path)
+
+
+    def __enter__(self) -> Self:
+        return self.start()
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+    def _run(self):
+        while not self.__stop.wait(self.__interval):
+            self.write_stats()
+        self.write_stats()
+
+
+    def _handler(self) -> type["BaseHTTPRequestHandler"]:
+        from http.server import BaseHTTPRequestHandler
+
+        registry = self.__registry
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+
+            def log_message(self, format, *args):
+                pass  # Scrapes of /metrics are not worth a log line
+
+        return MetricsHandler
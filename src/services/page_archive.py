@@ -0,0 +1,86 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+
+class PageArchive:
+    def __init__(self, directory: str):
+        """
+        Compressed, content-addressed archive of fetched pages.
+
+        Every page body is stored once, gzip-compressed, under ``objects/`` and named
+        by its SHA-256 hash. ``index.jsonl`` maps each URL to the hash of the latest
+        body fetched from it, so identical pages fetched from different URLs or on
+        different runs share one object.
+        """
+        self.__objects_dir = os.path.join(directory, "objects")
+        self.__index_path = os.path.join(directory, "index.jsonl")
+        self.__lock = threading.Lock()
+        self.__index: dict[str, str] = {}
+        os.makedirs(self.__objects_dir, exist_ok=True)
+        self._load_index()
+
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.__index
+
+
+    def __len__(self) -> int:
+        return len(self.__index)
+
+
+    def record(self, url: str, content: bytes) -> str:
+        """
+        Stores ``content`` as the latest body of ``url``.
+
+        :return: The SHA-256 hash the body is stored under.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        object_path = self._object_path(digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            temp_file = f"{object_path}.{threading.get_ident()}.tmp"
+            with gzip.open(temp_file, 'wb') as f:
+                f.write(content)
+            os.replace(temp_file, object_path)
+
+        with self.__lock:
+            if self.__index.get(url) != digest:
+                self.__index[url] = digest
+                with open(self.__index_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps({"url": url, "sha256": digest, "fetched_at": time.time()}) + '\n')
+        return digest
+
+
+    def get(self, url: str) -> Optional[bytes]:
+        """Returns the latest archived body of ``url``, or None if it was never recorded."""
+        digest = self.__index.get(url)
+        if digest is None:
+            return None
+        with gzip.open(self._object_path(digest), 'rb') as f:
+            return f.read()
+
+
+    def urls(self) -> list[str]:
+        with self.__lock:
+            return list(self.__index)
+
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.__objects_dir, digest[:2], digest + ".gz")
+
+
+    def _load_index(self):
+        if not os.path.exists(self.__index_path):
+            return
+        with open(self.__index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.__index[entry["url"]] = entry["sha256"]
@@ -0,0 +1,59 @@
+import importlib
+import multiprocessing
+import os
+import signal
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Self
+
+
+class ParsePool:
+    def __init__(self, processes: int = 0, preload: Iterable[str] = ("bs4", "soupsieve", "lxml")):
+        """
+        Long-lived worker processes for CPU-bound parsing, so parsing of pages fetched
+        in parallel is not serialized by the GIL.
+
+        Workers import the ``preload`` modules when they start (missing ones are
+        skipped), so the import cost is paid once per worker and not on the first task.
+        Functions and their arguments are pickled, so submit module-level functions
+        that take and return plain data (bytes, str, dict, list).
+        ``processes`` defaults to the number of CPUs.
+        """
+        self.__processes = processes if processes > 0 else os.cpu_count() or 1
+        self.__executor = ProcessPoolExecutor(self.__processes, mp_context=multiprocessing.get_context("spawn"),
+                                              initializer=_init_worker, initargs=(tuple(preload),))
+
+
+    @property
+    def processes(self) -> int:
+        return self.__processes
+
+
+    def submit(self, function: Callable[..., Any], *args: Any) -> Future:
+        return self.__executor.submit(function, *args)
+
+
+    def run(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Runs ``function(*args)`` in a worker and waits for its result."""
+        return self.submit(function, *args).result()
+
+
+    def close(self):
+        self.__executor.shutdown(wait=True, cancel_futures=True)
+
+
+    def __enter__(self) -> Self:
+        return self
+
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def _init_worker(preload: tuple[str, ...]):
+    # Ctrl+C is handled by the main process; a worker killed by it would break the whole pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
@@ -0,0 +1,244 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+from src.interfaces.logger import ILogger
+from src.interfaces.repository import IDataAccessRepository
+from src.interfaces.web_scrapper import IWebScrapper, IStagedWebScrapper
+from src.services.checkpoint import Checkpointer
+from src.services.metrics import metrics
+
+
+class StageStats:
+    def __init__(self, name: str):
+        """Throughput counters of one pipeline stage."""
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.started = time.monotonic()
+
+
+    @property
+    def items_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.items / elapsed if elapsed > 0 else 0.0
+
+
+    @property
+    def utilization(self) -> float:
+        """Share of the stage's lifetime spent working instead of waiting on its queues."""
+        elapsed = time.monotonic() - self.started
+        return self.busy_seconds / elapsed if elapsed > 0 else 0.0
+
+
+    def __str__(self) -> str:
+        return (f"{self.name}: {self.items} items, {self.items_per_second:.2f} items/s, "
+                f"{self.utilization:.0%} busy")
+
+
+class PipelineRunner:
+    def __init__(self, scrapper: IWebScrapper, repository: IDataAccessRepository, logger: ILogger,
+                 queue_size: int = 100, batch_size: int = 100, stats_interval: float = 60,
+                 checkpointer: Optional[Checkpointer] = None):
+        """
+        Runs scraping and persisting as separate threads joined by bounded queues.
+
+        An ``IStagedWebScrapper`` gets three stages: fetch (``raw_page_items``), parse
+        (``parse_raw_item``) and persist (``upsert_many`` in batches of ``batch_size``).
+        Any other ``IWebScrapper`` gets two: scrape (``page_items``) and persist.
+        A full queue blocks the stage feeding it, so a slow stage slows the others down
+        instead of letting items pile up in memory.
+
+        On KeyboardInterrupt the first stage stops, items already in the queues are
+        still parsed and saved, and the interrupt is raised again once they are.
+
+        Pass the scrapper's ``checkpointer`` to commit its progress only after the
+        items are stored, in the same transaction when the repository supports it.
+        """
+        self.__scrapper = scrapper
+        self.__repository = repository
+        self.__logger = logger
+        self.__queue_size = queue_size
+        self.__batch_size = batch_size
+        self.__stats_interval = stats_interval
+        self.__checkpointer = checkpointer
+        self.__stop = threading.Event()
+        self.__abort = threading.Event()
+        self.__errors: list[BaseException] = []
+        self.stats: list[StageStats] = []
+
+
+    def run(self) -> int:
+        """
+        Scrapes and saves all items.
+
+        :return: The number of items written, without those the repository skipped as unchanged.
+        """
+        self.__stop.clear()
+        self.__abort.clear()
+        self.__errors = []
+        finished = object()
+        persisted = [0]
+
+        if isinstance(self.__scrapper, IStagedWebScrapper):
+            fetched: queue.Queue = queue.Queue(self.__queue_size)
+            parsed: queue.Queue = queue.Queue(self.__queue_size)
+            fetch_stats, parse_stats, persist_stats = StageStats("fetch"), StageStats("parse"), StageStats("persist")
+            workers = [
+                self._thread(fetch_stats, self._produce, self.__scrapper.raw_page_items, fetched, finished, fetch_stats),
+                self._thread(parse_stats, self._transform, self.__scrapper.parse_raw_item, fetched, parsed, finished,
+                             parse_stats),
+                self._thread(persist_stats, self._persist, parsed, finished, persist_stats, persisted),
+            ]
+            self.stats = [fetch_stats, parse_stats, persist_stats]
+        else:
+            scraped: queue.Queue = queue.Queue(self.__queue_size)
+            scrape_stats, persist_stats = StageStats("scrape"), StageStats("persist")
+            workers = [
+                self._thread(scrape_stats, self._produce, self.__scrapper.page_items, scraped, finished, scrape_stats),
+                self._thread(persist_stats, self._persist, scraped, finished, persist_stats, persisted),
+            ]
+            self.stats = [scrape_stats, persist_stats]
+
+        for worker in workers:
+            worker.start()
+
+        interrupted = False
+        last_report = time.monotonic()
+        while any(worker.is_alive() for worker in workers):
+            try:
+                for worker in workers:
+                    worker.join(timeout=0.5)
+                if time.monotonic() - last_report >= self.__stats_interval:
+                    self._report()
+                    last_report = time.monotonic()
+            except KeyboardInterrupt:
+                # Stop producing, but let the items already scraped reach the repository
+                self.__logger.log_warning("def:run - interrupted, saving items already scraped")
+                interrupted = True
+                self.__stop.set()
+
+        self._report()
+        if self.__errors:
+            raise self.__errors[0]
+        if interrupted:
+            raise KeyboardInterrupt()
+        return persisted[0]
+
+
+    def _thread(self, stats: StageStats, target: Callable, *args: Any) -> threading.Thread:
+        def run():
+            try:
+                target(*args)
+            except BaseException as e:
+                self.__logger.log_error(f"def:run - stage {stats.name} failed: {e}")
+                self.__errors.append(e)
+                # Stages waiting on a queue must not wait forever for a stage that died
+                self.__abort.set()
+
+        return threading.Thread(target=run, name=f"pipeline-{stats.name}", daemon=True)
+
+
+    def _produce(self, source: Callable[[], Iterable], output: queue.Queue, finished: object, stats: StageStats):
+        items = iter(source())
+        try:
+            while not self.__stop.is_set() and not self.__abort.is_set():
+                started = time.monotonic()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    break
+                stats.busy_seconds += time.monotonic() - started
+                stats.items += 1
+                if not self._put(output, item):
+                    return
+        finally:
+            # Runs the generator's cleanup in the thread that iterated it
+            close = getattr(items, "close", None)
+            if close:
+                close()
+        self._put(output, finished)
+
+
+    def _transform(self, transform: Callable[[Any], Any], source: queue.Queue, output: queue.Queue,
+                   finished: object, stats: StageStats):
+        while (item := self._get(source)) is not finished:
+            if item is None:
+                return
+            started = time.monotonic()
+            result = transform(item)
+            stats.busy_seconds += time.monotonic() - started
+            stats.items += 1
+            if not self._put(output, result):
+                return
+        self._put(output, finished)
+
+
+    def _persist(self, source: queue.Queue, finished: object, stats: StageStats, persisted: list[int]):
+        batch: list[dict] = []
+        # Items received, stored or skipped, which is what the checkpoint counts
+        received = 0
+        try:
+            while True:
+                # Waiting briefly lets a partial batch, and the progress past it, be saved while
+                # the upstream stages are slow; the scrapper may wait for those items to be saved
+                item = self._get(source, timeout=1.0 if batch or self.__checkpointer else None)
+                if item is None and self.__abort.is_set():
+                    return
+                if item is not None and item is not finished:
+                    received += 1
+                    if item.get("id"):
+                        batch.append(item)
+                    else:
+                        metrics.inc("items_skipped_total")
+                        self.__logger.log_warning(f"def:persist - item without id skipped: {item}")
+                if batch and (item is None or item is finished or len(batch) >= self.__batch_size):
+                    started = time.monotonic()
+                    if self.__checkpointer:
+                        written = self.__checkpointer.persist(self.__repository, batch, received)
+                    else:
+                        written = self.__repository.upsert_many(batch)
+                    stats.busy_seconds += time.monotonic() - started
+                    stats.items += len(batch)
+                    persisted[0] += written
+                    metrics.inc("items_stored_total", written)
+                    batch = []
+                elif not batch and self.__checkpointer:
+                    self.__checkpointer.commit(received, self.__repository.flush)
+                    if item is None:
+                        self.__checkpointer.flush(self.__repository.flush)
+                if item is finished:
+                    return
+        finally:
+            if self.__checkpointer:
+                self.__checkpointer.flush(self.__repository.flush)
+
+
+    def _put(self, output: queue.Queue, item: Any) -> bool:
+        while not self.__abort.is_set():
+            try:
+                output.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+    def _get(self, source: queue.Queue, timeout: Optional[float] = None) -> Any:
+        """Returns the next item, or None when ``timeout`` passed or the pipeline was aborted."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self.__abort.is_set():
+            wait = 0.5 if deadline is None else min(0.5, deadline - time.monotonic())
+            if wait <= 0:
+                return None
+            try:
+                return source.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return None
+
+
+    def _report(self):
+        for stats in self.stats:
+            self.__logger.log_info(f"def:run - {stats}")
@@ -0,0 +1,235 @@
+import multiprocessing
+import threading
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1):
+        """
+        Thread-safe token bucket shared by everything that sends requests.
+
+        Tokens are added at ``rate`` per second up to ``capacity``. ``acquire``
+        reserves a token and sleeps until it becomes available, so concurrent
+        callers are spread evenly over time instead of firing in bursts.
+        A ``rate`` of 0 or less disables limiting.
+        """
+        self.__rate = rate
+        self.__capacity = max(capacity, 1)
+        self.__tokens = self.__capacity
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Takes ``tokens`` from the bucket, waiting until they are available.
+
+        :return: The number of seconds the caller had to wait.
+        """
+        wait = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+    async def acquire_async(self, tokens: float = 1) -> float:
+        """Same as ``acquire``, but waits with ``asyncio.sleep`` so the event loop keeps running."""
+        # Imported on first use, only the async scrape needs the event loop
+        import asyncio
+
+        wait = self._reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+    def __getstate__(self) -> dict:
+        # A lock cannot be pickled, an unpickled copy gets a lock of its own
+        state = self.__dict__.copy()
+        del state["_TokenBucket__lock"]
+        return state
+
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+
+    @property
+    def rate(self) -> float:
+        return self.__rate
+
+
+    def record(self, status: Optional[int], seconds: float):
+        """
+        Feedback about a finished request: its status code (None when it failed without
+        a response) and how long it took. A fixed-rate bucket ignores it.
+        """
+        pass
+
+
+    @property
+    def capacity(self) -> float:
+        return self.__capacity
+
+
+    def _set_rate(self, rate: float):
+        with self.__lock:
+            if self.__rate > 0:
+                # Tokens earned so far count at the old rate
+                self.__tokens, self.__updated, _ = self._take(self.__tokens, self.__updated, 0)
+            else:
+                self.__tokens, self.__updated = self.__capacity, time.monotonic()
+            self.__rate = rate
+
+
+    def _reserve(self, tokens: float) -> float:
+        with self.__lock:
+            if self.__rate <= 0:
+                return 0.0
+            self.__tokens, self.__updated, wait = self._take(self.__tokens, self.__updated, tokens)
+            return wait
+
+
+    def _take(self, available: float, updated: float, tokens: float) -> tuple[float, float, float]:
+        """
+        Refills ``available`` for the time passed since ``updated`` and takes ``tokens``.
+
+        :return: The tokens left, the refill time and the seconds to wait for the taken tokens.
+        """
+        now = time.monotonic()
+        rate = self.rate
+        available = min(self.__capacity, available + (now - updated) * rate)
+        # Reserve the tokens now, going into debt if needed, so later callers queue behind us
+        available -= tokens
+        return available, now, -available / rate if available < 0 else 0.0
+
+
+class SharedTokenBucket(TokenBucket):
+    def __init__(self, rate: float, capacity: float = 1, context: Optional[multiprocessing.context.BaseContext] = None):
+        """
+        Token bucket kept in shared memory, so every process it is handed to when
+        starting draws from one request budget. Pass it to worker processes as a
+        process argument (e.g. a pool ``initializer``), not through a task queue.
+        The rate is shared too, so a rate change in one process applies to all.
+        """
+        super().__init__(rate, capacity)
+        context = context or multiprocessing.get_context("spawn")
+        # [tokens, last refill time, rate]; time.monotonic is system wide, so all processes agree on it
+        self.__state = context.Array('d', [self.capacity, time.monotonic(), rate])
+
+
+    @property
+    def rate(self) -> float:
+        return self.__state[2]
+
+
+    def _shared_lock(self):
+        """The lock of the shared state, re-entrant and held across processes."""
+        return self.__state.get_lock()
+
+
+    def _set_rate(self, rate: float):
+        with self.__state.get_lock():
+            if self.__state[2] > 0:
+                # Tokens earned so far count at the old rate
+                self.__state[0], self.__state[1], _ = self._take(self.__state[0], self.__state[1], 0)
+            else:
+                self.__state[0], self.__state[1] = self.capacity, time.monotonic()
+            self.__state[2] = rate
+
+
+    def _reserve(self, tokens: float) -> float:
+        with self.__state.get_lock():
+            if self.__state[2] <= 0:
+                return 0.0
+            self.__state[0], self.__state[1], wait = self._take(self.__state[0], self.__state[1], tokens)
+            return wait
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    def __init__(self, rate: float, min_rate: float = 0.1, max_rate: float = 10.0, capacity: float = 1,
+                 increase: float = 0.5, decrease: float = 0.5, latency_target: float = 2.0, cooldown: float = 1.0):
+        """
+        Token bucket that finds the highest request rate the site answers well (AIMD).
+
+        Every healthy response raises the rate by ``increase / rate``, so about
+        ``increase`` requests per second more each second, up to ``max_rate``. A 429 or
+        5xx answer, a failed request or a response slower than ``latency_target``
+        seconds multiplies the rate by ``decrease``, down to ``min_rate``. Requests that
+        were already in flight fail together, so the rate drops at most once per
+        ``cooldown`` seconds.
+        """
+        super().__init__(min(max(rate, min_rate), max_rate), capacity)
+        self.__min_rate = min_rate
+        self.__max_rate = max_rate
+        self.__increase = increase
+        self.__decrease = decrease
+        self.__latency_target = latency_target
+        self.__cooldown = cooldown
+        self.__decreased_at = 0.0
+        self.__feedback_lock = threading.Lock()
+
+
+    def record(self, status: Optional[int], seconds: float):
+        healthy = status is not None and status != 429 and status < 500 and seconds <= self.__latency_target
+        with self._feedback_lock():
+            if healthy:
+                rate = min(self.__max_rate, self.rate + self.__increase / max(self.rate, 1.0))
+            else:
+                now = time.monotonic()
+                if now - self._last_decrease() < self.__cooldown:
+                    return
+                self._mark_decrease(now)
+                rate = max(self.__min_rate, self.rate * self.__decrease)
+            if rate != self.rate:
+                self._set_rate(rate)
+
+
+    def _feedback_lock(self):
+        return self.__feedback_lock
+
+
+    def _last_decrease(self) -> float:
+        return self.__decreased_at
+
+
+    def _mark_decrease(self, now: float):
+        self.__decreased_at = now
+
+
+    def __getstate__(self) -> dict:
+        state = super().__getstate__()
+        del state["_AdaptiveRateLimiter__feedback_lock"]
+        return state
+
+
+    def __setstate__(self, state: dict):
+        super().__setstate__(state)
+        self.__feedback_lock = threading.Lock()
+
+
+class SharedAdaptiveRateLimiter(AdaptiveRateLimiter, SharedTokenBucket):
+    def __init__(self, rate: float, min_rate: float = 0.1, max_rate: float = 10.0, capacity: float = 1,
+                 increase: float = 0.5, decrease: float = 0.5, latency_target: float = 2.0, cooldown: float = 1.0):
+        """
+        ``AdaptiveRateLimiter`` kept in shared memory like a ``SharedTokenBucket``: all
+        processes draw from one budget and feed one rate, so N processes together stay
+        at the rate the site answers well instead of running N limiters of their own.
+        """
+        super().__init__(rate, min_rate, max_rate, capacity, increase, decrease, latency_target, cooldown)
+        # Guarded by the lock of the shared state
+        self.__decreased_at = multiprocessing.get_context("spawn").Value('d', 0.0, lock=False)
+
+
+    def _feedback_lock(self):
+        return self._shared_lock()
+
+
+    def _last_decrease(self) -> float:
+        return self.__decreased_at.value
+
+
+    def _mark_decrease(self, now: float):
+        self.__decreased_at.value = now
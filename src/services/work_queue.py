@@ -0,0 +1,202 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterable, Optional
+
+from src.interfaces.logger import ILogger
+from src.interfaces.work_queue import IWorkQueue, WorkItem
+from src.services.metrics import metrics
+
+# Listing pages are leased first, they are what discovers the detail pages
+_PRIORITIES = {"listing": 0, "detail": 1}
+_STATES = ("pending", "leased", "done", "failed")
+
+
+class SqliteWorkQueue(IWorkQueue):
+    def __init__(self, db_path: str, logger: ILogger, lease_seconds: float = 300.0, max_attempts: int = 5,
+                 retry_delay: float = 30.0, journal_mode: str = "WAL", busy_timeout: float = 30.0):
+        """
+        Work queue kept in the SQLite file ``db_path``, shared by every worker process
+        that opens the same file.
+
+        A lease lasts ``lease_seconds``. When it expires before the item is acked, the
+        next ``lease`` call of any worker puts the item back to pending, so the work of
+        a crashed worker is picked up by the others. An item is tried ``max_attempts``
+        times; a failed attempt waits ``retry_delay`` seconds, doubled with every attempt.
+
+        Workers on other machines can share a file on a network volume. WAL journaling
+        needs shared memory, so pass ``journal_mode="DELETE"`` there. Writers wait up to
+        ``busy_timeout`` seconds for each other.
+        """
+        self.__logger = logger
+        self.__lease_seconds = lease_seconds
+        self.__max_attempts = max(max_attempts, 1)
+        self.__retry_delay = retry_delay
+        self.__lock = threading.Lock()
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        self.conn = sqlite3.connect(db_path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self.conn.execute(f"PRAGMA journal_mode = {journal_mode};")
+        self.conn.execute("PRAGMA synchronous = NORMAL;")
+        self._create_tables()
+
+
+    def _create_tables(self):
+        with self.__lock:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS work_items (
+                    id INTEGER PRIMARY KEY,
+                    url TEXT NOT NULL UNIQUE,
+                    kind TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    payload TEXT,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    available_at REAL NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    last_error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS ix_work_items_pending ON work_items (priority, id)
+                    WHERE state = 'pending';
+                CREATE INDEX IF NOT EXISTS ix_work_items_leased ON work_items (lease_expires)
+                    WHERE state = 'leased';
+            """)
+
+
+    def enqueue(self, entries: Iterable[tuple[str, Optional[dict]]], kind: str) -> int:
+        rows = [(url, kind, _PRIORITIES[kind], json.dumps(payload, ensure_ascii=False) if payload is not None else None)
+                for url, payload in entries]
+        if not rows:
+            return 0
+        with self.__lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                before = self.conn.total_changes
+                self.conn.executemany("INSERT INTO work_items (url, kind, priority, payload) VALUES (?, ?, ?, ?) "
+                                      "ON CONFLICT (url) DO NOTHING", rows)
+                added = self.conn.total_changes - before
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        metrics.inc("work_items_enqueued_total", added, kind=kind)
+        return added
+
+
+    def lease(self, owner: str, limit: int) -> list[WorkItem]:
+        now = time.time()
+        with self.__lock:
+            # Taken as a write transaction right away, so two workers never lease the same item
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                reclaimed, failed = self._reclaim(now)
+                rows = self.conn.execute("""
+                    UPDATE work_items
+                    SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+                    WHERE id IN (SELECT id FROM work_items
+                                 WHERE state = 'pending' AND available_at <= ?
+                                 ORDER BY priority, id LIMIT ?)
+                    RETURNING id, url, kind, payload, attempts, priority
+                """, (owner, now + self.__lease_seconds, now, max(limit, 1))).fetchall()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        if reclaimed:
+            self.__logger.log_warning(f"def:lease - {reclaimed} expired leases reclaimed")
+            metrics.inc("work_leases_reclaimed_total", reclaimed)
+        if failed:
+            self.__logger.log_error(f"def:lease - {failed} items failed, their last lease expired")
+            metrics.inc("work_items_failed_total", failed)
+        metrics.inc("work_items_leased_total", len(rows))
+        rows.sort(key=lambda r: (r[5], r[0]))
+        return [WorkItem(item_id, url, kind, json.loads(payload) if payload is not None else None, attempts)
+                for item_id, url, kind, payload, attempts, _ in rows]
+
+
+    def ack(self, item_id: int, owner: str) -> bool:
+        with self.__lock:
+            acked = self.conn.execute("UPDATE work_items SET state = 'done', lease_owner = NULL, lease_expires = NULL "
+                                      "WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+                                      (item_id, owner)).rowcount == 1
+        if acked:
+            metrics.inc("work_items_acked_total")
+        else:
+            self.__logger.log_warning(f"def:ack - Lease of item {item_id} was lost by {owner}")
+        return acked
+
+
+    def fail(self, item_id: int, owner: str, error: str):
+        with self.__lock:
+            row = self.conn.execute("SELECT attempts FROM work_items WHERE id = ? AND state = 'leased' "
+                                    "AND lease_owner = ?", (item_id, owner)).fetchone()
+            if row is None:
+                return
+            if row[0] >= self.__max_attempts:
+                self.conn.execute("UPDATE work_items SET state = 'failed', lease_owner = NULL, lease_expires = NULL, "
+                                  "last_error = ? WHERE id = ?", (error, item_id))
+            else:
+                delay = self.__retry_delay * 2 ** (row[0] - 1)
+                self.conn.execute("UPDATE work_items SET state = 'pending', lease_owner = NULL, lease_expires = NULL, "
+                                  "available_at = ?, last_error = ? WHERE id = ?",
+                                  (time.time() + delay, error, item_id))
+        if row[0] >= self.__max_attempts:
+            self.__logger.log_error(f"def:fail - Item {item_id} failed after {row[0]} attempts: {error}")
+            metrics.inc("work_items_failed_total")
+        else:
+            metrics.inc("work_items_retried_total")
+
+
+    def release(self, item_ids: Iterable[int], owner: str):
+        rows = [(item_id, owner) for item_id in item_ids]
+        if not rows:
+            return
+        with self.__lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany("UPDATE work_items SET state = 'pending', lease_owner = NULL, "
+                                      "lease_expires = NULL, attempts = attempts - 1 "
+                                      "WHERE id = ? AND state = 'leased' AND lease_owner = ?", rows)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+
+    def counts(self) -> dict[str, int]:
+        with self.__lock:
+            rows = self.conn.execute("SELECT state, COUNT(*) FROM work_items GROUP BY state").fetchall()
+        counts = dict.fromkeys(_STATES, 0)
+        counts.update(rows)
+        return counts
+
+
+    def failed_items(self) -> list[tuple[str, Optional[str]]]:
+        """Returns the URL and the last error of every item that ran out of attempts."""
+        with self.__lock:
+            return self.conn.execute("SELECT url, last_error FROM work_items WHERE state = 'failed' "
+                                     "ORDER BY id").fetchall()
+
+
+    def clear(self):
+        with self.__lock:
+            # A worker that finished later must not empty the crawl another worker already started again
+            self.conn.execute("DELETE FROM work_items WHERE NOT EXISTS "
+                              "(SELECT 1 FROM work_items WHERE state IN ('pending', 'leased'))")
+
+
+    def close(self):
+        with self.__lock:
+            self.conn.close()
+
+
+    def _reclaim(self, now: float) -> tuple[int, int]:
+        """Returns the number of expired leases put back to pending and of those that ran out of attempts."""
+        # Runs inside the lease transaction
+        failed = self.conn.execute("UPDATE work_items SET state = 'failed', lease_owner = NULL, lease_expires = NULL, "
+                                   "last_error = 'lease expired' WHERE state = 'leased' AND lease_expires <= ? "
+                                   "AND attempts >= ?", (now, self.__max_attempts)).rowcount
+        reclaimed = self.conn.execute("UPDATE work_items SET state = 'pending', lease_owner = NULL, lease_expires = NULL "
+                                      "WHERE state = 'leased' AND lease_expires <= ?", (now,)).rowcount
+        return reclaimed, failed
@@ -0,0 +1,26 @@
+from typing import Self
+from src.interfaces.logger import ILogger
+
+
+class MockLogger(ILogger):
+    """Logger of the tests, printing only errors, which pytest shows for failed tests."""
+    def log_debug(self, message: str) -> Self:
+        return self
+
+
+    def log_info(self, message: str) -> Self:
+        return self
+
+
+    def log_warning(self, message: str) -> Self:
+        return self
+
+
+    def log_error(self, message: str) -> Self:
+        print(f"ERROR: {message}")
+        return self
+
+
+    def log_critical(self, message: str) -> Self:
+        print(f"CRITICAL: {message}")
+        return self
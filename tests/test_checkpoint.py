@@ -0,0 +1,33 @@
+import os
+from src.services.checkpoint import Checkpointer, JsonCheckpointStore
+
+
+def test_checkpointer_saves_progress_of_stored_items_in_batches(tmpdir):
+    # given
+    store = JsonCheckpointStore(os.path.join(tmpdir, "state.json"))
+    checkpointer = Checkpointer(store, every=2, interval=1000)
+    checkpointer.start()
+    counts = [checkpointer.track({"page_number": 1, "item_number": i}) for i in range(1, 4)]
+
+    # when, then
+    checkpointer.commit(counts[0])
+    assert store.load() is None
+    checkpointer.commit(counts[1])
+    assert store.load() == {"page_number": 1, "item_number": 2}
+    checkpointer.advance({"page_number": 2, "item_number": 0})
+    checkpointer.flush()
+    assert store.load() == {"page_number": 1, "item_number": 2}
+    checkpointer.commit(counts[2])
+    checkpointer.flush()
+    assert store.load() == {"page_number": 2, "item_number": 0}
+    assert os.listdir(tmpdir) == ["state.json"]
+
+
+def test_json_checkpoint_store_ignores_a_torn_file(tmpdir):
+    # given
+    path = os.path.join(tmpdir, "state.json")
+    with open(path, "w") as f:
+        f.write('{"page_number": 3, "item_')
+
+    # when, then
+    assert JsonCheckpointStore(path).load() is None
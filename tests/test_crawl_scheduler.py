@@ -0,0 +1,180 @@
+import app
+import json
+import multiprocessing
+import os
+import pytest
+import time
+from typing import Generator, Optional
+from src.business_logic.app_settings import AppSettings
+from src.interfaces.web_scrapper import IWebScrapper
+from src.services.checkpoint import Checkpointer, JsonCheckpointStore
+from src.services.crawl_scheduler import CrawlScheduler, category_key, namespaced_path
+from src.services.rate_limiter import SharedAdaptiveRateLimiter, SharedTokenBucket, TokenBucket
+from mock_logger import MockLogger
+
+
+class CategoryScrapper(IWebScrapper):
+    """Yields three items of its category and tracks its progress with ``checkpointer``."""
+    def __init__(self, url: str, checkpointer: Checkpointer):
+        self.url = url
+        self.checkpointer = checkpointer
+        self.completed = False
+
+
+    def page_items(self) -> Generator[dict, None, None]:
+        if "broken" in self.url:
+            raise ConnectionError("site is down")
+        self.checkpointer.start()
+        start = (self.checkpointer.load() or {}).get("item_number", 0)
+        for i in range(start, 3):
+            self.checkpointer.track({"item_number": i + 1})
+            yield {"id": f"{category_key(self.url)}-{i}", "pid": os.getpid()}
+        self.completed = True
+
+
+    @property
+    def is_completed(self) -> bool:
+        return self.completed
+
+
+    def clear_state(self):
+        pass
+
+
+def create_category_scrapper(url: str, state_file: str, rate_limiter: Optional[TokenBucket],
+                             checkpointer: Checkpointer) -> IWebScrapper:
+    return CategoryScrapper(url, checkpointer)
+
+
+def take_tokens(bucket: SharedTokenBucket, count: int, start=None, taken=None):
+    if start is not None:
+        start.wait()
+    for _ in range(count):
+        bucket.acquire()
+        if taken is not None:
+            taken.put(time.monotonic())
+
+
+def record_overload(limiter: SharedAdaptiveRateLimiter):
+    limiter.record(503, 0.1)
+
+
+def test_scheduler_crawls_categories_in_processes_with_namespaced_state(tmpdir):
+    # given
+    urls = [f"https://www.ikea.lt/lt/products/virtuve/category-{n}" for n in range(3)]
+    state_file = os.path.join(tmpdir, "state.json")
+    scheduler = CrawlScheduler(urls, create_category_scrapper, MockLogger(), processes=3, state_file=state_file)
+
+    # when
+    items = list(scheduler.page_items())
+
+    # then
+    assert sorted(i["id"] for i in items) == sorted(f"{category_key(u)}-{i}" for u in urls for i in range(3))
+    assert len({i["pid"] for i in items} - {os.getpid()}) > 1
+    assert all(os.path.exists(namespaced_path(state_file, u)) for u in urls)
+    assert scheduler.is_completed
+    scheduler.clear_state()
+    assert not os.listdir(tmpdir)
+
+
+def test_categories_resume_after_the_last_item_the_main_process_stored(tmpdir):
+    # given, three items received but only the first one stored
+    url = "https://www.ikea.lt/lt/products/virtuve/category"
+    state_file = os.path.join(tmpdir, "state.json")
+    checkpointer = Checkpointer(JsonCheckpointStore(os.path.join(tmpdir, "main.json")), every=1)
+    scheduler = CrawlScheduler([url], create_category_scrapper, MockLogger(), processes=1, state_file=state_file,
+                               checkpointer=checkpointer)
+    items = scheduler.page_items()
+    received = [next(items) for _ in range(3)]
+    checkpointer.commit(1)
+
+    # when, the crawl stops and runs again, storing every item
+    items.close()
+    with open(namespaced_path(state_file, url)) as f:
+        state = json.load(f)
+    resumed: list[dict] = []
+    for item in scheduler.page_items():
+        resumed.append(item)
+        checkpointer.commit(len(resumed))
+
+    # then
+    assert len(received) == 3
+    assert state == {"item_number": 1}
+    assert [i["id"] for i in resumed] == [f"{category_key(url)}-{i}" for i in (1, 2)]
+    assert scheduler.is_completed
+    with open(namespaced_path(state_file, url)) as f:
+        assert json.load(f) == {"item_number": 3}
+
+
+def test_scheduler_reports_failed_categories_and_retries_only_them(tmpdir):
+    # given
+    urls = ["https://www.ikea.lt/lt/products/virtuve/ok", "https://www.ikea.lt/lt/products/virtuve/broken"]
+    scheduler = CrawlScheduler(urls, create_category_scrapper, MockLogger(), processes=2,
+                               state_file=os.path.join(tmpdir, "state.json"))
+    items: list[dict] = []
+
+    # when
+    with pytest.raises(RuntimeError, match="1 of 2 categories failed"):
+        for item in scheduler.page_items():
+            items.append(item)
+
+    # then
+    assert len(items) == 3
+    assert not scheduler.is_completed
+    with pytest.raises(RuntimeError, match="1 of 1 categories failed"):
+        list(scheduler.page_items())
+
+
+def test_shared_token_bucket_is_one_budget_for_all_processes():
+    # given, a budget of 12 requests that practically never refills
+    context = multiprocessing.get_context("spawn")
+    bucket = SharedTokenBucket(rate=0.001, capacity=12, context=context)
+    workers = [context.Process(target=take_tokens, args=(bucket, 4)) for _ in range(3)]
+
+    # when
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # then, the workers used up the budget of this process too
+    assert [w.exitcode for w in workers] == [0, 0, 0]
+    assert bucket._reserve(1) > 100
+
+
+def test_interval_alone_spaces_requests_of_all_processes(tmpdir):
+    # given, one request per 0.05 s and no RequestsPerSecond
+    settings_path = os.path.join(tmpdir, "config.json")
+    with open(settings_path, "w") as f:
+        json.dump({"Scrapping": {"Urls": ["https://www.ikea.lt/a", "https://www.ikea.lt/b"], "Interval": 0.05}}, f)
+    bucket = app.create_rate_limiter(AppSettings(settings_path), shared=True)
+    context = multiprocessing.get_context("spawn")
+    start, taken = context.Event(), context.Queue()
+    workers = [context.Process(target=take_tokens, args=(bucket, 4, start, taken)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+
+    # when, all processes start requesting at once
+    start.set()
+    times = sorted(taken.get(timeout=30) for _ in range(12))
+    for worker in workers:
+        worker.join()
+
+    # then, 12 requests at 20 per second together
+    assert isinstance(bucket, SharedTokenBucket)
+    assert times[-1] - times[0] >= 0.5
+
+
+def test_shared_adaptive_rate_is_lowered_for_all_processes():
+    # given
+    limiter = SharedAdaptiveRateLimiter(rate=4, max_rate=10, cooldown=60)
+    worker = multiprocessing.get_context("spawn").Process(target=record_overload, args=(limiter,))
+
+    # when
+    worker.start()
+    worker.join()
+    limiter.record(503, 0.1)
+
+    # then, halved once by the other process, then held by the shared cooldown
+    assert worker.exitcode == 0
+    assert limiter.rate == 2
@@ -0,0 +1,696 @@
+import asyncio
+import os
+import threading
+import time
+import pytest
+from src.business_logic import ikea_scrapper
+from bs4 import BeautifulSoup
+from src.accessdata.jsonl_repository import JsonlRepository
+from src.accessdata.sql_repository import SqlRepository
+from src.business_logic.ikea_scrapper import IkeaScrapper, merge_page_items, parse_listing_page, resolve_parser, \
+    retry_after_seconds
+from src.interfaces.async_transport import IAsyncTransport, TransportResponse
+from src.services.checkpoint import Checkpointer, JsonCheckpointStore
+from src.services import http_transport
+from src.services.fingerprint_store import FingerprintStore
+from src.services.http_cache import HttpCache
+from src.services.metrics import metrics
+from src.services.page_archive import PageArchive
+from src.services.parse_pool import ParsePool
+from src.services.pipeline import PipelineRunner
+from src.services.rate_limiter import AdaptiveRateLimiter, TokenBucket
+from src.services.work_queue import SqliteWorkQueue
+from benchmarks import ikea_pages
+from mock_logger import MockLogger
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, text: str = "", headers: dict[str, str] = None):
+        self.status_code = status_code
+        self.content = text.encode("utf-8")
+        self.headers: dict[str, str] = headers or {}
+
+
+class FakeTransport(IAsyncTransport):
+    def __init__(self, pages: dict[str, str]):
+        self.pages = pages
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+    async def get(self, url: str, headers: dict[str, str]) -> TransportResponse:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            if url in self.pages:
+                return TransportResponse(200, self.pages[url].encode("utf-8"))
+            return TransportResponse(404, b"")
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def site(monkeypatch, tmpdir):
+    # The scrapper keeps its resume state relative to the working directory
+    monkeypatch.chdir(tmpdir)
+    pages = ikea_pages.site(pages=2, per_page=5)
+    requested: list[str] = []
+
+    def fake_get(session, url, headers=None, **kwargs):
+        requested.append(url)
+        if url in pages:
+            etag = f'"{len(pages[url])}"'
+            if (headers or {}).get("If-None-Match") == etag:
+                return FakeResponse(304, headers={"ETag": etag})
+            # Earlier cards answer slower, so a parallel fetch completes out of page order
+            if "item-" in url:
+                time.sleep(0.01 * (5 - int(url[-5:-2]) % 5))
+            return FakeResponse(200, pages[url], {"ETag": etag})
+        return FakeResponse(404)
+
+    monkeypatch.setattr(ikea_scrapper.requests.Session, "get", fake_get)
+    return requested
+
+
+def test_page_items_yields_all_items_in_page_order(site):
+    # given
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0)
+
+    # when
+    items = list(scrapper.page_items())
+
+    # then
+    assert [i["id"] for i in items] == [ikea_pages.item_id(p, i) for p in (1, 2) for i in range((p - 1) * 5, p * 5)]
+    assert items[0]["details"] == [{"Plotis": "60,0 cm"}, {"Gylis": "37,0 cm"}]
+    assert items[0]["price"] == "10"
+    assert scrapper.is_completed
+
+
+def test_scrape_records_request_and_parse_metrics(site):
+    # given
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0)
+    requests_before = metrics.counter("http_requests_total", status=200)
+    parses_before = metrics.snapshot()["histograms"].get('parse_seconds{page="detail"}', {}).get("count", 0)
+
+    # when
+    list(scrapper.page_items())
+
+    # then, 2 listing pages and 10 detail pages
+    assert metrics.counter("http_requests_total", status=200) - requests_before == 12
+    assert metrics.snapshot()["histograms"]['parse_seconds{page="detail"}']["count"] - parses_before == 10
+    assert metrics.counter("http_response_bytes_total") > 0
+
+
+def test_concurrent_page_items_keep_page_order(site):
+    # given
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0, max_workers=5)
+
+    # when
+    items = list(scrapper.page_items())
+
+    # then
+    assert [i["id"] for i in items] == [ikea_pages.item_id(p, i) for p in (1, 2) for i in range((p - 1) * 5, p * 5)]
+
+
+def test_not_modified_detail_pages_reuse_cached_details(site, monkeypatch, tmpdir):
+    # given
+    url = ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH
+    cache_path = os.path.join(tmpdir, "http_cache.json")
+    first_run = list(IkeaScrapper(url, MockLogger(), time_delay=0, http_cache=HttpCache(cache_path)).page_items())
+    parsed: list[str] = []
+    monkeypatch.setattr(IkeaScrapper, "_get_item_details", staticmethod(lambda soup: parsed.append(soup) or []))
+
+    # when
+    scrapper = IkeaScrapper(url, MockLogger(), time_delay=0, http_cache=HttpCache(cache_path))
+    scrapper.clear_state()
+    second_run = list(scrapper.page_items())
+
+    # then
+    assert second_run == first_run
+    assert parsed == []
+
+
+def test_replay_reparses_archived_pages_without_network(site, monkeypatch, tmpdir):
+    # given
+    url = ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH
+    archive = PageArchive(os.path.join(tmpdir, "archive"))
+    recorded = list(IkeaScrapper(url, MockLogger(), time_delay=0, archive=archive).page_items())
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("Replay must not send requests")
+
+    monkeypatch.setattr(ikea_scrapper.requests.Session, "get", no_network)
+
+    # when
+    scrapper = IkeaScrapper(url, MockLogger(), time_delay=60, archive=PageArchive(os.path.join(tmpdir, "archive")),
+                            replay=True, state_file=os.path.join(tmpdir, "replay_state.json"))
+    replayed = list(scrapper.page_items())
+
+    # then
+    assert replayed == recorded
+    assert len(archive) == 12
+
+
+@pytest.mark.parametrize("parser", ["html.parser", "lxml"])
+def test_scoped_parsing_extracts_the_same_data_as_full_parsing(parser):
+    # given
+    fixtures = os.path.join(os.path.dirname(__file__), "fixtures")
+    with open(os.path.join(fixtures, "listing_page.html"), "rb") as f:
+        listing = f.read()
+    with open(os.path.join(fixtures, "detail_page.html"), "rb") as f:
+        detail = f.read()
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), parser=parser)
+    full_listing = BeautifulSoup(listing, "html.parser")
+    full_detail = BeautifulSoup(detail, "html.parser")
+
+    # when
+    scoped_listing = parse_listing_page(listing, parser)
+    scoped_detail = scrapper._to_item_data("detail", FakeResponse(200, detail.decode("utf-8")))
+
+    # then
+    assert resolve_parser(parser) == parser
+    assert scoped_listing["cards"] == [IkeaScrapper._get_card(t) for t in IkeaScrapper._get_card_tags(full_listing)]
+    assert len(scoped_listing["cards"]) == 24
+    assert scoped_listing["has_next_page"] is IkeaScrapper._has_next_page(full_listing) is True
+    assert scoped_detail == {"details": IkeaScrapper._get_item_details(full_detail),
+                             "id": IkeaScrapper._get_item_id(full_detail)}
+
+
+def test_parse_pool_workers_extract_the_same_items(site, monkeypatch):
+    # given
+    url = ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH
+    expected = list(IkeaScrapper(url, MockLogger(), time_delay=0, state_file="in_process.json").page_items())
+    parsed_here: list[bytes] = []
+    monkeypatch.setattr(BeautifulSoup, "__init__", lambda *args, **kwargs: parsed_here.append(args[1]))
+
+    # when
+    with ParsePool(processes=2) as pool:
+        scrapper = IkeaScrapper(url, MockLogger(), time_delay=0, max_workers=4, parse_pool=pool)
+        items = list(scrapper.page_items())
+
+    # then
+    assert items == expected
+    assert parsed_here == []
+
+
+def test_incremental_run_skips_unchanged_products_until_full_refresh(site, tmpdir):
+    # given
+    url = ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH
+    store_path = os.path.join(tmpdir, "fingerprints.json")
+
+    def run() -> tuple[int, int]:
+        scrapper = IkeaScrapper(url, MockLogger(), time_delay=0,
+                                fingerprints=FingerprintStore(store_path), full_refresh_every=3)
+        site.clear()
+        items = list(scrapper.page_items())
+        scrapper.clear_state()
+        return len(items), len([u for u in site if "item-" in u])
+
+    # when
+    first, second, third = run(), run(), run()
+
+    # then, the third run is a full refresh
+    assert first == (10, 10)
+    assert second == (0, 0)
+    assert third == (10, 10)
+
+
+def test_products_lost_in_a_crash_are_not_skipped_as_unchanged(site, tmpdir):
+    # given, a database that fails on the second batch
+    class FlakyRepository(SqlRepository):
+        fail = True
+
+        def upsert_many(self, items, batch_size=None, checkpoint=None) -> int:
+            if self.fail and self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]:
+                raise IOError("disk full")
+            return super().upsert_many(items, batch_size, checkpoint)
+
+    url = ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH
+    repository = FlakyRepository(os.path.join(tmpdir, "items.db"), MockLogger())
+
+    def run():
+        checkpointer = Checkpointer(JsonCheckpointStore(os.path.join(tmpdir, "state.json")), every=1)
+        scrapper = IkeaScrapper(url, MockLogger(), time_delay=0, checkpointer=checkpointer,
+                                fingerprints=FingerprintStore(os.path.join(tmpdir, "fingerprints.json")))
+        site.clear()
+        PipelineRunner(scrapper, repository, MockLogger(), batch_size=3, checkpointer=checkpointer).run()
+        scrapper.clear_state()
+        return len([u for u in site if "item-" in u])
+
+    # when, the first run stores three items and crashes
+    with pytest.raises(IOError):
+        run()
+    repository.fail = False
+    resumed, incremental = run(), run()
+
+    # then, the resume fetches all 7 items not stored, and the next run knows all 10
+    assert resumed == 7
+    assert incremental == 0
+    assert repository.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 10
+    repository.close()
+
+
+def test_token_bucket_spreads_concurrent_requests():
+    # given
+    bucket = TokenBucket(rate=50, capacity=1)
+    started = time.monotonic()
+
+    # when
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # then, the first token is available immediately and the other five take 1/50 s each
+    assert time.monotonic() - started >= 0.09
+
+
+def test_adaptive_rate_limiter_increases_additively_and_decreases_multiplicatively():
+    # given
+    limiter = AdaptiveRateLimiter(rate=4, min_rate=1, max_rate=8, increase=1, decrease=0.5, latency_target=1,
+                                  cooldown=60)
+
+    # when, one healthy response per request of a second
+    for _ in range(4):
+        limiter.record(200, 0.1)
+    raised = limiter.rate
+    limiter.record(503, 0.1)
+    limiter.record(None, 0.1)  # Failed together with the 503, within the cooldown
+
+    # then
+    assert 4.8 < raised < 5
+    assert limiter.rate == raised / 2
+
+
+def test_adaptive_rate_limiter_backs_off_on_slow_responses_and_stays_in_bounds():
+    # given
+    limiter = AdaptiveRateLimiter(rate=2, min_rate=1, max_rate=3, cooldown=0)
+
+    # when
+    limiter.record(200, 5.0)
+    limiter.record(429, 0.1)
+    lowest = limiter.rate
+    for _ in range(100):
+        limiter.record(200, 0.1)
+
+    # then
+    assert lowest == 1
+    assert limiter.rate == 3
+
+
+def test_get_response_retries_server_errors_after_retry_after(site, monkeypatch):
+    # given
+    answers = [FakeResponse(503, headers={"Retry-After": "0"}), FakeResponse(429, headers={"retry-after": "0"})]
+    fake_get = ikea_scrapper.requests.Session.get
+    monkeypatch.setattr(ikea_scrapper.requests.Session, "get",
+                        lambda session, url, **kwargs: answers.pop(0) if answers else fake_get(session, url, **kwargs))
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0,
+                            backoff=60)
+
+    # when
+    started = time.monotonic()
+    items = list(scrapper.page_items())
+
+    # then, Retry-After replaced the minute of backoff
+    assert len(items) == 10
+    assert time.monotonic() - started < 5
+
+
+def test_get_response_retries_connection_errors_with_timeout(site, monkeypatch):
+    # given
+    timeouts: list[float] = []
+    fake_get = ikea_scrapper.requests.Session.get
+
+    def flaky_get(session, url, headers=None, timeout=None):
+        timeouts.append(timeout)
+        if len(timeouts) <= 2:
+            raise ikea_scrapper.requests.ConnectionError("connection reset")
+        return fake_get(session, url, headers=headers)
+
+    monkeypatch.setattr(ikea_scrapper.requests.Session, "get", flaky_get)
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0,
+                            timeout=7, backoff=0.01)
+    errors_before = metrics.counter("http_errors_total", error="ConnectionError")
+
+    # when
+    items = list(scrapper.page_items())
+
+    # then
+    assert len(items) == 10
+    assert set(timeouts) == {7}
+    assert metrics.counter("http_errors_total", error="ConnectionError") - errors_before == 2
+
+
+def test_get_response_does_not_retry_client_errors(site):
+    # given
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + "/lt/products/missing", MockLogger(), time_delay=0, backoff=60)
+
+    # when, then
+    with pytest.raises(ikea_scrapper.requests.HTTPError, match="after 1 attempts"):
+        list(scrapper.page_items())
+    assert len(site) == 1
+
+
+def test_get_response_waits_the_whole_retry_after_beyond_max_backoff(site, monkeypatch):
+    # given
+    answers = [FakeResponse(503, headers={"Retry-After": "120"})]
+    fake_get = ikea_scrapper.requests.Session.get
+    monkeypatch.setattr(ikea_scrapper.requests.Session, "get",
+                        lambda session, url, **kwargs: answers.pop(0) if answers else fake_get(session, url, **kwargs))
+    sleeps: list[float] = []
+    monkeypatch.setattr(ikea_scrapper.time, "sleep", sleeps.append)
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0,
+                            max_backoff=1, max_retry_after=300)
+
+    # when
+    items = list(scrapper.page_items())
+
+    # then
+    assert len(items) == 10
+    assert 120 in sleeps
+
+
+def test_get_response_gives_up_when_retry_after_is_too_long(site, monkeypatch):
+    # given
+    monkeypatch.setattr(ikea_scrapper.requests.Session, "get",
+                        lambda session, url, **kwargs: FakeResponse(429, headers={"Retry-After": "3600"}))
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0,
+                            max_retry_after=300)
+
+    # when, then
+    started = time.monotonic()
+    with pytest.raises(ikea_scrapper.requests.HTTPError, match="after 1 attempts"):
+        list(scrapper.page_items())
+    assert time.monotonic() - started < 5
+
+
+def test_async_page_items_send_requests_with_the_timeout(site, monkeypatch):
+    # given, the threaded transport, as when aiohttp is not installed
+    def no_aiohttp(**kwargs):
+        raise ImportError("aiohttp")
+
+    monkeypatch.setattr(http_transport, "AiohttpTransport", no_aiohttp)
+    timeouts: list[float] = []
+    fake_get = ikea_scrapper.requests.Session.get
+
+    def timed_get(session, url, headers=None, timeout=None):
+        timeouts.append(timeout)
+        return fake_get(session, url, headers=headers)
+
+    monkeypatch.setattr(ikea_scrapper.requests.Session, "get", timed_get)
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0,
+                            max_workers=5, timeout=7)
+
+    async def collect():
+        return [item async for item in scrapper.apage_items()]
+
+    # when
+    items = asyncio.run(collect())
+
+    # then
+    assert len(items) == 10
+    assert set(timeouts) == {7}
+
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert retry_after_seconds({"Retry-After": "120"}) == 120
+    assert retry_after_seconds({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0
+    assert retry_after_seconds({"Retry-After": "soon"}) is None
+    assert retry_after_seconds({}) is None
+
+
+def test_async_page_items_use_transport_and_keep_page_order(monkeypatch, tmpdir):
+    # given
+    monkeypatch.chdir(tmpdir)
+    transport = FakeTransport(ikea_pages.site(pages=2, per_page=5))
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0,
+                            max_workers=5, transport=transport)
+
+    async def collect():
+        return [item async for item in scrapper.apage_items()]
+
+    # when
+    items = asyncio.run(collect())
+
+    # then
+    assert [i["id"] for i in items] == [ikea_pages.item_id(p, i) for p in (1, 2) for i in range((p - 1) * 5, p * 5)]
+    assert transport.max_in_flight == 5
+    assert scrapper.is_completed
+
+
+@pytest.fixture
+def four_page_site(monkeypatch, tmpdir):
+    monkeypatch.chdir(tmpdir)
+    pages = ikea_pages.site(pages=4, per_page=3)
+    requested: list[str] = []
+
+    def fake_get(session, url, headers=None, **kwargs):
+        requested.append(url)
+        return FakeResponse(200, pages[url]) if url in pages else FakeResponse(404)
+
+    monkeypatch.setattr(ikea_scrapper.requests.Session, "get", fake_get)
+    return requested, fake_get
+
+
+def test_listing_pages_are_prefetched_up_to_the_counted_page_count(four_page_site, monkeypatch):
+    # given, detail pages that answer only once the next listing page was requested
+    requested, fake_get = four_page_site
+    next_listing_requested = threading.Event()
+    waits: list[bool] = []
+
+    def get_after_next_listing(session, url, headers=None, **kwargs):
+        if url == ikea_pages.listing_url(2):
+            next_listing_requested.set()
+        elif "item-" in url:
+            waits.append(next_listing_requested.wait(timeout=5))
+        return fake_get(session, url, headers, **kwargs)
+
+    monkeypatch.setattr(ikea_scrapper.requests.Session, "get", get_after_next_listing)
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0,
+                            prefetch_pages=5)
+
+    # when
+    items = list(scrapper.page_items())
+
+    # then, page 2 was requested while page 1 was processed, and nothing after page 4
+    assert [i["id"] for i in items] == [ikea_pages.item_id(p, i) for p in range(1, 5) for i in range((p - 1) * 3, p * 3)]
+    assert sorted(u for u in requested if "item-" not in u) == [ikea_pages.listing_url(p) for p in range(1, 5)]
+    assert all(waits)
+
+
+def test_listing_prefetch_starts_at_the_resumed_page(four_page_site, tmpdir):
+    # given
+    store = JsonCheckpointStore(os.path.join(tmpdir, "state.json"))
+    store.save({"page_number": 3, "item_number": 1})
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0,
+                            prefetch_pages=1, checkpointer=Checkpointer(store))
+
+    # when
+    items = list(scrapper.page_items())
+
+    # then
+    requested, _ = four_page_site
+    assert [i["id"] for i in items] == [ikea_pages.item_id(3, 7), ikea_pages.item_id(3, 8),
+                                        *[ikea_pages.item_id(4, i) for i in range(9, 12)]]
+    assert [u for u in requested if "item-" not in u] == [ikea_pages.listing_url(3), ikea_pages.listing_url(4)]
+
+
+def test_workers_sharing_a_work_queue_scrape_every_item_exactly_once(four_page_site, tmpdir):
+    # given, two workers with their own connection to one queue file
+    queue_path = os.path.join(tmpdir, "work_queue.db")
+    workers = [IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0,
+                            max_workers=2, poll_interval=0.01,
+                            work_queue=SqliteWorkQueue(queue_path, MockLogger()))
+               for _ in range(2)]
+    results: list[list[dict]] = [[], []]
+
+    # when
+    threads = [threading.Thread(target=lambda n: results[n].extend(workers[n].page_items()), args=(n,))
+               for n in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    # then
+    requested, _ = four_page_site
+    ids = [i["id"] for result in results for i in result]
+    assert sorted(ids) == sorted(ikea_pages.item_id(p, i) for p in range(1, 5) for i in range((p - 1) * 3, p * 3))
+    assert all(result for result in results)
+    assert sorted(u for u in requested if "item-" not in u) == [ikea_pages.listing_url(p) for p in range(1, 5)]
+    assert all(w.is_completed for w in workers)
+
+
+def test_failed_detail_pages_are_retried_through_the_work_queue(four_page_site, monkeypatch, tmpdir):
+    # given, a detail page that fails on its first request
+    requested, fake_get = four_page_site
+    failing = ikea_pages.BASE_URL + ikea_pages.detail_path(ikea_pages.item_id(2, 4))
+    failures: list[str] = []
+
+    def get_failing_once(session, url, headers=None, **kwargs):
+        if url == failing and not failures:
+            failures.append(url)
+            return FakeResponse(404)
+        return fake_get(session, url, headers, **kwargs)
+
+    monkeypatch.setattr(ikea_scrapper.requests.Session, "get", get_failing_once)
+    queue = SqliteWorkQueue(os.path.join(tmpdir, "work_queue.db"), MockLogger(), retry_delay=0)
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0,
+                            poll_interval=0.01, work_queue=queue)
+
+    # when
+    items = list(scrapper.page_items())
+
+    # then
+    assert failures == [failing]
+    assert sorted(i["id"] for i in items) == sorted(ikea_pages.item_id(p, i) for p in range(1, 5)
+                                                    for i in range((p - 1) * 3, p * 3))
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": 16, "failed": 0}
+    scrapper.clear_state()
+    assert queue.counts()["done"] == 0
+
+
+def test_work_items_are_acked_only_once_their_items_are_stored(four_page_site, tmpdir):
+    # given, a database that fails on the third batch
+    class FlakyRepository(SqlRepository):
+        batches = 0
+
+        def upsert_many(self, items, batch_size=None, checkpoint=None) -> int:
+            FlakyRepository.batches += 1
+            if FlakyRepository.batches == 3:
+                raise IOError("disk full")
+            return super().upsert_many(items, batch_size, checkpoint)
+
+    repository = FlakyRepository(os.path.join(tmpdir, "items.db"), MockLogger())
+    queue = SqliteWorkQueue(os.path.join(tmpdir, "work_queue.db"), MockLogger())
+
+    def run():
+        checkpointer = Checkpointer(JsonCheckpointStore(os.path.join(tmpdir, "state.json")))
+        scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0,
+                                poll_interval=0.01, work_queue=queue, checkpointer=checkpointer)
+        PipelineRunner(scrapper, repository, MockLogger(), queue_size=1, batch_size=3, checkpointer=checkpointer).run()
+        return scrapper
+
+    # when
+    with pytest.raises(IOError):
+        run()
+    counts = queue.counts()
+    requested, _ = four_page_site
+    requested.clear()
+    scrapper = run()
+
+    # then, the items fetched but not stored are leased again and only they are fetched again
+    assert counts == {"pending": 6, "leased": 0, "done": 10, "failed": 0}
+    assert len([u for u in requested if "item-" in u]) == 6
+    assert repository.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 12
+    assert scrapper.is_completed
+    repository.close()
+
+
+def test_merge_page_items_scrapes_categories_concurrently(monkeypatch, tmpdir):
+    # given
+    monkeypatch.chdir(tmpdir)
+    transport = FakeTransport(ikea_pages.site(pages=2, per_page=5))
+    scrappers = [
+        IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0, max_workers=5,
+                     transport=transport, state_file=os.path.join(tmpdir, f"state_{n}.json"))
+        for n in range(3)
+    ]
+
+    async def collect():
+        return [item async for item in merge_page_items(scrappers)]
+
+    # when
+    items = asyncio.run(collect())
+
+    # then
+    assert len(items) == 30
+    assert transport.max_in_flight > 5
+
+
+def test_pipeline_saves_all_items_through_bounded_queues(site, tmpdir):
+    # given
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0, max_workers=3)
+    repository = JsonlRepository(os.path.join(tmpdir, "items.jsonl"), MockLogger())
+    pipeline = PipelineRunner(scrapper, repository, MockLogger(), queue_size=2, batch_size=3)
+
+    # when
+    with repository:
+        saved = pipeline.run()
+        stored = [repository.get_first_or_default({"id": ikea_pages.item_id(1, i)}) for i in range(5)]
+
+    # then
+    assert saved == 10
+    assert all(item and item["details"] for item in stored)
+    assert [(s.name, s.items) for s in pipeline.stats] == [("fetch", 10), ("parse", 10), ("persist", 10)]
+    assert scrapper.is_completed
+
+
+def test_pipeline_counts_only_items_the_repository_wrote(site, tmpdir):
+    # given, a database that already holds every item
+    url = ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH
+    repository = SqlRepository(os.path.join(tmpdir, "items.db"), MockLogger())
+    PipelineRunner(IkeaScrapper(url, MockLogger(), time_delay=0), repository, MockLogger()).run()
+    stored_before = metrics.counter("items_stored_total")
+
+    # when
+    saved = PipelineRunner(IkeaScrapper(url, MockLogger(), time_delay=0), repository, MockLogger()).run()
+
+    # then
+    assert saved == 0
+    assert metrics.counter("items_stored_total") == stored_before
+    repository.close()
+
+
+def test_pipeline_stops_all_stages_when_one_fails(site, tmpdir):
+    # given
+    class FailingRepository(JsonlRepository):
+        def upsert_many(self, items: list[dict]) -> int:
+            raise IOError("disk full")
+
+    scrapper = IkeaScrapper(ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH, MockLogger(), time_delay=0)
+    repository = FailingRepository(os.path.join(tmpdir, "items.jsonl"), MockLogger())
+
+    # when, then
+    with pytest.raises(IOError, match="disk full"):
+        PipelineRunner(scrapper, repository, MockLogger(), queue_size=1, batch_size=1).run()
+    assert not scrapper.is_completed
+
+
+def test_pipeline_resumes_exactly_after_the_last_stored_item(site, tmpdir):
+    # given, a database that fails on the third batch
+    class FlakyRepository(SqlRepository):
+        batches = 0
+
+        def upsert_many(self, items, batch_size=None, checkpoint=None) -> int:
+            FlakyRepository.batches += 1
+            if FlakyRepository.batches == 3:
+                raise IOError("disk full")
+            return super().upsert_many(items, batch_size, checkpoint)
+
+    url = ikea_pages.BASE_URL + ikea_pages.CATEGORY_PATH
+    repository = FlakyRepository(os.path.join(tmpdir, "items.db"), MockLogger())
+
+    def run():
+        checkpointer = Checkpointer(repository.checkpoint_store("metod"), every=1000, interval=1000)
+        scrapper = IkeaScrapper(url, MockLogger(), time_delay=0, checkpointer=checkpointer)
+        PipelineRunner(scrapper, repository, MockLogger(), queue_size=1, batch_size=3, checkpointer=checkpointer).run()
+        return scrapper
+
+    # when
+    with pytest.raises(IOError):
+        run()
+    stored = repository.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+    state = repository.load_checkpoint("metod")
+    site.clear()
+    scrapper = run()
+
+    # then, the second run fetches only the items the first one did not store
+    assert stored == 6
+    assert state == {"page_number": 2, "item_number": 1}
+    assert len([u for u in site if "item-" in u]) == 4
+    assert repository.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0] == 10
+    assert scrapper.is_completed
+    repository.close()
@@ -0,0 +1,38 @@
+import datetime as dt
+import os
+import time
+from src.services.log_service import Logger, LogWriter
+
+
+def test_log_writer_batches_lines_into_the_file_of_their_date(tmpdir):
+    # given
+    writer = LogWriter(os.path.join(tmpdir, ""), flush_interval=60)
+    midnight = time.mktime(dt.date(2025, 3, 2).timetuple())
+
+    # when
+    writer.write(midnight - 1, "INFO", "app", "last line of the day")
+    writer.write(midnight, "ERROR", "app", "first line\nof the next day")
+    writer.flush()
+
+    # then
+    with open(os.path.join(tmpdir, "2025-03-01.log"), encoding="utf-8") as f:
+        assert f.read() == "[2025-03-01 23:59:59]       INFO : app - last line of the day\n"
+    with open(os.path.join(tmpdir, "2025-03-02.log"), encoding="utf-8") as f:
+        assert f.read() == "[2025-03-02 00:00:00]      ERROR : app - first lineof the next day\n"
+    writer.close()
+
+
+def test_buffered_logger_skips_disabled_levels(tmpdir):
+    # given
+    writer = LogWriter(os.path.join(tmpdir, ""))
+    logger = Logger("IkeaScrapper", "WARNING", writer)
+
+    # when
+    logger.log_debug("debug").log_info("info").log_warning("warning")
+    writer.close()
+
+    # then
+    with open(os.path.join(tmpdir, os.listdir(tmpdir)[0]), encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert len(lines) == 1 and lines[0].endswith("WARNING : IkeaScrapper - warning")
+    assert logger.log_info.__name__ == "_skip"
@@ -0,0 +1,69 @@
+import json
+import os
+import socket
+import urllib.request
+from src.services.metrics import MetricsRegistry, MetricsReporter
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_registry_counts_and_estimates_latency_quantiles():
+    # given
+    registry = MetricsRegistry()
+
+    # when
+    for status in (200, 200, 503):
+        registry.inc("http_requests_total", status=status)
+    for ms in range(1, 101):
+        registry.observe("http_request_seconds", ms / 1000)
+    snapshot = registry.snapshot()
+
+    # then
+    assert snapshot["counters"] == {'http_requests_total{status="200"}': 2, 'http_requests_total{status="503"}': 1}
+    latency = snapshot["histograms"]["http_request_seconds"]
+    assert latency["count"] == 100
+    assert 0.025 <= latency["p50"] <= 0.05
+    assert 0.05 <= latency["p99"] <= 0.1
+
+
+def test_registry_merges_metrics_drained_from_another_process():
+    # given
+    worker, main = MetricsRegistry(), MetricsRegistry()
+    worker.inc("http_response_bytes_total", 2048)
+    worker.observe("parse_seconds", 0.002, page="detail")
+    main.observe("parse_seconds", 0.004, page="detail")
+
+    # when
+    main.merge(worker.drain())
+
+    # then
+    assert main.counter("http_response_bytes_total") == 2048
+    assert main.snapshot()["histograms"]['parse_seconds{page="detail"}']["count"] == 2
+    assert worker.snapshot()["counters"] == {}
+
+
+def test_reporter_writes_stats_file_and_serves_prometheus_text(tmpdir):
+    # given
+    registry = MetricsRegistry()
+    registry.inc("items_stored_total", 10)
+    registry.observe("repository_op_seconds", 0.003, backend="sql", op="upsert_many")
+    stats_path = os.path.join(tmpdir, "stats", "metrics.json")
+    port = free_port()
+
+    # when
+    with MetricsReporter(registry, stats_path, interval=60, prometheus_port=port):
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            text = response.read().decode("utf-8")
+
+    # then
+    assert "# TYPE items_stored_total counter\nitems_stored_total 10\n" in text
+    assert 'repository_op_seconds_bucket{backend="sql",op="upsert_many",le="0.005"} 1' in text
+    assert 'repository_op_seconds_count{backend="sql",op="upsert_many"} 1' in text
+    with open(stats_path, encoding="utf-8") as f:
+        stats = json.load(f)
+    assert stats["counters"]["items_stored_total"] == 10
+    assert stats["items_per_second"] > 0
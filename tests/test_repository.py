@@ -1,31 +1,19 @@
+import gzip
 import os
 import pytest
-from typing import Self
+import sqlite3
+import subprocess
+import sys
+from openpyxl import load_workbook
+from src.accessdata import repository_registry, xlsx_repository
+from src.accessdata.repository_registry import RepositoryRegistry, repositories, uri_path
 from src.accessdata.jsonl_repository import JsonlRepository
+from src.accessdata.segmented_jsonl_repository import SegmentedJsonlRepository
 from src.accessdata.xlsx_repository import ExcelRepository
-from src.accessdata.sql_repository import SqlRepository
-from src.services.log_service import ILogger
-
-
-class MockLogger(ILogger):
-    def log_debug(self, message: str):
-        print(f"DEBUG: {message}")
-
-
-    def log_info(self, message: str) -> Self:
-        print(f"INFO: {message}")
-
-
-    def log_warning(self, message: str) -> Self:
-        print(f"WARNING: {message}")
-
-
-    def log_error(self, message: str) -> Self:
-        print(f"ERROR: {message}")
-
-
-    def log_critical(self, message: str) -> Self:
-        print(f"CRITICAL: {message}")
+from src.accessdata.sql_repository import SCHEMA_VERSION, SqlRepository
+from src.services.converter import convert
+from src.services.metrics import metrics
+from mock_logger import MockLogger
 
 
 @pytest.fixture
@@ -48,7 +36,8 @@ def repository(request, temp_db_path):
 @pytest.mark.parametrize(("repository", "temp_db_path"), [
     (JsonlRepository, "jsonl"),
     (ExcelRepository, "xlsx"),
-    (SqlRepository, "db")
+    (SqlRepository, "db"),
+    (SegmentedJsonlRepository, "segments")
 ], indirect=True)
 def test_insert(repository, temp_item):
     # given
@@ -64,7 +53,8 @@ def test_insert(repository, temp_item):
 @pytest.mark.parametrize(("repository", "temp_db_path"), [
     (JsonlRepository, "jsonl"),
     (ExcelRepository, "xlsx"),
-    (SqlRepository, "db")
+    (SqlRepository, "db"),
+    (SegmentedJsonlRepository, "segments")
 ], indirect=True)
 def test_get_first_when_item_exists(repository, temp_item):
     # given
@@ -82,7 +72,8 @@ def test_get_first_when_item_exists(repository, temp_item):
 @pytest.mark.parametrize(("repository", "temp_db_path"), [
     (JsonlRepository, "jsonl"),
     (ExcelRepository, "xlsx"),
-    (SqlRepository, "db")
+    (SqlRepository, "db"),
+    (SegmentedJsonlRepository, "segments")
 ], indirect=True)
 def test_update_exists_item(repository, temp_item):
     item = temp_item
@@ -97,4 +88,456 @@ def test_update_exists_item(repository, temp_item):
     print(f"before update: {item}")
     print(f"after update: {updated_item}")
     # then
-    assert not item['name'] == updated_item['name']
\ No newline at end of file
+    assert not item['name'] == updated_item['name']
+
+def test_jsonl_update_is_visible_after_reopen(tmpdir, temp_item):
+    # given
+    db_path = os.path.join(tmpdir, "test_db.jsonl")
+    with JsonlRepository(db_path, MockLogger()) as repository:
+        repository.insert(temp_item)
+        repository.update({**temp_item, "name": "new name"}, {"id": temp_item["id"]})
+
+    # when
+    reopened = JsonlRepository(db_path, MockLogger())
+    item = reopened.get_first_or_default({"id": temp_item["id"]})
+
+    # then
+    assert os.path.exists(db_path + ".idx")
+    assert item["name"] == "new name"
+
+
+def test_jsonl_compact_removes_superseded_records(tmpdir, temp_item):
+    # given
+    db_path = os.path.join(tmpdir, "test_db.jsonl")
+    repository = JsonlRepository(db_path, MockLogger())
+    repository.insert(temp_item)
+    for price in ["56", "57", "58"]:
+        repository.update({**temp_item, "price": price}, {"id": temp_item["id"]})
+
+    # when
+    repository.compact()
+
+    # then
+    with open(db_path, encoding='utf-8') as f:
+        assert len(f.readlines()) == 1
+    assert repository.get_first_or_default({"id": temp_item["id"]})["price"] == "58"
+
+
+def test_excel_buffered_changes_are_saved_on_close(tmpdir, temp_item):
+    # given
+    db_path = os.path.join(tmpdir, "test_db.xlsx")
+    repository = ExcelRepository(db_path, MockLogger(), buffered=True, flush_every=1000, flush_interval=3600)
+    repository.insert(temp_item)
+    assert ExcelRepository(db_path, MockLogger()).get_first_or_default({"id": temp_item["id"]}) is None
+
+    # when
+    repository.close()
+
+    # then
+    assert ExcelRepository(db_path, MockLogger()).get_first_or_default({"id": temp_item["id"]}) == temp_item
+
+
+def test_excel_update_replaces_only_product_details(tmpdir, temp_item):
+    # given
+    db_path = os.path.join(tmpdir, "test_db.xlsx")
+    other_item = {**temp_item, "id": "000.000.01", "details": [{"Plotis": "10 cm"}]}
+    with ExcelRepository(db_path, MockLogger(), buffered=True) as repository:
+        repository.insert(temp_item)
+        repository.insert(other_item)
+
+        # when
+        repository.update({**temp_item, "details": [{"Plotis": "1 cm"}]}, {"id": temp_item["id"]})
+
+    # then
+    repository = ExcelRepository(db_path, MockLogger())
+    assert repository.get_first_or_default({"id": temp_item["id"]})["details"] == [{"Plotis": "1 cm"}]
+    assert repository.get_first_or_default({"id": other_item["id"]}) == other_item
+
+
+def test_excel_reuses_detail_rows_freed_by_updates(tmpdir, temp_item):
+    # given, a product that lost all but one of its six details
+    db_path = os.path.join(tmpdir, "test_db.xlsx")
+    with ExcelRepository(db_path, MockLogger(), buffered=True) as repository:
+        repository.insert(temp_item)
+        repository.update({**temp_item, "details": [{"Plotis": "1 cm"}]}, {"id": temp_item["id"]})
+
+    # when, the freed rows are found again when the workbook is reopened
+    new_item = {**temp_item, "id": "000.000.01", "details": temp_item["details"][:3]}
+    with ExcelRepository(db_path, MockLogger(), buffered=True) as repository:
+        repository.insert(new_item)
+        repository.update({**temp_item, "details": temp_item["details"][:3]}, {"id": temp_item["id"]})
+
+    # then
+    repository = ExcelRepository(db_path, MockLogger())
+    assert repository.get_first_or_default({"id": new_item["id"]}) == new_item
+    assert repository.get_first_or_default({"id": temp_item["id"]})["details"] == temp_item["details"][:3]
+    assert sorted(repository.iter_items(), key=lambda i: i["id"])[1]["details"] == temp_item["details"][:3]
+    assert load_workbook(db_path)["product_details"].max_row == 7
+
+
+def test_excel_iter_items_reads_details_in_product_order_side_by_side(tmpdir, temp_item, monkeypatch):
+    # given
+    db_path = os.path.join(tmpdir, "test_db.xlsx")
+    items = [temp_item, {**temp_item, "id": "000.000.01", "details": []},
+             {**temp_item, "id": "000.000.02", "details": [{"Plotis": "1 cm"}]}]
+    repository = ExcelRepository(db_path, MockLogger())
+    repository.bulk_insert(items)
+    in_order = []
+    check = xlsx_repository._in_product_order
+    monkeypatch.setattr(xlsx_repository, "_in_product_order",
+                        lambda *rows: in_order.append(check(*rows)) or in_order[-1])
+
+    # when
+    streamed = list(repository.iter_items())
+    repository.upsert({**temp_item, "details": temp_item["details"] + [{"Svoris": "3 kg"}]})
+    grouped = list(repository.iter_items())
+
+    # then
+    assert streamed == items
+    assert grouped[0]["details"][-1] == {"Svoris": "3 kg"}
+    assert grouped[1:] == items[1:]
+    assert in_order == [True, False]
+
+
+def test_sql_upsert_many_inserts_and_replaces_items(tmpdir, temp_item):
+    # given
+    repository = SqlRepository(os.path.join(tmpdir, "test_db.db"), MockLogger(), batch_size=2)
+    repository.insert(temp_item)
+    changed_item = {**temp_item, "price": "60", "details": [{"Plotis": "1 cm"}]}
+    new_items = [{**temp_item, "id": f"000.000.0{i}"} for i in range(3)]
+
+    # when
+    count = repository.upsert_many([changed_item, *new_items])
+
+    # then
+    assert count == 4
+    assert repository.get_first_or_default({"id": temp_item["id"]}) == changed_item
+    for item in new_items:
+        assert repository.get_first_or_default({"id": item["id"]}) == item
+    assert repository.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_sql_migrates_a_database_of_the_first_schema(tmpdir, temp_item):
+    # given
+    db_path = os.path.join(tmpdir, "test_db.db")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE products (id TEXT PRIMARY KEY, name TEXT, description TEXT, price TEXT)")
+    conn.execute("CREATE TABLE product_details (product_id TEXT, key TEXT, value TEXT)")
+    conn.execute("CREATE INDEX ix_product_details_product_id ON product_details (product_id)")
+    other_item = {**temp_item, "id": "000.000.01", "details": [{"Plotis": "1 m"}, {"Spalva": "balta"}]}
+    for item in (other_item, temp_item):
+        conn.execute("INSERT INTO products VALUES (?, ?, ?, ?)",
+                     (item["id"], item["name"], item["description"], item["price"]))
+        conn.executemany("INSERT INTO product_details VALUES (?, ?, ?)",
+                         [(item["id"], *detail) for d in item["details"] for detail in d.items()])
+    conn.commit()
+    conn.close()
+
+    # when
+    repository = SqlRepository(db_path, MockLogger())
+
+    # then
+    assert repository.conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert list(repository.iter_items()) == [other_item, temp_item]
+    assert repository.conn.execute("SELECT COUNT(*) FROM detail_keys").fetchone()[0] == 7
+    assert repository.find_by_measure("Plotis", 0.9, 1.5, "m") == [other_item["id"]]
+    assert [entry["price"] for entry in repository.price_history(temp_item["id"])] == [temp_item["price"]]
+
+
+@pytest.mark.parametrize("measure_index", [False, True])
+def test_sql_find_by_measure_compares_numbers_across_units(tmpdir, temp_item, measure_index):
+    # given
+    repository = SqlRepository(os.path.join(tmpdir, "test_db.db"), MockLogger(), measure_index=measure_index)
+    narrow_item = {**temp_item, "id": "000.000.01", "details": [{"Plotis": "400 mm"}, {"Didž. apkrova": "2,5 kg"}]}
+    repository.upsert_many([temp_item, narrow_item])
+
+    # then
+    assert repository.find_by_measure("Plotis", 50, 60) == [temp_item["id"]]
+    assert repository.find_by_measure("Plotis", 0.3, 0.6, "m") == sorted([temp_item["id"], narrow_item["id"]])
+    assert repository.find_by_measure("Didž. apkrova", 2000, 3000, "g") == [narrow_item["id"]]
+    assert repository.find_by_measure("Spalva", 0, 100) == []
+    indexes = {row[0] for row in repository.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert ("ix_product_details_measure" in indexes) == measure_index
+
+
+def test_sql_measure_index_is_dropped_when_it_is_turned_off(tmpdir):
+    # given
+    db_path = os.path.join(tmpdir, "test_db.db")
+    SqlRepository(db_path, MockLogger(), measure_index=True).close()
+
+    # when
+    repository = SqlRepository(db_path, MockLogger())
+
+    # then
+    assert repository.conn.execute("SELECT COUNT(*) FROM sqlite_master "
+                                   "WHERE name = 'ix_product_details_measure'").fetchone()[0] == 0
+
+
+@pytest.mark.parametrize(("repository", "temp_db_path"), [
+    (JsonlRepository, "jsonl"),
+    (ExcelRepository, "xlsx"),
+    (SqlRepository, "db"),
+    (SegmentedJsonlRepository, "segments")
+], indirect=True)
+def test_upsert_many_inserts_new_and_replaces_existing_items(repository, temp_item):
+    # given
+    repository.upsert(temp_item)
+    changed_item = {**temp_item, "name": "new name"}
+    new_item = {**temp_item, "id": "000.000.01"}
+
+    # when
+    count = repository.upsert_many([changed_item, new_item])
+
+    # then
+    assert count == 2
+    assert repository.get_first_or_default({"id": temp_item["id"]}) == changed_item
+    assert repository.get_first_or_default({"id": new_item["id"]}) == new_item
+
+
+@pytest.mark.parametrize(("repository", "temp_db_path"), [
+    (JsonlRepository, "jsonl"),
+    (ExcelRepository, "xlsx"),
+    (SqlRepository, "db"),
+    (SegmentedJsonlRepository, "segments")
+], indirect=True)
+def test_iter_items_streams_the_latest_version_of_every_item(repository, temp_item):
+    # given
+    other_item = {**temp_item, "id": "000.000.01", "details": []}
+    repository.upsert_many([temp_item, other_item])
+    changed_item = {**temp_item, "price": "60", "details": [{"Plotis": "1 cm"}, {"Gylis": "2 cm"}]}
+    repository.upsert(changed_item)
+
+    # when
+    items = sorted(repository.iter_items(), key=lambda i: i["id"])
+
+    # then
+    assert items == [other_item, changed_item]
+
+
+@pytest.mark.parametrize(("repository", "temp_db_path", "backend"), [
+    (JsonlRepository, "jsonl", "jsonl"),
+    (ExcelRepository, "xlsx", "xlsx"),
+    (SqlRepository, "db", "sql"),
+    (SegmentedJsonlRepository, "segments", "segmented")
+], indirect=["repository", "temp_db_path"])
+def test_unchanged_items_are_not_written_again(repository, temp_item, backend):
+    # given
+    repository.upsert_many([temp_item])
+    unchanged_before = metrics.counter("items_unchanged_total", backend=backend)
+    changed_item = {**temp_item, "price": "60"}
+
+    # when
+    unchanged = repository.upsert_many([dict(reversed(temp_item.items()))])
+    changed = repository.upsert_many([changed_item])
+    repository.update(changed_item, {"id": temp_item["id"]})
+
+    # then, only writes are counted
+    assert (unchanged, changed) == (0, 1)
+    assert metrics.counter("items_unchanged_total", backend=backend) - unchanged_before == 2
+    assert repository.get_first_or_default({"id": temp_item["id"]}) == changed_item
+
+
+def test_sql_price_history_records_only_price_changes(tmpdir, temp_item):
+    # given
+    repository = SqlRepository(os.path.join(tmpdir, "test_db.db"), MockLogger())
+    repository.insert(temp_item)
+
+    changed_item = {**temp_item, "details": [{"Plotis": "1 cm"}]}
+
+    # when
+    repository.upsert(changed_item)
+    repository.conn.execute("UPDATE price_history SET changed_at = '2000-01-01T00:00:00+00:00'")
+    repository.upsert({**changed_item, "price": "49"})
+
+    # then
+    assert [entry["price"] for entry in repository.price_history(temp_item["id"])] == ["55", "49"]
+    assert repository.get_first_or_default({"id": temp_item["id"]})["details"] == [{"Plotis": "1 cm"}]
+
+
+@pytest.mark.parametrize(("source_ext", "target_ext"), [
+    ("jsonl", "xlsx"), ("xlsx", "db"), ("db", "jsonl"), ("jsonl", "db")
+])
+def test_convert_copies_all_items_between_formats(tmpdir, temp_item, source_ext, target_ext):
+    # given
+    classes = {"jsonl": JsonlRepository, "xlsx": ExcelRepository, "db": SqlRepository}
+    items = [{**temp_item, "id": f"{i:03d}.000.00", "details": temp_item["details"][:i % 4]} for i in range(25)]
+    with classes[source_ext](os.path.join(tmpdir, f"source.{source_ext}"), MockLogger()) as source:
+        source.upsert_many(items)
+
+    # when
+    with classes[source_ext](os.path.join(tmpdir, f"source.{source_ext}"), MockLogger()) as source, \
+            classes[target_ext](os.path.join(tmpdir, f"target.{target_ext}"), MockLogger()) as target:
+        count = convert(source, target, MockLogger(), batch_size=10)
+
+    # then
+    target = classes[target_ext](os.path.join(tmpdir, f"target.{target_ext}"), MockLogger())
+    assert count == 25
+    assert sorted(target.iter_items(), key=lambda i: i["id"]) == items
+    assert target.get_first_or_default({"id": "003.000.00"}) == items[3]
+
+
+def test_excel_bulk_insert_into_existing_workbook_upserts(tmpdir, temp_item):
+    # given
+    repository = ExcelRepository(os.path.join(tmpdir, "test_db.xlsx"), MockLogger())
+    repository.insert(temp_item)
+    changed_item = {**temp_item, "name": "new name"}
+    new_item = {**temp_item, "id": "000.000.01"}
+
+    # when
+    count = repository.bulk_insert(iter([changed_item, new_item]), batch_size=1)
+
+    # then
+    assert count == 2
+    assert sorted(repository.iter_items(), key=lambda i: i["id"]) == [new_item, changed_item]
+
+
+def test_segmented_repository_seals_compresses_and_merges_segments(tmpdir, temp_item):
+    # given
+    directory = os.path.join(tmpdir, "db.segments")
+    repository = SegmentedJsonlRepository(directory, MockLogger(), segment_size=2000, block_size=500,
+                                          compact_min_stale=10, compact_ratio=0.5, background=False)
+    items = [{**temp_item, "id": f"{i:03d}.000.00"} for i in range(20)]
+
+    # when, every item is written three times
+    for price in ("1", "2", "3"):
+        repository.upsert_many([{**item, "price": price} for item in items])
+    files = os.listdir(directory)
+
+    # then
+    expected = [{**item, "price": "3"} for item in items]
+    assert sorted(repository.iter_items(), key=lambda i: i["id"]) == expected
+    assert repository.get_first_or_default({"id": "007.000.00"}) == expected[7]
+    assert any(name.endswith(".jsonl.gz") for name in files)
+    sealed_records = sum(1 for name in files if name.endswith(".gz")
+                         for _ in gzip.open(os.path.join(directory, name)))
+    assert sealed_records < 40  # Superseded records were merged away
+
+
+def test_segmented_repository_compact_keeps_only_live_records(tmpdir, temp_item):
+    # given
+    directory = os.path.join(tmpdir, "db.segments")
+    repository = SegmentedJsonlRepository(directory, MockLogger())
+    repository.upsert_many([temp_item, {**temp_item, "id": "000.000.01"}])
+    changed_item = {**temp_item, "name": "new name"}
+    repository.upsert(changed_item)
+
+    # when
+    repository.compact()
+    repository.close()
+
+    # then
+    segments = [name for name in os.listdir(directory) if name.endswith(".gz")]
+    assert len(segments) == 1
+    with gzip.open(os.path.join(directory, segments[0])) as f:
+        assert len(f.readlines()) == 2
+    reopened = SegmentedJsonlRepository(directory, MockLogger())
+    assert reopened.get_first_or_default({"id": temp_item["id"]}) == changed_item
+
+
+def test_segmented_repository_rebuilds_a_lost_index(tmpdir, temp_item):
+    # given
+    directory = os.path.join(tmpdir, "db.segments")
+    repository = SegmentedJsonlRepository(directory, MockLogger(), segment_size=1000, background=False)
+    items = [{**temp_item, "id": f"{i:03d}.000.00"} for i in range(10)]
+    repository.upsert_many(items[:5])
+    repository.upsert_many(items[5:])
+    repository.upsert({**items[0], "price": "1"})
+    repository.close()
+
+    # when
+    os.remove(os.path.join(directory, "index.json"))
+    reopened = SegmentedJsonlRepository(directory, MockLogger())
+
+    # then
+    assert sorted(reopened.iter_items(), key=lambda i: i["id"]) == [{**items[0], "price": "1"}, *items[1:]]
+
+
+def test_segmented_repository_background_maintenance_waits_for_readers(tmpdir, temp_item):
+    # given
+    directory = os.path.join(tmpdir, "db.segments")
+    repository = SegmentedJsonlRepository(directory, MockLogger(), segment_size=1000, compact_min_stale=1)
+    items = [{**temp_item, "id": f"{i:03d}.000.00"} for i in range(10)]
+    repository.upsert_many(items)
+    reader = repository.iter_items()
+    first = next(reader)
+
+    # when, updates seal segments while the reader is in the middle of the first one
+    repository.upsert_many([{**item, "price": "1"} for item in items])
+    rest = list(reader)
+    repository.close()
+
+    # then, no segment was swapped under the reader, items updated meanwhile may come again
+    assert {item["id"] for item in [first, *rest]} == {item["id"] for item in items}
+    assert sorted(repository.iter_items(), key=lambda i: i["id"]) == [{**item, "price": "1"} for item in items]
+
+
+def test_registry_opens_files_by_extension_and_uri(tmpdir):
+    # given
+    create_logger = lambda name: MockLogger()
+    options = {"sql": {"measure_index": True}}
+
+    # when
+    jsonl = repositories.create(os.path.join(tmpdir, "products.jsonl"), create_logger, options)
+    sql = repositories.create(f"sqlite:///{os.path.join(tmpdir, 'products.db')}", create_logger, options)
+
+    # then
+    assert isinstance(jsonl, JsonlRepository)
+    assert isinstance(sql, SqlRepository)
+    assert os.path.exists(os.path.join(tmpdir, "products.db"))
+    # the options of the sql backend reached it
+    indexes = {row[0] for row in sql.conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert "ix_product_details_measure" in indexes
+    assert uri_path("sqlite:///data/products.db") == "data/products.db"
+    assert uri_path("sqlite:////tmp/products.db") == "/tmp/products.db"
+    with pytest.raises(ValueError, match="Unsupported database file: .csv"):
+        repositories.create("products.csv", create_logger)
+    sql.close()
+
+
+def test_registry_loads_third_party_backends_from_entry_points(monkeypatch):
+    # given, a plugin registering a backend for memory:// URIs
+    class EntryPoint:
+        @staticmethod
+        def load():
+            return lambda registry: registry.register("memory", lambda path, create_logger: path,
+                                                      schemes=("memory",))
+
+    groups: list[str] = []
+
+    def entry_points(group: str):
+        groups.append(group)
+        return [EntryPoint()]
+
+    monkeypatch.setattr("importlib.metadata.entry_points", entry_points)
+    registry = RepositoryRegistry()
+    registry.register("jsonl", lambda path, create_logger: "jsonl", extensions=("jsonl",))
+
+    # when
+    known = registry.create("products.jsonl", MockLogger)
+    plugin = registry.create("memory://products", MockLogger)
+
+    # then, entry points are only looked up for targets no registered backend handles
+    assert known == "jsonl"
+    assert plugin == "products"
+    assert groups == [repository_registry.ENTRY_POINT_GROUP]
+    assert registry.names == ["jsonl", "memory"]
+
+
+def test_app_imports_only_the_selected_backend():
+    # given, a fresh interpreter, this one has imported every backend already
+    root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = "\n".join([
+        "import os, sys, tempfile, app",
+        "startup = [m for m in ('openpyxl', 'sqlite3', 'requests', 'bs4') if m in sys.modules]",
+        "settings = app.AppSettings('missing.json')",
+        "path = os.path.join(tempfile.mkdtemp(), 'products.jsonl')",
+        "app.create_repository(settings, path, app.create_logger(settings, 'test')).close()",
+        "print(startup, [m for m in ('openpyxl', 'sqlite3') if m in sys.modules])",
+    ])
+
+    # when
+    result = subprocess.run([sys.executable, "-c", script], cwd=root_dir, capture_output=True, text=True,
+                            check=True)
+
+    # then
+    assert result.stdout.strip().splitlines()[-1] == "[] []"
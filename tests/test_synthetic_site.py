@@ -0,0 +1,26 @@
+import os
+from src.business_logic.ikea_scrapper import IkeaScrapper
+from src.services.rate_limiter import TokenBucket
+from benchmarks.synthetic_site import SyntheticSite
+from mock_logger import MockLogger
+
+
+def test_scrapper_reads_the_whole_synthetic_category(tmpdir):
+    with SyntheticSite(pages=3, per_page=4) as site:
+        scrapper = IkeaScrapper(site.url, MockLogger(), max_workers=2, rate_limiter=TokenBucket(0),
+                                state_file=os.path.join(str(tmpdir), "state.json"))
+        items = list(scrapper.page_items())
+
+    assert scrapper.is_completed
+    assert len(items) == site.total_items
+    assert len({item["id"] for item in items}) == site.total_items
+    assert all(item["details"] == [{"Plotis": "60,0 cm"}, {"Gylis": "37,0 cm"}] for item in items)
+    # Every listing page and every detail page once
+    assert site.requests == site.pages + site.total_items
+
+
+def test_synthetic_site_answers_unknown_pages_with_none():
+    site = SyntheticSite(pages=1, per_page=2)
+    assert site.page("/lt/products/virtuve/item-99900000", "") is None
+    assert site.page("/robots.txt", "") is None
+    assert b"showing_current_max" in site.page("/lt/products/virtuve/virtuves-sistema-metod", "page=1")
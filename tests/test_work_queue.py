@@ -0,0 +1,101 @@
+import os
+import time
+import pytest
+from src.services.work_queue import SqliteWorkQueue
+from mock_logger import MockLogger
+
+
+@pytest.fixture
+def queue_path(tmpdir):
+    return os.path.join(tmpdir, "work_queue.db")
+
+
+def test_each_url_is_queued_once_and_listing_pages_are_leased_first(queue_path):
+    # given
+    queue = SqliteWorkQueue(queue_path, MockLogger())
+    queue.enqueue([("/item-1", {"n": 1}), ("/item-2", None)], kind="detail")
+    queue.enqueue([("/page-1", {"page": 1})], kind="listing")
+
+    # when
+    added = queue.enqueue([("/item-1", {"n": 2}), ("/item-3", None)], kind="detail")
+    first = queue.lease("worker-a", 2)
+    second = queue.lease("worker-b", 10)
+
+    # then
+    assert added == 1
+    assert [(w.url, w.kind, w.payload) for w in first] == [("/page-1", "listing", {"page": 1}),
+                                                           ("/item-1", "detail", {"n": 1})]
+    assert [w.url for w in second] == ["/item-2", "/item-3"]
+    assert queue.counts() == {"pending": 0, "leased": 4, "done": 0, "failed": 0}
+
+
+def test_acked_items_are_done_and_the_queue_drains(queue_path):
+    # given
+    queue = SqliteWorkQueue(queue_path, MockLogger())
+    queue.enqueue([("/item-1", None), ("/item-2", None)], kind="detail")
+    leased = queue.lease("worker-a", 2)
+
+    # when
+    lost = queue.ack(leased[0].id, "worker-b")
+    queue.ack(leased[0].id, "worker-a")
+    queue.ack(leased[1].id, "worker-a")
+
+    # then
+    assert not lost
+    assert queue.is_drained()
+    assert queue.counts()["done"] == 2
+    queue.clear()
+    assert queue.counts()["done"] == 0
+
+
+def test_failed_items_are_retried_until_they_run_out_of_attempts(queue_path):
+    # given
+    queue = SqliteWorkQueue(queue_path, MockLogger(), max_attempts=2, retry_delay=0.05)
+    queue.enqueue([("/item-1", None)], kind="detail")
+
+    # when, the retry waits for its delay
+    queue.fail(queue.lease("worker-a", 1)[0].id, "worker-a", "HTTP 503")
+    too_early = queue.lease("worker-b", 1)
+    time.sleep(0.1)
+    retried = queue.lease("worker-b", 1)
+    queue.fail(retried[0].id, "worker-b", "HTTP 503")
+
+    # then
+    assert too_early == []
+    assert retried[0].attempts == 2
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": 0, "failed": 1}
+    assert queue.failed_items() == [("/item-1", "HTTP 503")]
+
+
+def test_expired_leases_of_a_dead_worker_are_reclaimed(queue_path):
+    # given, a worker that leased an item and never came back
+    dead = SqliteWorkQueue(queue_path, MockLogger(), lease_seconds=0.05)
+    dead.enqueue([("/item-1", None)], kind="detail")
+    dead.lease("dead-worker", 1)
+    dead.close()
+    queue = SqliteWorkQueue(queue_path, MockLogger(), lease_seconds=0.05)
+
+    # when
+    before_expiry = queue.lease("worker-b", 1)
+    time.sleep(0.1)
+    reclaimed = queue.lease("worker-b", 1)
+
+    # then
+    assert before_expiry == []
+    assert [w.url for w in reclaimed] == ["/item-1"]
+    assert not queue.ack(reclaimed[0].id, "dead-worker")
+    assert queue.ack(reclaimed[0].id, "worker-b")
+
+
+def test_released_items_are_leased_again_without_an_attempt(queue_path):
+    # given
+    queue = SqliteWorkQueue(queue_path, MockLogger())
+    queue.enqueue([("/item-1", None)], kind="detail")
+
+    # when
+    queue.release([w.id for w in queue.lease("worker-a", 1)], "worker-a")
+    leased = queue.lease("worker-b", 1)
+
+    # then
+    assert leased[0].attempts == 1
+    assert not queue.is_drained()